@@ -1,18 +1,40 @@
+import logging
 from flask import Flask
 from app.config import Config
+from app.db import db_pool, enable_cooperative_mode
 from app.extensions import socketio, login_manager
 from app.routes.auth import auth
 from app.routes.admin import admin
 from app.routes.faculty import faculty
 from app.routes.student import student
+from app.services.attendance_sessions import attendance_sessions
+from app.services.frame_recorder import frame_recorder
+from app.services.recognition import (recognition_executor, detection_profiles, gallery_cache,
+                                      gallery_warmup, campus_index, start_gallery_listener)
 
 def create_app(config_class=Config):
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
     app.config.from_object(config_class)
 
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger('app').setLevel(app.config['LOG_LEVEL'])
+
     # Initialize extensions
     socketio.init_app(app)
     login_manager.init_app(app)
+    db_pool.init_app(app)
+    if app.config.get('DB_COOPERATIVE'):
+        # Only takes effect under the eventlet worker; a slow query must not freeze live sockets
+        enable_cooperative_mode()
+    # After the wait callback is installed, so the pooled connections are cooperative too
+    db_pool.start(app)
+    recognition_executor.init_app(app)
+    detection_profiles.init_app(app)
+    gallery_cache.init_app(app)
+    gallery_warmup.init_app(app)
+    campus_index.init_app(app)
+    attendance_sessions.init_app(app)
+    frame_recorder.init_app(app)
 
     # Register Blueprints
     app.register_blueprint(auth)
@@ -23,4 +45,11 @@ def create_app(config_class=Config):
     # Import events to register socket handlers
     from app import events
 
+    # Keep this worker's cached galleries in sync with changes made by other workers
+    start_gallery_listener(app)
+    # Preload galleries for today's classes in the background
+    gallery_warmup.start(app)
+    # Load the campus-wide face index in the background
+    campus_index.start(app)
+
     return app
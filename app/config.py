@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,3 +7,56 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
     DATABASE_URL = os.getenv('DATABASE_URL')
+    # Per-frame recognition logs are DEBUG; keep INFO in production
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    # Bearer token for Prometheus scrapes of /metrics; without it only admins can read it
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+    # Pooled database connections per worker (app/db.py)
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+    # Ping connections idle for longer than this before reuse; recycle them after DB_POOL_MAX_LIFETIME
+    DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 30))
+    DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+    # Let queries yield to other green threads under the eventlet worker (psycopg2 wait callback)
+    DB_COOPERATIVE = os.getenv('DB_COOPERATIVE', 'true').lower() == 'true'
+
+    # Recognition process pool (0 workers = run inline on the request thread)
+    RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', 2))
+    RECOGNITION_MAX_PENDING = int(os.getenv('RECOGNITION_MAX_PENDING', 8))
+    RECOGNITION_TIMEOUT = float(os.getenv('RECOGNITION_TIMEOUT', 10))
+    # Memory budget for cached section galleries (LRU-evicted beyond it)
+    GALLERY_CACHE_MB = float(os.getenv('GALLERY_CACHE_MB', 64))
+    # Preload galleries of sections expected to be active when a worker starts
+    GALLERY_WARMUP = os.getenv('GALLERY_WARMUP', 'true').lower() == 'true'
+    GALLERY_WARMUP_MAX_SECTIONS = int(os.getenv('GALLERY_WARMUP_MAX_SECTIONS', 200))
+    # Propagate gallery invalidations to other workers/hosts via Postgres LISTEN/NOTIFY
+    GALLERY_NOTIFY = os.getenv('GALLERY_NOTIFY', 'true').lower() == 'true'
+    # Campus-wide face index over every student and faculty embedding (admin face lookup),
+    # loaded in the background at worker start
+    CAMPUS_INDEX = os.getenv('CAMPUS_INDEX', 'true').lower() == 'true'
+    CAMPUS_INDEX_NPROBE = int(os.getenv('CAMPUS_INDEX_NPROBE', 8))
+    CAMPUS_INDEX_TRAIN_THRESHOLD = int(os.getenv('CAMPUS_INDEX_TRAIN_THRESHOLD', 2048))
+    # Server-side attendance: sightings needed before a student is declared present.
+    # Sessions are per worker, so this needs one worker or sticky sessions.
+    ATTENDANCE_REQUIRED_SIGHTINGS = int(os.getenv('ATTENDANCE_REQUIRED_SIGHTINGS', 3))
+    ATTENDANCE_MAX_DISTANCE = float(os.getenv('ATTENDANCE_MAX_DISTANCE', 0.5))
+    # Cross-session encoding micro-batches (batch size 1 = encode each frame on its own)
+    RECOGNITION_BATCH_SIZE = int(os.getenv('RECOGNITION_BATCH_SIZE', 32))
+    RECOGNITION_BATCH_WAIT_MS = float(os.getenv('RECOGNITION_BATCH_WAIT_MS', 5))
+
+    # Record incoming frames for offline replay (benchmarks/replay_frames.py); off when unset.
+    # Recordings contain student faces.
+    FRAME_RECORD_DIR = os.getenv('FRAME_RECORD_DIR', '')
+    FRAME_RECORD_MAX_MB = float(os.getenv('FRAME_RECORD_MAX_MB', 500))
+
+    # Default detection profile; SECTION_DETECTION_PROFILES overrides it per section as JSON,
+    # e.g. {"A": {"scale": 0.5, "upsample": 2}, "LH1": {"model": "cnn"}}
+    DETECTION_PROFILE = {
+        'scale': float(os.getenv('DETECTION_SCALE', 1.0)),
+        'upsample': int(os.getenv('DETECTION_UPSAMPLE', 1)),
+        'model': os.getenv('DETECTION_MODEL', 'hog'),
+        'num_jitters': int(os.getenv('ENCODING_JITTERS', 1)),
+    }
+    SECTION_DETECTION_PROFILES = json.loads(os.getenv('SECTION_DETECTION_PROFILES', '{}'))
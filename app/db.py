@@ -1,13 +1,32 @@
 import os
+import json
+import logging
+import multiprocessing
+import uuid
+import select
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from app.services.metrics import registry
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Channel for embedding/section membership changes, shared by every worker and host
+GALLERY_CHANNEL = 'gallery_changes'
+# Identifies this process so it can ignore its own notifications
+WORKER_ID = uuid.uuid4().hex
+
 def get_db_connection():
     """
-    Establishes a connection to the PostgreSQL database using DATABASE_URL.
+    Establishes a new, unpooled connection to the PostgreSQL database using DATABASE_URL.
+    Request handlers should use db_connection() instead; this is for connections that
+    live for the whole process (LISTEN) and for the pool itself.
     """
     database_url = os.getenv('DATABASE_URL')
     
@@ -18,5 +37,319 @@ def get_db_connection():
         conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
         return conn
     except psycopg2.Error as err:
-        print(f"Error connecting to PostgreSQL: {err}")
+        logger.error("Error connecting to PostgreSQL: %s", err)
         raise
+
+
+def _eventlet_wait_callback(conn, timeout=None):
+    """
+    psycopg2 wait callback that parks the current green thread on the connection's
+    socket instead of blocking inside libpq, so other green threads keep running
+    while a query is in flight.
+    """
+    from eventlet.hubs import trampoline
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
+def enable_cooperative_mode():
+    """
+    Makes every psycopg2 connection in this process cooperative under eventlet:
+    connects and queries yield to the hub while waiting on the server. Returns False
+    (and changes nothing) when eventlet has not monkey-patched the process.
+    """
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    if not patcher.is_monkey_patched('socket'):
+        return False
+    extensions.set_wait_callback(_eventlet_wait_callback)
+    return True
+
+
+def disable_cooperative_mode():
+    extensions.set_wait_callback(None)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """
+    Raised when no pooled connection became free within the checkout timeout.
+    An OperationalError, so callers that already handle a database being
+    unreachable handle an exhausted pool the same way.
+    """
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections shared by all requests of a worker.
+
+    Keeps at least `minconn` idle connections open and never more than `maxconn` in
+    total. A checkout beyond that waits up to `timeout` seconds for a connection to
+    come back. The wait uses threading.Condition, which the eventlet worker
+    monkey-patches, so a waiting request yields to the hub instead of blocking it.
+    Connections that have been idle for `ping_after` seconds are pinged before
+    reuse. Connections older than `max_lifetime` are closed and replaced, and
+    broken ones are dropped and reopened on the next checkout.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=5.0, ping_after=30.0, max_lifetime=1800.0):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.max_lifetime = max_lifetime
+        self._cond = threading.Condition()
+        self._idle = []            # [(conn, returned_at)], most recently used last
+        self._created_at = {}      # id(conn) -> open time
+        self._size = 0             # open connections, idle or checked out
+        self._waiting = 0
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'created': 0, 'discarded': 0,
+                       'ping_failures': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def init_app(self, app):
+        self.minconn = app.config.get('DB_POOL_MIN', self.minconn)
+        self.maxconn = app.config.get('DB_POOL_MAX', self.maxconn)
+        self.timeout = app.config.get('DB_POOL_TIMEOUT', self.timeout)
+        self.ping_after = app.config.get('DB_POOL_PING_AFTER', self.ping_after)
+        self.max_lifetime = app.config.get('DB_POOL_MAX_LIFETIME', self.max_lifetime)
+
+    def _connect(self):
+        conn = get_db_connection()
+        with self._cond:
+            self._created_at[id(conn)] = time.time()
+            self._stats['created'] += 1
+        return conn
+
+    def _close(self, conn):
+        """Closes a connection that has already been taken out of the pool's accounting."""
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if time.time() - self._created_at.get(id(conn), 0) > self.max_lifetime:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._stats['ping_failures'] += 1
+            return False
+
+    def getconn(self, timeout=None):
+        """Checks out a healthy connection, opening one if the pool has room."""
+        timeout = self.timeout if timeout is None else timeout
+        requested_at = time.time()
+        deadline = requested_at + timeout
+        with self._cond:
+            while not self._idle and self._size >= self.maxconn:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection free after {timeout:.1f}s "
+                                      f"({self._size} open, {self._waiting} waiting)")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            if self._idle:
+                conn, returned_at = self._idle.pop()
+            else:
+                conn, returned_at = None, None
+                self._size += 1  # reserve the slot before connecting outside the lock
+
+        if conn is not None and not self._healthy(conn, time.time() - returned_at):
+            # Reconnect in the same slot
+            self._close(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        waited = time.time() - requested_at
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection; anything left in a transaction is rolled back first."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        with db_pool.connection() as conn: ... checks a connection out for the block.
+        Uncommitted work is rolled back on exit; connections that failed at the
+        connection level are dropped instead of going back to the pool.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def start(self, app):
+        """
+        Opens the `minconn` connections at worker start, so the first requests do not
+        pay for connecting. A database that is down only gets a warning here; requests
+        connect on demand once it is back.
+        """
+        if not app.config.get('DATABASE_URL') or multiprocessing.parent_process() is not None:
+            return
+        try:
+            self.prefill()
+        except psycopg2.Error as e:
+            logger.warning("Could not open the initial database connections: %s", e)
+
+    def prefill(self):
+        """Opens connections until `minconn` are idle."""
+        while True:
+            with self._cond:
+                if len(self._idle) >= self.minconn or self._size >= self.maxconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            return {
+                **{key: value for key, value in self._stats.items() if key not in ('wait_seconds', 'max_wait_seconds')},
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'min': self.minconn,
+                'max': self.maxconn,
+                'avg_wait_ms': round(self._stats['wait_seconds'] * 1000 / checkouts, 2) if checkouts else 0,
+                'max_wait_ms': round(self._stats['max_wait_seconds'] * 1000, 2),
+            }
+
+
+db_pool = ConnectionPool()
+registry.register_collector('db_pool', db_pool.stats)
+
+
+def db_connection():
+    """Context manager yielding a pooled connection: with db_connection() as conn: ..."""
+    return db_pool.connection()
+
+
+def notify_gallery_change(cursor, section_name=None, role='student', member_id=None, action='update'):
+    """
+    Queues a NOTIFY on GALLERY_CHANNEL inside the caller's transaction; Postgres
+    delivers it to every listener only if and when that transaction commits.
+    """
+    payload = json.dumps({
+        'origin': WORKER_ID,
+        'section': section_name,
+        'role': role,
+        'id': member_id,
+        'action': action,
+    })
+    cursor.execute("SELECT pg_notify(%s, %s)", (GALLERY_CHANNEL, payload))
+
+
+def listen(channel, callback, poll_timeout=5.0, retry_delay=5.0, on_connect=None):
+    """
+    Blocks forever, calling callback(payload_dict) for each NOTIFY on channel.
+    Meant to run in a background (green) thread: select() yields to the eventlet
+    hub while waiting. Reconnects after connection failures. Notifications sent
+    while disconnected are lost, so on_connect() is called every time LISTEN is
+    (re)established for the caller to resynchronise.
+    """
+    while True:
+        conn = None
+        try:
+            conn = get_db_connection()
+            conn.set_session(autocommit=True)
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {channel}")
+            cursor.close()
+            logger.info("Listening for notifications on %s", channel)
+            if on_connect is not None:
+                try:
+                    on_connect()
+                except Exception:
+                    logger.exception("Error resynchronising after LISTEN on %s", channel)
+
+            while True:
+                if select.select([conn], [], [], poll_timeout) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        callback(json.loads(notify.payload))
+                    except Exception:
+                        logger.exception("Error handling notification on %s", channel)
+        except Exception as e:
+            logger.warning("Listener on %s failed, reconnecting in %ss: %s", channel, retry_delay, e)
+            time.sleep(retry_delay)
+        finally:
+            if conn is not None:
+                conn.close()
@@ -1,81 +1,214 @@
+import logging
+import time
+from flask import request, session as login_session
 from flask_socketio import emit
 from app.extensions import socketio
-from app.services.recognition import load_known_students
+from app.services.recognition import load_known_students, recognition_executor, detection_profiles, RecognitionBusy
+from app.services.frame_slots import frame_slots
+from app.services.tracker import face_trackers
+from app.services.attendance_sessions import attendance_sessions
+from app.services.frame_recorder import frame_recorder
+from app.services.metrics import observe_stages
 import cv2
 import numpy as np
 import base64
-import face_recognition
+
+logger = logging.getLogger(__name__)
 
 @socketio.on('process_frame')
 def handle_frame(data):
-    image_data = data.get('image')  # Base64-encoded image
+    sid = request.sid
+    try:
+        frame_recorder.record(sid, data)
+    except Exception as e:
+        # Recording is best effort; a bad payload is answered by recognition below
+        logger.warning("Could not record frame: %s", e)
+
+    # Latest frame wins: if this connection already has a frame in flight, just park this one
+    if not frame_slots.offer(sid, dict(data)):
+        return
+
+    released = False
+    try:
+        while True:
+            frame = frame_slots.take(sid)
+            if frame is None:
+                released = True
+                break
+
+            started_at = time.perf_counter()
+            timings = {}
+            try:
+                tracker = face_trackers.get(sid, frame.get('section_name'))
+                session = None
+                # Keyed on who is logged in, not on the faculty_id in the payload
+                faculty_id = login_session.get('id') if login_session.get('role') == 'faculty' else None
+                if faculty_id and frame.get('subject_id'):
+                    session = attendance_sessions.get_or_create(faculty_id, frame['subject_id'],
+                                                                frame.get('section_name'))
+                response = recognize_frame(frame, tracker, session, timings)
+            except Exception as e:
+                # e.g. the gallery could not be loaded; answer this frame and keep the socket alive
+                logger.exception("Error processing frame %s", frame['seq'])
+                response = {'success': False, 'message': f'Error processing frame: {e}'}
+            response['seq'] = frame['seq']
+
+            try:
+                emit_started_at = time.perf_counter()
+                emit('frame_processed', response)
+                timings['emit'] = time.perf_counter() - emit_started_at
+                timings['total'] = time.perf_counter() - started_at
+                observe_stages(timings)
+            finally:
+                frame_slots.mark_processed(sid)
+    finally:
+        if not released:
+            # A slot left marked as running would make every later offer() for this sid return False
+            frame_slots.release(sid)
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    frame_slots.discard(request.sid)
+    face_trackers.discard(request.sid)
+    frame_recorder.discard(request.sid)
+
+
+def frame_buffer(image_data):
+    """
+    Wraps a frame payload as a uint8 array for cv2.imdecode without copying it.
+    Newer clients send the encoded image as a Socket.IO binary attachment; older
+    ones send a 'data:image/jpeg;base64,...' string.
+    """
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(image_data, dtype=np.uint8)
+    if not isinstance(image_data, str):
+        raise ValueError(f"expected an image attachment or data URL, got {type(image_data).__name__}")
+    header, comma, encoded = image_data.partition(",")
+    if not comma:
+        raise ValueError("image string is not a data URL")
+    # binascii.Error is a ValueError
+    return np.frombuffer(base64.b64decode(encoded, validate=True), dtype=np.uint8)
+
+
+def recognize_frame(data, tracker=None, session=None, timings=None):
+    """
+    Runs the recognition pipeline for one 'process_frame' payload and returns the
+    'frame_processed' response body. With a tracker, faces already locked to a
+    student in previous frames are not re-encoded; with an attendance session,
+    sightings are accumulated server-side and recognition stops once the whole
+    roster is present. Per-stage durations (seconds) are written into `timings`.
+    """
+    if timings is None:
+        timings = {}
+    image_data = data.get('image')  # Binary JPEG/WebP attachment or base64 data URL
     section_name = data.get('section_name')
 
-    print(f"Frame received for section: {section_name}")
-    
-    # Load known students for the current section
-    known_face_encodings, known_face_ids = load_known_students(section_name)
-    print(f"Loaded {len(known_face_ids)} known students.")
+    logger.debug("Frame received for section: %s", section_name)
+
+    # Load known students for the current section (cached as one float32 matrix)
+    started_at = time.perf_counter()
+    gallery = load_known_students(section_name)
+    timings['gallery_load'] = time.perf_counter() - started_at
+    logger.debug("Loaded %d known students.", len(gallery))
 
-    known_face_encodings = [np.array(encoding, dtype=np.float64) for encoding in known_face_encodings]
+    if session is not None:
+        if session.roster is None:
+            session.set_roster(gallery.ids)
+        if session.complete:
+            # Everyone is already marked present: skip decoding and recognition entirely
+            return {
+                'success': True,
+                'faces': [],
+                'attendance': session.summary(),
+                'message': 'All students recognized.'
+            }
 
     try:
         # Decode the image
-        image_data = image_data.split(",")[1]
-        image = base64.b64decode(image_data)
-        np_image = np.frombuffer(image, dtype=np.uint8)
-        img = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
-        print(f"Image decoded. Shape: {img.shape}")
+        started_at = time.perf_counter()
+        buffer = frame_buffer(image_data)
+        if isinstance(image_data, str):
+            timings['base64_decode'] = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("unsupported or corrupt image payload")
+        timings['imdecode'] = time.perf_counter() - started_at
+        logger.debug("Image decoded. Shape: %s", img.shape)
+
+        started_at = time.perf_counter()
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB) # Convert to RGB for face_recognition
+        timings['color_convert'] = time.perf_counter() - started_at
     except Exception as e:
-        print(f"Error decoding image: {e}")
-        emit('frame_processed', {'success': False, 'message': f'Error decoding image: {e}'})
-        return
+        logger.warning("Error decoding image: %s", e)
+        return {'success': False, 'message': f'Error decoding image: {e}'}
 
     # If no known face encodings are found, return an empty response
-    if not known_face_encodings:
-        emit('frame_processed', {
+    if len(gallery) == 0:
+        return {
             'success': True,
             'faces': [],
             'message': 'No known students found for this section.'
-        })
-        return
-
-    # Perform facial recognition
-    print("Detecting face locations...")
-    face_locations = face_recognition.face_locations(img)
-    print(f"Found {len(face_locations)} faces. Encoding...")
-    face_encodings = face_recognition.face_encodings(img, face_locations)
-    print("Encoded faces. Comparing...")
+        }
 
-    faces_info = []
+    # Perform facial recognition in the worker pool so the hub keeps serving other sockets
+    # Students still collecting sightings are re-encoded every frame: tracked faces are no evidence
+    skip_boxes = None
+    if tracker:
+        skip_boxes = tracker.skip_boxes(session.present if session is not None else None)
+    try:
+        profile = detection_profiles.get(section_name)
+        face_locations, encoded_idx, face_encodings, pool_timings = recognition_executor.process(
+            img, profile, skip_boxes, tracker.iou_threshold if tracker else 0.5)
+    except RecognitionBusy as e:
+        logger.info("Recognition queue full, dropping frame: %s", e)
+        return {'success': False, 'busy': True, 'message': 'Server busy, frame skipped.'}
+    except Exception as e:
+        logger.exception("Error recognizing faces")
+        return {'success': False, 'message': f'Error recognizing faces: {e}'}
+    pool_timings['pool_round_trip'] = pool_timings.pop('round_trip')
+    timings.update(pool_timings)
+    logger.debug("Found %d faces (%d encoded) in %.0f ms.", len(face_locations), len(encoded_idx),
+                 timings['pool_round_trip'] * 1000)
 
-    for face_encoding, face_location in zip(face_encodings, face_locations):
-        matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-        face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
+    # Match every encoded face in the frame against the gallery with a single matrix multiply
+    started_at = time.perf_counter()
+    encoded_matches = dict(zip(encoded_idx, gallery.match(face_encodings)))
+    if tracker:
+        matches = tracker.update(face_locations, encoded_matches)
+    else:
+        matches = [encoded_matches[index] + (False,) for index in range(len(face_locations))]
+    timings['match'] = time.perf_counter() - started_at
 
-        student_id = "Unknown"
+    faces_info = []
 
-        # If a match is found, get the student ID
-        if True in matches:
-            best_match_index = np.argmin(face_distances)
-            if matches[best_match_index]:
-                student_id = known_face_ids[best_match_index]
-            print(f'{student_id} found')
+    for face_location, (student_id, distance, margin, tracked) in zip(face_locations, matches):
+        if student_id != "Unknown":
+            logger.debug("%s found", student_id)
 
         # Append face location and student ID to results
         faces_info.append({
             "location": face_location,  # [top, right, bottom, left]
-            "student_id": student_id
+            "student_id": student_id,
+            "distance": distance,
+            "margin": margin,
+            "tracked": tracked
         })
-        
-    print("Frame processing complete. Sending response.")
-    emit('frame_processed', {
+
+    response = {
         'success': True,
         'faces': faces_info,
         'processed_width': data.get('width'),
         'processed_height': data.get('height')
-    })
+    }
+    if session is not None:
+        session.record(faces_info)
+        response['attendance'] = session.summary()
+
+    logger.debug("Frame processing complete.")
+    return response
 
 def emit_attendance_update(data):
     """
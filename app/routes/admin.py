@@ -1,19 +1,25 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, session
+from flask import (Blueprint, render_template, request, jsonify, flash, redirect, url_for, session, Response,
+                   current_app)
 from flask_login import login_required, current_user
-from app.db import get_db_connection
+from app.db import db_connection, db_pool, notify_gallery_change
 from app.decorators import admin_required
 from app.forms import CreateSectionForm
 from werkzeug.security import generate_password_hash
 import re
 import os
+import hmac
 import cv2
 import base64
-import pickle
 import numpy as np
 import face_recognition
 from PIL import Image
 from io import BytesIO
-from app.services.recognition import clear_cache
+from app.services.recognition import (clear_cache, recognition_executor, gallery_cache,
+                                      gallery_loads, gallery_warmup, campus_index, RecognitionBusy)
+from app.services.embedding_format import encode_embedding
+from app.services.frame_slots import frame_slots
+from app.services.attendance_sessions import attendance_sessions
+from app.services.metrics import registry as metrics_registry
 
 admin = Blueprint('admin', __name__)
 UPLOAD_FOLDER = 'Faces' # Should be in config or consistent path. Ideally app/static/Faces? or just Faces in root. 
@@ -24,14 +30,13 @@ UPLOAD_FOLDER = 'Faces' # Should be in config or consistent path. Ideally app/st
 @login_required
 @admin_required
 def manage_faculty():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT faculty_id, name, email FROM faculty")
-        faculty_data = cursor.fetchall()
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT faculty_id, name, email FROM faculty")
+            faculty_data = cursor.fetchall()
+        finally:
+            cursor.close()
 
     faculty_list = []
     for faculty in faculty_data:
@@ -46,14 +51,13 @@ def manage_faculty():
 
 @admin.route('/fetch-faculty', methods=['GET'])
 def fetch_faculty():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT faculty_id, name, email FROM faculty")
-        faculty_data = cursor.fetchall()
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT faculty_id, name, email FROM faculty")
+            faculty_data = cursor.fetchall()
+        finally:
+            cursor.close()
 
     faculty_list = []
     for faculty in faculty_data:
@@ -84,33 +88,33 @@ def add_faculty():
 
     hashed_password = generate_password_hash(password)
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO faculty (faculty_id, name, email, password_hash) VALUES (%s, %s, %s, %s)",
-                       (faculty_id, full_name, email, hashed_password))
-        conn.commit()
-        return jsonify({'success': True})
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO faculty (faculty_id, name, email, password_hash) VALUES (%s, %s, %s, %s)",
+                           (faculty_id, full_name, email, hashed_password))
+            conn.commit()
+            return jsonify({'success': True})
+        except Exception as e:
+            return jsonify({'success': False, 'message': str(e)})
+        finally:
+            cursor.close()
 
 
 @admin.route('/delete-faculty/<faculty_id>', methods=['DELETE'])
 def delete_faculty(faculty_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("DELETE FROM faculty WHERE faculty_id = %s", [faculty_id])
-        conn.commit()
-        return jsonify({'success': True})
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM faculty WHERE faculty_id = %s", [faculty_id])
+            notify_gallery_change(cursor, None, 'faculty', faculty_id, 'delete')
+            conn.commit()
+            campus_index.remove(('faculty', faculty_id))
+            return jsonify({'success': True})
+        except Exception as e:
+            return jsonify({'success': False, 'message': str(e)})
+        finally:
+            cursor.close()
 
 
 @admin.route('/update-faculty', methods=['POST'])
@@ -127,21 +131,20 @@ def update_faculty():
         
         # Not updating ID or password here for simplicity
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute("""
-                UPDATE faculty 
-                SET name = %s, email = %s
-                WHERE faculty_id = %s
-            """, (full_name, email, original_faculty_id))
-            conn.commit()
+            try:
+                cursor.execute("""
+                    UPDATE faculty 
+                    SET name = %s, email = %s
+                    WHERE faculty_id = %s
+                """, (full_name, email, original_faculty_id))
+                conn.commit()
             
-            return jsonify({'success': True, 'message': 'Faculty updated successfully!'})
-        finally:
-            cursor.close()
-            conn.close()
+                return jsonify({'success': True, 'message': 'Faculty updated successfully!'})
+            finally:
+                cursor.close()
 
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -170,23 +173,22 @@ def add_subject():
         if not subject_name:
             return jsonify({'success': False, 'message': 'Subject name is required!'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        try:
-            cursor.execute("SELECT subject_name FROM subjects WHERE subject_name = %s", (subject_name,))
-            existing_subject = cursor.fetchone()
-            if existing_subject:
-                return jsonify({'success': False, 'message': 'Subject already exists!'}), 400
+            try:
+                cursor.execute("SELECT subject_name FROM subjects WHERE subject_name = %s", (subject_name,))
+                existing_subject = cursor.fetchone()
+                if existing_subject:
+                    return jsonify({'success': False, 'message': 'Subject already exists!'}), 400
 
-            cursor.execute("INSERT INTO subjects (subject_name) VALUES (%s)", (subject_name,))
-            conn.commit()
+                cursor.execute("INSERT INTO subjects (subject_name) VALUES (%s)", (subject_name,))
+                conn.commit()
 
-            return jsonify({'success': True, 'message': 'Subject added successfully!'})
+                return jsonify({'success': True, 'message': 'Subject added successfully!'})
 
-        finally:
-            cursor.close()
-            conn.close()
+            finally:
+                cursor.close()
 
     except Exception as err:
         return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
@@ -199,14 +201,13 @@ def fetch_subjects():
         return jsonify({'success': False, 'message': 'Unauthorized access!'}), 403
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT subject_id, subject_name FROM subjects")
-            subjects = cursor.fetchall()
-        finally:
-            cursor.close()
-            conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT subject_id, subject_name FROM subjects")
+                subjects = cursor.fetchall()
+            finally:
+                cursor.close()
 
         return jsonify({'success': True, 'subjects': subjects})
 
@@ -221,16 +222,15 @@ def delete_subject(subject_id):
         return jsonify({'success': False, 'message': 'Unauthorized access!'}), 403
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        try:
-            cursor.execute("DELETE FROM subjects WHERE subject_id = %s", (subject_id,))
-            conn.commit()
-            return jsonify({'success': True, 'message': 'Subject deleted successfully!'})
-        finally:
-            cursor.close()
-            conn.close()
+            try:
+                cursor.execute("DELETE FROM subjects WHERE subject_id = %s", (subject_id,))
+                conn.commit()
+                return jsonify({'success': True, 'message': 'Subject deleted successfully!'})
+            finally:
+                cursor.close()
     
     except Exception as err:
         return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
@@ -244,28 +244,27 @@ def manage_sections():
         return redirect(url_for('auth.dashboard'))
 
     form = CreateSectionForm()
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute("SELECT section_name FROM sections")
-        sections = cursor.fetchall()
-
-        if form.validate_on_submit():
-            section_name = form.section_name.data
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-            cursor.execute("SELECT section_name FROM sections WHERE section_name = %s", (section_name,))
-            existing_section = cursor.fetchone()
-            if existing_section:
-                flash('Section already exists!', 'danger')
-            else:
-                cursor.execute("INSERT INTO sections (section_name) VALUES (%s)", (section_name,))
-                conn.commit()
-                flash('Section created successfully!', 'success')
-                return redirect(url_for('admin.manage_sections'))
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            cursor.execute("SELECT section_name FROM sections")
+            sections = cursor.fetchall()
+
+            if form.validate_on_submit():
+                section_name = form.section_name.data
+
+                cursor.execute("SELECT section_name FROM sections WHERE section_name = %s", (section_name,))
+                existing_section = cursor.fetchone()
+                if existing_section:
+                    flash('Section already exists!', 'danger')
+                else:
+                    cursor.execute("INSERT INTO sections (section_name) VALUES (%s)", (section_name,))
+                    conn.commit()
+                    flash('Section created successfully!', 'success')
+                    return redirect(url_for('admin.manage_sections'))
+        finally:
+            cursor.close()
     return render_template('manage_sections.html', form=form, sections=sections)
 
 
@@ -282,21 +281,20 @@ def add_section():
         if not section_name:
             return jsonify({'success': False, 'message': 'Section name is required!'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        try:
-            cursor.execute("SELECT section_name FROM sections WHERE section_name = %s", (section_name,))
-            existing_section = cursor.fetchone()
-            if existing_section:
-                return jsonify({'success': False, 'message': 'Section already exists!'}), 400
+            try:
+                cursor.execute("SELECT section_name FROM sections WHERE section_name = %s", (section_name,))
+                existing_section = cursor.fetchone()
+                if existing_section:
+                    return jsonify({'success': False, 'message': 'Section already exists!'}), 400
 
-            cursor.execute("INSERT INTO sections (section_name) VALUES (%s)", (section_name,))
-            conn.commit()
-            return jsonify({'success': True, 'message': 'Section added successfully!'})
-        finally:
-            cursor.close()
-            conn.close()
+                cursor.execute("INSERT INTO sections (section_name) VALUES (%s)", (section_name,))
+                conn.commit()
+                return jsonify({'success': True, 'message': 'Section added successfully!'})
+            finally:
+                cursor.close()
 
     except Exception as err:
         return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
@@ -309,17 +307,16 @@ def delete_section(section_name):
         return jsonify({'success': False, 'message': 'Unauthorized access!'}), 403
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        try:
-            cursor.execute("DELETE FROM sections WHERE section_name = %s", (section_name,))
-            conn.commit()
-            flash('Section deleted successfully!', 'success')
-            return redirect(url_for('admin.manage_sections'))
-        finally:
-            cursor.close()
-            conn.close()
+            try:
+                cursor.execute("DELETE FROM sections WHERE section_name = %s", (section_name,))
+                conn.commit()
+                flash('Section deleted successfully!', 'success')
+                return redirect(url_for('admin.manage_sections'))
+            finally:
+                cursor.close()
 
     except Exception as err:
         flash(f'Error deleting section: {err}', 'danger')
@@ -339,14 +336,13 @@ def manage_students():
 @admin.route('/fetch-students', methods=['GET'])
 def fetch_students():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT name, roll_number, email, section_name FROM students")
-            students = cursor.fetchall()
-        finally:
-            cursor.close()
-            conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT name, roll_number, email, section_name FROM students")
+                students = cursor.fetchall()
+            finally:
+                cursor.close()
 
         return jsonify({"success": True, "students": students})
 
@@ -358,19 +354,23 @@ def fetch_students():
 @admin.route('/delete-student/<roll_number>', methods=['DELETE'])
 def delete_student(roll_number):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("DELETE FROM students WHERE roll_number = %s", (roll_number,))
-            conn.commit()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("DELETE FROM students WHERE roll_number = %s RETURNING section_name", (roll_number,))
+                deleted = cursor.fetchone()
+                if deleted:
+                    notify_gallery_change(cursor, deleted['section_name'], 'student', roll_number, 'delete')
+                conn.commit()
             
-            # Invalidate all cache for simplicity
-            clear_cache()
+                # Invalidate only the section the student belonged to
+                if deleted and deleted['section_name']:
+                    clear_cache(deleted['section_name'])
+                campus_index.remove(('student', roll_number))
 
-            return jsonify({"success": True, "message": "Student deleted successfully"})
-        finally:
-            cursor.close()
-            conn.close()
+                return jsonify({"success": True, "message": "Student deleted successfully"})
+            finally:
+                cursor.close()
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)})
@@ -391,24 +391,31 @@ def update_student():
         
         # We are not updating roll number or photo for now as per request/complexity
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute("""
-                UPDATE students 
-                SET name = %s, email = %s, section_name = %s
-                WHERE roll_number = %s
-            """, (full_name, email, section_name, original_roll_number))
-            conn.commit()
+            try:
+                cursor.execute("SELECT section_name FROM students WHERE roll_number = %s FOR UPDATE", (original_roll_number,))
+                previous = cursor.fetchone()
+                cursor.execute("""
+                    UPDATE students 
+                    SET name = %s, email = %s, section_name = %s
+                    WHERE roll_number = %s
+                """, (full_name, email, section_name, original_roll_number))
+                notify_gallery_change(cursor, section_name, 'student', original_roll_number)
+                if previous and previous['section_name'] and previous['section_name'] != section_name:
+                    notify_gallery_change(cursor, previous['section_name'], 'student', original_roll_number)
+                conn.commit()
             
-            # Invalidate cache
-            clear_cache(section_name)
+                # Invalidate cache for the old and the new section
+                clear_cache(section_name)
+                if previous and previous['section_name'] and previous['section_name'] != section_name:
+                    clear_cache(previous['section_name'])
+                campus_index.move(('student', original_roll_number), section_name)
             
-            return jsonify({'success': True, 'message': 'Student updated successfully!'})
-        finally:
-            cursor.close()
-            conn.close()
+                return jsonify({'success': True, 'message': 'Student updated successfully!'})
+            finally:
+                cursor.close()
 
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -476,7 +483,7 @@ def add_student():
                         encodings = np.array(encodings, dtype=np.float64)
                         if len(encodings) > 0:
                             encode = encodings[0]
-                            encoding_blob = pickle.dumps(encode)
+                            encoding_blob = encode_embedding(encode)
                         else:
                             if image_path and os.path.exists(image_path): os.remove(image_path)
                             if cropped_image_path and os.path.exists(cropped_image_path): os.remove(cropped_image_path)
@@ -485,27 +492,28 @@ def add_student():
                         print(f"Error encoding face: {e}")
                         if image_path and os.path.exists(image_path): os.remove(image_path)
                         if cropped_image_path and os.path.exists(cropped_image_path): os.remove(cropped_image_path)
-            except:
-                pass
-            return jsonify({"success": False, "message": f"Error processing image: {str(e)}"}), 400
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            query = """
-                    INSERT INTO students (name, roll_number, email, password_hash, section_name, facial_embedding)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """
-            cursor.execute(query, (full_name, roll_number, email, hashed_password, section_name, encoding_blob))
-            conn.commit()
+            except Exception as e:
+                return jsonify({"success": False, "message": f"Error processing image: {str(e)}"}), 400
+
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                query = """
+                        INSERT INTO students (name, roll_number, email, password_hash, section_name, facial_embedding)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        """
+                cursor.execute(query, (full_name, roll_number, email, hashed_password, section_name, encoding_blob))
+                notify_gallery_change(cursor, section_name, 'student', roll_number, 'insert')
+                conn.commit()
             
-            # Invalidate cache for this section
-            clear_cache(section_name)
+                # Invalidate cache for this section
+                clear_cache(section_name)
+                if encoding_blob:
+                    campus_index.upsert(('student', roll_number), encode, section_name)
 
-            return jsonify({"success": True, "message": "Student added successfully!"})
-        finally:
-            cursor.close()
-            conn.close()
+                return jsonify({"success": True, "message": "Student added successfully!"})
+            finally:
+                cursor.close()
 
     except Exception as e: 
         print(f"General Error: {e}")
@@ -518,12 +526,11 @@ def fetch_sections():
         return jsonify({'success': False, 'message': 'Unauthorized access!'}), 403
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT section_name FROM sections")
-        sections = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT section_name FROM sections")
+            sections = cursor.fetchall()
+            cursor.close()
 
         return jsonify({'success': True, 'sections': sections})
 
@@ -535,31 +542,30 @@ def fetch_sections():
 def fetch_section_details():
     section_name = request.args.get('section_name')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Fetch subjects and faculty for the section
+            cursor.execute("""
+                           SELECT s.subject_id, s.subject_name, f.name AS faculty_name
+                           FROM faculty_subjects fs
+                                    JOIN subjects s ON fs.subject_id = s.subject_id
+                                    JOIN faculty f ON fs.faculty_id = f.faculty_id
+                           WHERE fs.section_name = %s
+                           """, (section_name,))
+            subjects = cursor.fetchall()
 
-    try:
-        # Fetch subjects and faculty for the section
-        cursor.execute("""
-                       SELECT s.subject_id, s.subject_name, f.name AS faculty_name
-                       FROM faculty_subjects fs
-                                JOIN subjects s ON fs.subject_id = s.subject_id
-                                JOIN faculty f ON fs.faculty_id = f.faculty_id
-                       WHERE fs.section_name = %s
-                       """, (section_name,))
-        subjects = cursor.fetchall()
-
-        # Fetch available subjects
-        cursor.execute("SELECT subject_id, subject_name FROM subjects")
-        available_subjects = cursor.fetchall()
-
-        # Fetch available faculty
-        cursor.execute("SELECT faculty_id, name FROM faculty")
-        available_faculty = cursor.fetchall()
-
-    finally:
-        cursor.close()
-        conn.close()
+            # Fetch available subjects
+            cursor.execute("SELECT subject_id, subject_name FROM subjects")
+            available_subjects = cursor.fetchall()
+
+            # Fetch available faculty
+            cursor.execute("SELECT faculty_id, name FROM faculty")
+            available_faculty = cursor.fetchall()
+
+        finally:
+            cursor.close()
 
     return jsonify({
         'success': True,
@@ -576,21 +582,20 @@ def assign_subject():
     subject_id = data.get('subject_id')
     faculty_id = data.get('faculty_id')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        cursor.execute("""
-                       INSERT INTO faculty_subjects (faculty_id, subject_id, section_name)
-                       VALUES (%s, %s, %s)
-                       """, (faculty_id, subject_id, section_name))
-        conn.commit()
-        return jsonify({'success': True})
-    except Exception as err:
-        return jsonify({'success': False, 'message': str(err)})
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            cursor.execute("""
+                           INSERT INTO faculty_subjects (faculty_id, subject_id, section_name)
+                           VALUES (%s, %s, %s)
+                           """, (faculty_id, subject_id, section_name))
+            conn.commit()
+            return jsonify({'success': True})
+        except Exception as err:
+            return jsonify({'success': False, 'message': str(err)})
+        finally:
+            cursor.close()
 
 @admin.route('/remove-subject', methods=['POST'])
 @login_required
@@ -599,58 +604,131 @@ def remove_subject():
     section_name = data.get('section_name')
     subject_id = data.get('subject_id')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        cursor.execute("""
-                       DELETE
-                       FROM faculty_subjects
-                       WHERE section_name = %s
-                         AND subject_id = %s
-                       """, (section_name, subject_id))
-        conn.commit()
-        return jsonify({'success': True})
-    except Exception as err:
-        return jsonify({'success': False, 'message': str(err)})
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            cursor.execute("""
+                           DELETE
+                           FROM faculty_subjects
+                           WHERE section_name = %s
+                             AND subject_id = %s
+                           """, (section_name, subject_id))
+            conn.commit()
+            return jsonify({'success': True})
+        except Exception as err:
+            return jsonify({'success': False, 'message': str(err)})
+        finally:
+            cursor.close()
 
 @admin.route('/api/dashboard-stats')
 @login_required
 def dashboard_stats():
     """Returns live stats for the admin dashboard."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) AS count FROM students")
+            total_students = cursor.fetchone()['count']
+
+            cursor.execute("SELECT COUNT(*) AS count FROM faculty")
+            total_faculty = cursor.fetchone()['count']
+
+            cursor.execute("SELECT COUNT(*) AS count FROM attendance WHERE date = CURRENT_DATE")
+            today_records = cursor.fetchone()['count']
+
+            cursor.execute("""
+                SELECT AVG(CASE WHEN status = 'Present' THEN 100 ELSE 0 END) AS pct
+                FROM attendance WHERE date = CURRENT_DATE
+            """)
+            row = cursor.fetchone()
+            today_percentage = round(float(row['pct']), 1) if row and row['pct'] is not None else 0
+
+            return jsonify({
+                'total_students': total_students,
+                'total_faculty': total_faculty,
+                'today_records': today_records,
+                'today_percentage': today_percentage
+            })
+        except Exception as err:
+            return jsonify({'error': str(err)}), 500
+        finally:
+            cursor.close()
+
+@admin.route('/api/recognition-stats')
+@login_required
+@admin_required
+def recognition_stats():
+    """Returns queue depth, per-stage timings and frame drop counters for live recognition."""
+    return jsonify({
+        'executor': recognition_executor.stats(),
+        'frames': frame_slots.stats(),
+        'gallery_cache': gallery_cache.stats(),
+        'gallery_loads': gallery_loads.stats(),
+        'warmup': gallery_warmup.status(),
+        'campus_index': campus_index.stats(),
+        'attendance_sessions': attendance_sessions.stats()
+    })
+
+
+@admin.route('/api/db-pool-stats')
+@login_required
+@admin_required
+def db_pool_stats():
+    """Returns database connection pool usage: open/idle/in-use connections, waits and timeouts."""
+    return jsonify(db_pool.stats())
+
+
+@admin.route('/metrics')
+def metrics():
+    """
+    Recognition histograms and counters in Prometheus text exposition format.
+    Scrapers send `Authorization: Bearer <METRICS_TOKEN>`; otherwise only a logged-in
+    admin can read it.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not scraper and not (current_user.is_authenticated and session.get('role') == 'admin'):
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@admin.route('/api/identify-face', methods=['POST'])
+@login_required
+@admin_required
+def identify_face():
+    """
+    Looks the faces in a photo up across the whole campus (campus index), e.g. for
+    kiosk check-in or finding a student outside their section. Takes {image: data
+    URL, k} and returns the k closest students/faculty per detected face.
+    """
+    if not campus_index.built:
+        return jsonify({'success': False, 'message': 'Campus index is still loading'}), 503
+    data = request.get_json(silent=True) or {}
     try:
-        cursor.execute("SELECT COUNT(*) AS count FROM students")
-        total_students = cursor.fetchone()['count']
-
-        cursor.execute("SELECT COUNT(*) AS count FROM faculty")
-        total_faculty = cursor.fetchone()['count']
-
-        cursor.execute("SELECT COUNT(*) AS count FROM attendance WHERE date = CURRENT_DATE")
-        today_records = cursor.fetchone()['count']
-
-        cursor.execute("""
-            SELECT AVG(CASE WHEN status = 'Present' THEN 100 ELSE 0 END) AS pct
-            FROM attendance WHERE date = CURRENT_DATE
-        """)
-        row = cursor.fetchone()
-        today_percentage = round(float(row['pct']), 1) if row and row['pct'] is not None else 0
-
-        return jsonify({
-            'total_students': total_students,
-            'total_faculty': total_faculty,
-            'today_records': today_records,
-            'today_percentage': today_percentage
-        })
-    except Exception as err:
-        return jsonify({'error': str(err)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+        k = max(1, min(int(data.get('k', 5)), 50))
+        image = base64.b64decode(data['image'].split(",", 1)[-1])
+        img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return jsonify({'success': False, 'message': 'Invalid image'}), 400
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    except (KeyError, AttributeError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Invalid request: {e}'}), 400
+
+    try:
+        face_locations, encoded_idx, face_encodings, _ = recognition_executor.process(img)
+    except RecognitionBusy:
+        return jsonify({'success': False, 'message': 'Recognition is busy, try again'}), 503
+    faces = [{'location': face_locations[index], 'matches': campus_index.search(encoding, k)}
+             for index, encoding in zip(encoded_idx, face_encodings)]
+    return jsonify({'success': True, 'faces': faces})
+
+
+@admin.route('/api/recognition-ready')
+def recognition_ready():
+    """Readiness probe: 200 once gallery warm-up has finished, 503 before."""
+    status = gallery_warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
 
 @admin.route('/admin-analytics')
 def analytics_page():
@@ -663,60 +741,60 @@ def analytics_page():
 def get_subject_attendance():
     section_name = request.args.get('section')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        # Fetch subject-wise average attendance for the given section
-        cursor.execute("""
-            SELECT s.subject_name, AVG(CASE WHEN a.status = 'Present' THEN 100 ELSE 0 END) AS attendance_percentage
-            FROM attendance a
-            JOIN subjects s ON a.subject_id = s.subject_id
-            JOIN students st ON a.roll_number = st.roll_number
-            WHERE st.section_name = %s
-            GROUP BY s.subject_name
-        """, (section_name,))
-        subject_attendance = cursor.fetchall()
-
-        # Prepare data for the chart
-        return jsonify(subject_attendance)
-    except Exception as err:
-        return jsonify({
-            'success': False,
-            'message': f'Database error: {err}'
-        })
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            # Subject-wise attendance for the given section, from the running totals
+            cursor.execute("""
+                SELECT s.subject_name, SUM(sm.present_classes) * 100.0 / SUM(sm.total_classes) AS attendance_percentage
+                FROM attendance_summary sm
+                JOIN subjects s ON sm.subject_id = s.subject_id
+                JOIN students st ON sm.roll_number = st.roll_number
+                WHERE st.section_name = %s
+                GROUP BY s.subject_name
+                HAVING SUM(sm.total_classes) > 0
+            """, (section_name,))
+            subject_attendance = cursor.fetchall()
+
+            # Prepare data for the chart
+            return jsonify(subject_attendance)
+        except Exception as err:
+            return jsonify({
+                'success': False,
+                'message': f'Database error: {err}'
+            })
+        finally:
+            cursor.close()
 
 
 @admin.route('/api/analytics')
 def analytics():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        # Fetch attendance overview data (monthly attendance percentages)
-        cursor.execute("""
-            SELECT TO_CHAR(date, 'YYYY-MM') AS month, AVG(CASE WHEN status = 'Present' THEN 100 ELSE 0 END) AS attendance_percentage
-            FROM attendance
-            GROUP BY TO_CHAR(date, 'YYYY-MM')
-            ORDER BY month
-        """)
-        attendance_overview = cursor.fetchall()
-
-        # Fetch section-wise attendance data
-        cursor.execute("""
-            SELECT s.section_name, AVG(CASE WHEN a.status = 'Present' THEN 100 ELSE 0 END) AS attendance_percentage
-            FROM attendance a
-            JOIN students s ON a.roll_number = s.roll_number
-            GROUP BY s.section_name
-        """)
-        section_attendance = cursor.fetchall()
-
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            # Monthly percentages need the dates, so this one still scans attendance
+            cursor.execute("""
+                SELECT TO_CHAR(date, 'YYYY-MM') AS month, AVG(CASE WHEN status = 'Present' THEN 100 ELSE 0 END) AS attendance_percentage
+                FROM attendance
+                GROUP BY TO_CHAR(date, 'YYYY-MM')
+                ORDER BY month
+            """)
+            attendance_overview = cursor.fetchall()
+
+            # Fetch section-wise attendance data
+            cursor.execute("""
+                SELECT s.section_name, SUM(sm.present_classes) * 100.0 / SUM(sm.total_classes) AS attendance_percentage
+                FROM attendance_summary sm
+                JOIN students s ON sm.roll_number = s.roll_number
+                GROUP BY s.section_name
+                HAVING SUM(sm.total_classes) > 0
+            """)
+            section_attendance = cursor.fetchall()
+
+        finally:
+            cursor.close()
 
     # Format data for the frontend
     data = {
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, session, request
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import check_password_hash
-from app.db import get_db_connection
+from app.db import db_connection
 from app.models import User
 from app.forms import LoginForm
 
@@ -23,46 +23,44 @@ def login():
         password = form.password.data
         role = form.role.data
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        user = None
-
-        try:
-            # Check if user is a student
-            if role == 'student':
-                cursor.execute("SELECT roll_number, name, password_hash, facial_embedding FROM students WHERE roll_number = %s", (username,))
-                student = cursor.fetchone()
-                if student and check_password_hash(student['password_hash'], password):
-                    user = User(student['roll_number'], 'student', student['name'])
-                    # Check if facial embedding exists
-                    if student.get('facial_embedding') is None:
-                        session['require_face_registration'] = True
-                    else:
-                        session['require_face_registration'] = False
-
-            # Check if user is faculty
-            elif role == 'faculty':
-                cursor.execute("SELECT faculty_id, name, password_hash FROM faculty WHERE faculty_id = %s", (username,))
-                faculty = cursor.fetchone()
-                if faculty and check_password_hash(faculty['password_hash'], password):
-                    user = User(faculty['faculty_id'], 'faculty', faculty['name'])
-
-            # Check if user is admin
-            elif role == 'admin':
-                cursor.execute("SELECT admin_id, username, password_hash FROM admin WHERE admin_id = %s", (username,))
-                admin = cursor.fetchone()
-                if admin and check_password_hash(admin['password_hash'], password):
-                    user = User(admin['admin_id'], 'admin', admin['username'])
-
-        except Exception as e:
-            print(f"Login error: {e}")
-            flash('An error occurred during login.', 'danger')
-            return render_template('login.html', form=form)
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            user = None
+
+            try:
+                # Check if user is a student
+                if role == 'student':
+                    cursor.execute("SELECT roll_number, name, password_hash, facial_embedding FROM students WHERE roll_number = %s", (username,))
+                    student = cursor.fetchone()
+                    if student and check_password_hash(student['password_hash'], password):
+                        user = User(student['roll_number'], 'student', student['name'])
+                        # Check if facial embedding exists
+                        if student.get('facial_embedding') is None:
+                            session['require_face_registration'] = True
+                        else:
+                            session['require_face_registration'] = False
+
+                # Check if user is faculty
+                elif role == 'faculty':
+                    cursor.execute("SELECT faculty_id, name, password_hash FROM faculty WHERE faculty_id = %s", (username,))
+                    faculty = cursor.fetchone()
+                    if faculty and check_password_hash(faculty['password_hash'], password):
+                        user = User(faculty['faculty_id'], 'faculty', faculty['name'])
+
+                # Check if user is admin
+                elif role == 'admin':
+                    cursor.execute("SELECT admin_id, username, password_hash FROM admin WHERE admin_id = %s", (username,))
+                    admin = cursor.fetchone()
+                    if admin and check_password_hash(admin['password_hash'], password):
+                        user = User(admin['admin_id'], 'admin', admin['username'])
+
+            except Exception as e:
+                print(f"Login error: {e}")
+                flash('An error occurred during login.', 'danger')
+                return render_template('login.html', form=form)
+            finally:
+                if cursor:
+                    cursor.close()
 
         if user:
             login_user(user)
@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, jsonify, session
 from flask_login import login_required
-from app.db import get_db_connection
+from app.db import db_connection
 from app.decorators import faculty_required
 from app.events import emit_attendance_update
+from app.services.attendance_sessions import attendance_sessions
+from app.services.attendance_store import (write_attendance, claim_submission, save_submission_response,
+                                          section_report, attendance_history)
 
 faculty = Blueprint('faculty', __name__)
 
@@ -11,31 +14,30 @@ faculty = Blueprint('faculty', __name__)
 def fetch_faculty_classes():
     faculty_id = session.get('id')  # Get the logged-in faculty's ID from the session
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Fetch the faculty's assigned classes (subject-section combinations)
-        cursor.execute("""
-                       SELECT s.subject_id, s.subject_name, fs.section_name
-                       FROM faculty_subjects fs
-                                JOIN subjects s ON fs.subject_id = s.subject_id
-                       WHERE fs.faculty_id = %s
-                       """, (faculty_id,))
-        classes = cursor.fetchall()
-
-        return jsonify({
-            'success': True,
-            'classes': classes,
-        })
-    except Exception as err:
-        return jsonify({
-            'success': False,
-            'message': f'Database error: {err}',
-        })
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Fetch the faculty's assigned classes (subject-section combinations)
+            cursor.execute("""
+                           SELECT s.subject_id, s.subject_name, fs.section_name
+                           FROM faculty_subjects fs
+                                    JOIN subjects s ON fs.subject_id = s.subject_id
+                           WHERE fs.faculty_id = %s
+                           """, (faculty_id,))
+            classes = cursor.fetchall()
+
+            return jsonify({
+                'success': True,
+                'classes': classes,
+            })
+        except Exception as err:
+            return jsonify({
+                'success': False,
+                'message': f'Database error: {err}',
+            })
+        finally:
+            cursor.close()
 
 
 @faculty.route('/analytics-dashboard')
@@ -56,18 +58,17 @@ def mark_attendance():
     print('for mark-attendance', faculty_id, subject_id, section_name)
 
     # Fetch students enrolled in the current class
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-                       SELECT s.roll_number, s.name, s.facial_embedding
-                       FROM students s
-                       WHERE section_name = %s
-                       """, (section_name,))
-        students = cursor.fetchall()
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                           SELECT s.roll_number, s.name, s.facial_embedding
+                           FROM students s
+                           WHERE section_name = %s
+                           """, (section_name,))
+            students = cursor.fetchall()
+        finally:
+            cursor.close()
 
     return render_template('mark_attendance.html', username=session.get('name'), students=students, faculty_id=faculty_id, subject_id=subject_id,
                            section_name=section_name)
@@ -79,49 +80,63 @@ def submit_attendance():
     faculty_id = data.get('faculty_id')
     subject_id = data.get('subject_id')
     section_name = data.get('section_name')
-    present_students = data.get('present_students')
-    absent_students = data.get('absent_students')
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Insert attendance records into the database
-        for student_id in present_students:
-            cursor.execute("""
-                INSERT INTO attendance (roll_number, subject_id, date, status, faculty_id)
-                VALUES (%s, %s, CURRENT_DATE, 'Present', %s)
-            """, (student_id, subject_id, faculty_id))
-
-        for student_id in absent_students:
+    present_students = data.get('present_students') or []
+    absent_students = data.get('absent_students') or []
+    # Generated once per page by the client, so double-clicks and retries are applied once
+    idempotency_key = data.get('idempotency_key')
+
+    # Students confirmed by live recognition are present whatever the client posts;
+    # anything else the client marks present is a manual override by the faculty.
+    # Live sessions belong to the logged-in faculty, whatever faculty_id was posted.
+    live_session = attendance_sessions.get(session.get('id'), subject_id, section_name) \
+        if session.get('role') == 'faculty' else None
+    recognized = live_session.present if live_session is not None else set()
+    manually_marked = [student_id for student_id in present_students if student_id not in recognized]
+    present_students = list(dict.fromkeys(list(present_students) + sorted(recognized & set(absent_students))))
+    absent_students = [student_id for student_id in absent_students if student_id not in recognized]
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            if idempotency_key:
+                previous = claim_submission(cursor, idempotency_key, faculty_id, subject_id, section_name)
+                if previous is not None:
+                    conn.rollback()
+                    return jsonify({**previous, 'duplicate': True})
+
+            # All present and absent rows in one round trip
+            write_attendance(cursor, faculty_id, subject_id, present_students, absent_students)
+
+            # Remove the substitute assignment after attendance is marked
             cursor.execute("""
-                INSERT INTO attendance (roll_number, subject_id, date, status, faculty_id)
-                VALUES (%s, %s, CURRENT_DATE, 'Absent', %s)
-            """, (student_id, subject_id, faculty_id))
-
-        # Remove the substitute assignment after attendance is marked
-        cursor.execute("""
-            DELETE FROM substitute_assignments
-            WHERE substitute_faculty_id = %s AND subject_id = %s AND section_name = %s
-        """, (faculty_id, subject_id, section_name))
-
-        conn.commit()
+                DELETE FROM substitute_assignments
+                WHERE substitute_faculty_id = %s AND subject_id = %s AND section_name = %s
+            """, (faculty_id, subject_id, section_name))
+
+            response = {'success': True, 'manually_marked': manually_marked}
+            if idempotency_key:
+                save_submission_response(cursor, idempotency_key, response)
+            conn.commit()
+            if live_session is not None:
+                attendance_sessions.close(session.get('id'), subject_id, section_name)
         
-        # Emit real-time update
-        emit_attendance_update({
-            'faculty_id': faculty_id,
-            'subject_id': subject_id,
-            'section_name': section_name,
-            'present_count': len(present_students),
-            'absent_count': len(absent_students)
-        })
-
-        return jsonify({'success': True})
-    except Exception as err:
-        return jsonify({'success': False, 'message': str(err)})
-    finally:
-        cursor.close()
-        conn.close()
+            # Emit real-time update
+            emit_attendance_update({
+                'faculty_id': faculty_id,
+                'subject_id': subject_id,
+                'section_name': section_name,
+                'present_count': len(present_students),
+                'absent_count': len(absent_students),
+                'recognized_count': len(recognized),
+                'manual_count': len(manually_marked)
+            })
+
+            return jsonify(response)
+        except Exception as err:
+            return jsonify({'success': False, 'message': str(err)})
+        finally:
+            cursor.close()
 
 
 @faculty.route('/faculty-attendance')
@@ -134,72 +149,55 @@ def faculty_attendance():
     subject_id = request.args.get('subject_id')
     section_name = request.args.get('section_name')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Fetch subject name
-        cursor.execute("SELECT subject_name FROM subjects WHERE subject_id = %s", (subject_id,))
-        subject = cursor.fetchone()
-        subject_name = subject['subject_name']
-
-        # Fetch all students in the section
-        cursor.execute("""
-            SELECT s.roll_number, s.name
-            FROM students s
-            WHERE s.section_name = %s
-        """, (section_name,))
-        students = cursor.fetchall()
-
-        # Fetch attendance data for each student
-        for student in students:
-            cursor.execute("""
-                SELECT COUNT(a.attendance_id) AS total_classes,
-                       SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END) AS present_classes
-                FROM attendance a
-                WHERE a.roll_number = %s AND a.subject_id = %s
-            """, (student['roll_number'], subject_id))
-            attendance_data = cursor.fetchone()
-            student['total_classes'] = attendance_data['total_classes']
-            student['present_classes'] = attendance_data['present_classes']
-
-            if attendance_data['total_classes'] > 0:
-                student['attendance_percentage'] = round((attendance_data['present_classes'] / attendance_data['total_classes']) * 100, 2)
-            else:
-                student['attendance_percentage'] = 0
-
-            # Fetch detailed attendance records
-            cursor.execute("""
-                SELECT date, status
-                FROM attendance
-                WHERE roll_number = %s AND subject_id = %s
-                ORDER BY date DESC
-            """, (student['roll_number'], subject_id))
-            student['attendance_records'] = cursor.fetchall()
-
-        # Calculate overall attendance percentage
-        # Calculate overall attendance percentage (Average of student percentages)
-        total_students = len(students)
-        sum_percentages = sum(student.get('attendance_percentage', 0) for student in students)
-
-        if total_students > 0:
-            overall_attendance_percentage = round(sum_percentages / total_students, 2)
-        else:
-            overall_attendance_percentage = 0
-
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Fetch subject name
+            cursor.execute("SELECT subject_name FROM subjects WHERE subject_id = %s", (subject_id,))
+            subject = cursor.fetchone()
+            subject_name = subject['subject_name']
+
+            # Totals come from attendance_summary; history is loaded per student on demand
+            students, overall_attendance_percentage = section_report(cursor, subject_id, section_name)
+        finally:
+            cursor.close()
 
     return render_template('faculty_attendance.html',
                           user_name=session.get('name'),
                           subject_name=subject_name,
+                          subject_id=subject_id,
                           section_name=section_name,
                           students=students,
                           present_percentage=overall_attendance_percentage,
                           absent_percentage=100 - overall_attendance_percentage)
 
 
+@faculty.route('/faculty-attendance/history')
+@login_required
+def faculty_attendance_history():
+    """One page of a student's attendance in a subject; pass next_before back as before for the next page."""
+    if session.get('role') != 'faculty':
+        return jsonify({'success': False, 'message': 'Unauthorized access!'}), 403
+
+    roll_number = request.args.get('roll_number')
+    subject_id = request.args.get('subject_id')
+    before = request.args.get('before') or None
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    if not roll_number or not subject_id:
+        return jsonify({'success': False, 'message': 'roll_number and subject_id are required'}), 400
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            records, next_before = attendance_history(cursor, roll_number, subject_id, before, limit)
+            return jsonify({'success': True, 'records': records, 'next_before': next_before})
+        except Exception as err:
+            return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
+        finally:
+            cursor.close()
+
+
 @faculty.route('/assign-substitute', methods=['POST'])
 @login_required
 def assign_substitute():
@@ -214,23 +212,22 @@ def assign_substitute():
 
     original_faculty_id = session.get('id')  # Logged-in faculty is the original faculty
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        # Insert the substitute assignment into the database
-        cursor.execute("""
-            INSERT INTO substitute_assignments (original_faculty_id, substitute_faculty_id, subject_id, section_name, date)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (original_faculty_id, substitute_faculty_id, subject_id, section_name, date))
-        conn.commit()
+        try:
+            # Insert the substitute assignment into the database
+            cursor.execute("""
+                INSERT INTO substitute_assignments (original_faculty_id, substitute_faculty_id, subject_id, section_name, date)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (original_faculty_id, substitute_faculty_id, subject_id, section_name, date))
+            conn.commit()
 
-        return jsonify({'success': True, 'message': 'Substitute assigned successfully!'})
-    except Exception as err:
-        return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
-    finally:
-        cursor.close()
-        conn.close()
+            return jsonify({'success': True, 'message': 'Substitute assigned successfully!'})
+        except Exception as err:
+            return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
+        finally:
+            cursor.close()
 
 @faculty.route('/fetch-substitute-classes', methods=['GET'])
 @login_required
@@ -240,26 +237,25 @@ def fetch_substitute_classes():
 
     substitute_faculty_id = session.get('id')  # Logged-in faculty is the substitute
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Fetch substitute assignments for the logged-in faculty
-        cursor.execute("""
-            SELECT sa.id, sa.subject_id, sa.section_name, sa.date, s.subject_name, f.name AS original_faculty_name
-            FROM substitute_assignments sa
-            JOIN subjects s ON sa.subject_id = s.subject_id
-            JOIN faculty f ON sa.original_faculty_id = f.faculty_id
-            WHERE sa.substitute_faculty_id = %s
-        """, (substitute_faculty_id,))
-        substitute_classes = cursor.fetchall()
-
-        return jsonify({'success': True, 'substitute_classes': substitute_classes})
-    except Exception as err:
-        return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Fetch substitute assignments for the logged-in faculty
+            cursor.execute("""
+                SELECT sa.id, sa.subject_id, sa.section_name, sa.date, s.subject_name, f.name AS original_faculty_name
+                FROM substitute_assignments sa
+                JOIN subjects s ON sa.subject_id = s.subject_id
+                JOIN faculty f ON sa.original_faculty_id = f.faculty_id
+                WHERE sa.substitute_faculty_id = %s
+            """, (substitute_faculty_id,))
+            substitute_classes = cursor.fetchall()
+
+            return jsonify({'success': True, 'substitute_classes': substitute_classes})
+        except Exception as err:
+            return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
+        finally:
+            cursor.close()
 
 @faculty.route('/fetch-substitute-assignments', methods=['GET'])
 @login_required
@@ -269,26 +265,25 @@ def fetch_substitute_assignments():
 
     original_faculty_id = session.get('id')  # Logged-in faculty is the original faculty
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Fetch substitute assignments for the logged-in faculty
-        cursor.execute("""
-            SELECT sa.id, sa.subject_id, sa.section_name, sa.date, s.subject_name, f.name AS substitute_faculty_name
-            FROM substitute_assignments sa
-            JOIN subjects s ON sa.subject_id = s.subject_id
-            JOIN faculty f ON sa.substitute_faculty_id = f.faculty_id
-            WHERE sa.original_faculty_id = %s
-        """, (original_faculty_id,))
-        substitute_assignments = cursor.fetchall()
-
-        return jsonify({'success': True, 'substitute_assignments': substitute_assignments})
-    except Exception as err:
-        return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Fetch substitute assignments for the logged-in faculty
+            cursor.execute("""
+                SELECT sa.id, sa.subject_id, sa.section_name, sa.date, s.subject_name, f.name AS substitute_faculty_name
+                FROM substitute_assignments sa
+                JOIN subjects s ON sa.subject_id = s.subject_id
+                JOIN faculty f ON sa.substitute_faculty_id = f.faculty_id
+                WHERE sa.original_faculty_id = %s
+            """, (original_faculty_id,))
+            substitute_assignments = cursor.fetchall()
+
+            return jsonify({'success': True, 'substitute_assignments': substitute_assignments})
+        except Exception as err:
+            return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
+        finally:
+            cursor.close()
 
 @faculty.route('/fetch-substitute-classes-for-substitute', methods=['GET'])
 @login_required
@@ -298,23 +293,22 @@ def fetch_substitute_classes_for_substitute():
 
     substitute_faculty_id = session.get('id')  # Logged-in faculty is the substitute
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # Fetch substitute assignments for the logged-in substitute faculty
-        cursor.execute("""
-            SELECT sa.id, sa.subject_id, sa.section_name, sa.date, s.subject_name, f.name AS original_faculty_name
-            FROM substitute_assignments sa
-            JOIN subjects s ON sa.subject_id = s.subject_id
-            JOIN faculty f ON sa.original_faculty_id = f.faculty_id
-            WHERE sa.substitute_faculty_id = %s
-        """, (substitute_faculty_id,))
-        substitute_classes = cursor.fetchall()
-
-        return jsonify({'success': True, 'substitute_classes': substitute_classes})
-    except Exception as err:
-        return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Fetch substitute assignments for the logged-in substitute faculty
+            cursor.execute("""
+                SELECT sa.id, sa.subject_id, sa.section_name, sa.date, s.subject_name, f.name AS original_faculty_name
+                FROM substitute_assignments sa
+                JOIN subjects s ON sa.subject_id = s.subject_id
+                JOIN faculty f ON sa.original_faculty_id = f.faculty_id
+                WHERE sa.substitute_faculty_id = %s
+            """, (substitute_faculty_id,))
+            substitute_classes = cursor.fetchall()
+
+            return jsonify({'success': True, 'substitute_classes': substitute_classes})
+        except Exception as err:
+            return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
+        finally:
+            cursor.close()
@@ -1,13 +1,14 @@
-from flask import Blueprint, render_template, request, jsonify, session
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for
 from flask_login import login_required
-from app.db import get_db_connection
+from app.db import db_connection, notify_gallery_change
 from app.decorators import student_required
 import cv2
 import numpy as np
 import base64
-import pickle
 import face_recognition
-from app.services.recognition import clear_cache
+from app.services.recognition import clear_cache, campus_index
+from app.services.embedding_format import encode_embedding
+from app.services.attendance_store import student_summary, attendance_history
 
 student = Blueprint('student', __name__)
 
@@ -21,50 +22,14 @@ def student_dashboard():
         return redirect(url_for('student.register_facial_data'))
 
     student_id = session.get('id')
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        # Fetch student's classes and attendance
-        cursor.execute("""
-                       SELECT s.subject_id,
-                              s.subject_name,
-                              COUNT(a.attendance_id)AS total_classes,
-                              SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END) AS present_classes FROM attendance a JOIN subjects s ON a.subject_id = s.subject_id JOIN students st ON a.roll_number = st.roll_number -- Join with students table
-                       WHERE a.roll_number = %s -- Filter by roll number
-                       GROUP BY s.subject_id, s.subject_name;
-                       """, (student_id,))
-        classes = cursor.fetchall()
-        print(classes)
-
-        # Calculate attendance percentage for each class
-        for class_info in classes:
-            if class_info['total_classes'] > 0:
-                class_info['attendance_percentage'] = round((class_info['present_classes'] / class_info['total_classes']) * 100, 2)
-            else:
-                class_info['attendance_percentage'] = 0
-
-        # Fetch detailed attendance records for each class
-        for class_info in classes:
-            cursor.execute("""
-                SELECT date, status
-                FROM attendance
-                WHERE roll_number = %s AND subject_id = %s
-                ORDER BY date DESC
-            """, (student_id, class_info['subject_id']))
-            class_info['attendance_records'] = cursor.fetchall()
-
-        # Calculate overall attendance percentage
-        total_classes = sum(class_info['total_classes'] for class_info in classes)
-        present_classes = sum(class_info['present_classes'] for class_info in classes)
-        if total_classes > 0:
-            overall_attendance_percentage = round((present_classes / total_classes) * 100, 2)
-        else:
-            overall_attendance_percentage = 0
-
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            # Per-subject summaries in one query; the history behind each is fetched on demand
+            classes, overall_attendance_percentage = student_summary(cursor, student_id)
+        finally:
+            cursor.close()
 
     return render_template('student_dashboard.html',
                           user_name=session.get('name'),
@@ -73,6 +38,28 @@ def student_dashboard():
                           absent_percentage=100 - overall_attendance_percentage)
 
 
+@student.route('/student-dashboard/history')
+@login_required
+@student_required
+def student_attendance_history():
+    """One page of the logged-in student's attendance in a subject, keyed by (subject_id, before)."""
+    subject_id = request.args.get('subject_id')
+    before = request.args.get('before') or None
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    if not subject_id:
+        return jsonify({'success': False, 'message': 'subject_id is required'}), 400
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            records, next_before = attendance_history(cursor, session.get('id'), subject_id, before, limit)
+            return jsonify({'success': True, 'records': records, 'next_before': next_before})
+        except Exception as err:
+            return jsonify({'success': False, 'message': f'Database error: {err}'}), 500
+        finally:
+            cursor.close()
+
+
 @student.route('/register-facial-data', methods=['GET', 'POST'])
 @login_required
 def register_facial_data():
@@ -96,27 +83,33 @@ def register_facial_data():
         if not face_encodings:
             return jsonify({'success': False, 'message': 'No face detected in the image.'}), 400
 
-        facial_encoding = face_encodings[0].tolist()
-        encoding_blob = pickle.dumps(facial_encoding)
+        facial_encoding = face_encodings[0]
+        encoding_blob = encode_embedding(facial_encoding)
 
         # Update the user's facial encoding in the database
         user_id = session.get('id')
         user_role = session.get('role')
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        if user_role == 'student':
-            cursor.execute("UPDATE students SET facial_embedding = %s WHERE roll_number = %s", (encoding_blob, user_id))
-        elif user_role == 'faculty':
-            cursor.execute("UPDATE faculty SET facial_embedding = %s WHERE faculty_id = %s", (encoding_blob, user_id))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        # Invalidate all cache since we don't know the section easily
-        clear_cache()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+
+            section_name = None
+            if user_role == 'student':
+                cursor.execute("UPDATE students SET facial_embedding = %s WHERE roll_number = %s RETURNING section_name",
+                               (encoding_blob, user_id))
+                updated = cursor.fetchone()
+                section_name = updated['section_name'] if updated else None
+            elif user_role == 'faculty':
+                cursor.execute("UPDATE faculty SET facial_embedding = %s WHERE faculty_id = %s", (encoding_blob, user_id))
+            notify_gallery_change(cursor, section_name, user_role, user_id)
+
+            conn.commit()
+            cursor.close()
+
+        # Only the student's own section gallery is affected (faculty are not in section galleries)
+        if section_name:
+            clear_cache(section_name)
+        campus_index.upsert((user_role, user_id), facial_encoding, section_name)
 
         # Update session to indicate registration is complete
         session['require_face_registration'] = False
@@ -0,0 +1,142 @@
+import threading
+import time
+from datetime import date
+from app.services.metrics import registry
+
+
+class AttendanceSession:
+    """
+    Live attendance state for one (faculty, subject, section, date).
+
+    Every recognized sighting is an O(1) counter update; a student is declared
+    present after `required_sightings` sightings in separate frames at a distance
+    of at most `max_distance`. Only faces that were actually encoded in a frame
+    count: a face the tracker carried over without re-encoding adds no evidence.
+    Once everyone on the roster is present the client is told to stop streaming.
+    """
+
+    def __init__(self, key, required_sightings=3, max_distance=0.5):
+        self.key = key
+        self.required_sightings = required_sightings
+        self.max_distance = max_distance
+        self.roster = None
+        self.sightings = {}        # roll_number -> count
+        self.confidence_sum = {}   # roll_number -> sum of (1 - distance)
+        self.present = set()
+        self.frames = 0
+        self.last_seen_at = time.time()
+
+    def set_roster(self, roll_numbers):
+        self.roster = set(roll_numbers)
+
+    @property
+    def complete(self):
+        return bool(self.roster) and self.present >= self.roster
+
+    def record(self, faces):
+        """
+        Records one frame's recognition results ([{'student_id', 'distance', 'tracked'}, ...]).
+        Returns the students newly declared present by this frame.
+        """
+        self.frames += 1
+        self.last_seen_at = time.time()
+        newly_present = []
+        seen = set()
+        for face in faces:
+            student_id = face['student_id']
+            distance = face.get('distance')
+            if student_id == "Unknown" or student_id in seen or distance is None or distance > self.max_distance:
+                continue
+            if face.get('tracked'):
+                # Identity reused from an earlier frame, not a new sighting
+                continue
+            if self.roster is not None and student_id not in self.roster:
+                continue
+            seen.add(student_id)
+            count = self.sightings[student_id] = self.sightings.get(student_id, 0) + 1
+            self.confidence_sum[student_id] = self.confidence_sum.get(student_id, 0.0) + (1.0 - distance)
+            if count >= self.required_sightings and student_id not in self.present:
+                self.present.add(student_id)
+                newly_present.append(student_id)
+        return newly_present
+
+    def suggested_interval_ms(self, base_interval_ms=500):
+        """Frame interval for the client: slower once most of the class is in, 0 (stop) when complete."""
+        if self.complete:
+            return 0
+        if self.roster and len(self.present) >= 0.9 * len(self.roster):
+            return base_interval_ms * 4
+        return base_interval_ms
+
+    def summary(self):
+        return {
+            'present': sorted(self.present),
+            'present_count': len(self.present),
+            'roster_size': len(self.roster or ()),
+            'complete': self.complete,
+            'frame_interval_ms': self.suggested_interval_ms(),
+        }
+
+    def confidence(self, student_id):
+        count = self.sightings.get(student_id, 0)
+        return round(self.confidence_sum.get(student_id, 0.0) / count, 3) if count else None
+
+
+class AttendanceSessionRegistry:
+    """
+    Process-wide table of live sessions; idle sessions expire after `max_idle` seconds.
+
+    Sessions are keyed on the logged-in faculty's id, never on ids sent by the
+    client. They live in one worker's memory: the socket streaming the frames and
+    the submit_attendance request must reach the same worker, so this needs a
+    single worker or sticky sessions. Elsewhere submit_attendance simply finds no
+    session and records what the client posted.
+    """
+
+    def __init__(self, required_sightings=3, max_distance=0.5, max_idle=3 * 3600):
+        self.required_sightings = required_sightings
+        self.max_distance = max_distance
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def init_app(self, app):
+        self.required_sightings = app.config.get('ATTENDANCE_REQUIRED_SIGHTINGS', self.required_sightings)
+        self.max_distance = app.config.get('ATTENDANCE_MAX_DISTANCE', self.max_distance)
+
+    @staticmethod
+    def make_key(faculty_id, subject_id, section_name, day=None):
+        return (str(faculty_id), str(subject_id), section_name, (day or date.today()).isoformat())
+
+    def get_or_create(self, faculty_id, subject_id, section_name):
+        key = self.make_key(faculty_id, subject_id, section_name)
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = AttendanceSession(key, self.required_sightings, self.max_distance)
+            return session
+
+    def get(self, faculty_id, subject_id, section_name):
+        with self._lock:
+            return self._sessions.get(self.make_key(faculty_id, subject_id, section_name))
+
+    def close(self, faculty_id, subject_id, section_name):
+        with self._lock:
+            return self._sessions.pop(self.make_key(faculty_id, subject_id, section_name), None)
+
+    def _expire(self):
+        cutoff = time.time() - self.max_idle
+        for key in [key for key, session in self._sessions.items() if session.last_seen_at < cutoff]:
+            del self._sessions[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'complete': sum(1 for session in self._sessions.values() if session.complete),
+            }
+
+
+attendance_sessions = AttendanceSessionRegistry()
+registry.register_collector('attendance_sessions', attendance_sessions.stats)
@@ -0,0 +1,147 @@
+import json
+from psycopg2.extras import execute_values
+
+
+def write_attendance(cursor, faculty_id, subject_id, present_students, absent_students):
+    """
+    Writes today's attendance for a class as one multi-row upsert. The unique index on
+    (roll_number, subject_id, date) makes resubmitting the same class overwrite the
+    earlier rows instead of duplicating them. attendance_summary is kept current by
+    the trigger on attendance (migrations/0003) in the same transaction.
+    """
+    statuses = {roll_number: 'Absent' for roll_number in absent_students}
+    statuses.update({roll_number: 'Present' for roll_number in present_students})
+    if not statuses:
+        return 0
+
+    # Sorted, so concurrent submissions lock the same summary rows in the same order
+    execute_values(cursor, """
+        INSERT INTO attendance (roll_number, subject_id, date, status, faculty_id)
+        VALUES %s
+        ON CONFLICT (roll_number, subject_id, date)
+        DO UPDATE SET status = EXCLUDED.status, faculty_id = EXCLUDED.faculty_id
+    """, [(roll_number, subject_id, status, faculty_id) for roll_number, status in sorted(statuses.items())],
+        template="(%s, %s, CURRENT_DATE, %s, %s)", page_size=len(statuses))
+    return len(statuses)
+
+
+def rebuild_attendance_summary(cursor):
+    """
+    Recomputes attendance_summary from the attendance table. Blocks attendance writes
+    until the caller commits, so no submission can slip between the scan and the swap.
+    Returns the number of summary rows written.
+    """
+    cursor.execute("LOCK TABLE attendance IN SHARE MODE")
+    cursor.execute("LOCK TABLE attendance_summary IN EXCLUSIVE MODE")
+    cursor.execute("DELETE FROM attendance_summary")
+    cursor.execute("""
+        INSERT INTO attendance_summary (roll_number, subject_id, total_classes, present_classes)
+        SELECT roll_number, subject_id, COUNT(*), COUNT(*) FILTER (WHERE status = 'Present')
+        FROM attendance
+        GROUP BY roll_number, subject_id
+    """)
+    return cursor.rowcount
+
+
+def claim_submission(cursor, idempotency_key, faculty_id, subject_id, section_name):
+    """
+    Registers a submission key inside the caller's transaction. Returns None the first
+    time, or the stored response of the earlier submission when the key was already
+    used. A concurrent retry waits on the key until the first transaction finishes.
+    """
+    cursor.execute("""
+        INSERT INTO attendance_submissions (idempotency_key, faculty_id, subject_id, section_name)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING idempotency_key
+    """, (idempotency_key, faculty_id, subject_id, section_name))
+    if cursor.fetchone():
+        return None
+
+    cursor.execute("SELECT response FROM attendance_submissions WHERE idempotency_key = %s", (idempotency_key,))
+    row = cursor.fetchone()
+    return (row['response'] if row else None) or {'success': True}
+
+
+def save_submission_response(cursor, idempotency_key, response):
+    cursor.execute("UPDATE attendance_submissions SET response = %s WHERE idempotency_key = %s",
+                   (json.dumps(response), idempotency_key))
+
+
+def percentage(present, total):
+    return round(present / total * 100, 2) if total else 0
+
+
+def section_report(cursor, subject_id, section_name):
+    """
+    Attendance of every student of a section in one subject, one attendance_summary
+    row per student. Returns (students, class_average), where each student has
+    total_classes, present_classes and attendance_percentage, and class_average is
+    the mean of the students' percentages.
+    """
+    cursor.execute("""
+        SELECT s.roll_number, s.name,
+               COALESCE(sm.total_classes, 0) AS total_classes,
+               COALESCE(sm.present_classes, 0) AS present_classes
+        FROM students s
+        LEFT JOIN attendance_summary sm ON sm.roll_number = s.roll_number AND sm.subject_id = %s
+        WHERE s.section_name = %s
+        ORDER BY s.roll_number
+    """, (subject_id, section_name))
+    students = cursor.fetchall()
+    for student in students:
+        student['attendance_percentage'] = percentage(student['present_classes'], student['total_classes'])
+
+    class_average = round(sum(student['attendance_percentage'] for student in students) / len(students), 2) \
+        if students else 0
+    return students, class_average
+
+
+def attendance_history(cursor, roll_number, subject_id, before=None, limit=20):
+    """
+    One page of a student's attendance in a subject, newest first. Pages are keyed on
+    the date (unique per student and subject), so each page is an index range scan
+    however deep the history is. Returns (records, next_before); next_before is the
+    `before` value for the following page, or None on the last page.
+    """
+    if before is None:
+        cursor.execute("""
+            SELECT date, status FROM attendance
+            WHERE roll_number = %s AND subject_id = %s
+            ORDER BY date DESC
+            LIMIT %s
+        """, (roll_number, subject_id, limit + 1))
+    else:
+        cursor.execute("""
+            SELECT date, status FROM attendance
+            WHERE roll_number = %s AND subject_id = %s AND date < %s
+            ORDER BY date DESC
+            LIMIT %s
+        """, (roll_number, subject_id, before, limit + 1))
+    rows = cursor.fetchall()
+
+    records = [{'date': row['date'].isoformat(), 'status': row['status']} for row in rows[:limit]]
+    next_before = records[-1]['date'] if len(rows) > limit else None
+    return records, next_before
+
+
+def student_summary(cursor, roll_number):
+    """
+    Per-subject totals for one student, read from attendance_summary. Returns
+    (classes, overall_percentage), each class with subject_id, subject_name,
+    total_classes, present_classes and attendance_percentage.
+    """
+    cursor.execute("""
+        SELECT s.subject_id, s.subject_name, sm.total_classes, sm.present_classes
+        FROM attendance_summary sm
+        JOIN subjects s ON sm.subject_id = s.subject_id
+        WHERE sm.roll_number = %s AND sm.total_classes > 0
+        ORDER BY s.subject_name
+    """, (roll_number,))
+    classes = cursor.fetchall()
+    for class_info in classes:
+        class_info['attendance_percentage'] = percentage(class_info['present_classes'], class_info['total_classes'])
+
+    overall = percentage(sum(class_info['present_classes'] for class_info in classes),
+                         sum(class_info['total_classes'] for class_info in classes))
+    return classes, overall
@@ -0,0 +1,77 @@
+import logging
+import pickle
+import struct
+import numpy as np
+
+# Compact facial_embedding layout (v1):
+#   b'AE' | version (u8) | reserved (u8) | dim (u16 LE) | dim x float32 LE
+# Older rows hold a pickled list (student self-registration) or a pickled float64
+# array (admin add_student); decode_embedding still reads those.
+MAGIC = b'AE'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<2sBBH')
+HEADER_SIZE = HEADER.size
+EMBEDDING_DIM = 128
+
+logger = logging.getLogger(__name__)
+
+
+def encode_embedding(encoding):
+    """Packs an encoding into the compact versioned float32 format."""
+    vector = np.asarray(encoding, dtype='<f4').ravel()
+    return HEADER.pack(MAGIC, FORMAT_VERSION, 0, vector.size) + vector.tobytes()
+
+
+def is_compact(blob):
+    return blob is not None and len(blob) >= HEADER_SIZE and bytes(blob[:2]) == MAGIC
+
+
+def _check_header(blob):
+    magic, version, _, dim = HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported embedding format version {version}")
+    if dim != EMBEDDING_DIM or len(blob) != HEADER_SIZE + 4 * dim:
+        raise ValueError(f"expected {EMBEDDING_DIM} values, got {dim} ({len(blob)} bytes)")
+
+
+def decode_embedding(blob):
+    """Decodes a stored facial_embedding blob (compact or legacy pickle) into a float32 vector."""
+    if is_compact(blob):
+        _check_header(blob)
+        return np.frombuffer(blob, dtype='<f4', offset=HEADER_SIZE).astype(np.float32)
+
+    encoding = np.asarray(pickle.loads(blob), dtype=np.float32).ravel()
+    if encoding.size != EMBEDDING_DIM:
+        raise ValueError(f"expected {EMBEDDING_DIM} values, got {encoding.size}")
+    return encoding
+
+
+def decode_embeddings(blobs):
+    """
+    Decodes many blobs into an (n, EMBEDDING_DIM) float32 matrix. Compact rows are
+    joined and decoded with a single np.frombuffer; legacy pickles one by one.
+    Returns (matrix, ok) where ok[i] is False for blobs that could not be decoded.
+    """
+    ok = []
+    compact_payloads = []
+    compact_rows = []
+    legacy = {}
+    for index, blob in enumerate(blobs):
+        try:
+            if is_compact(blob):
+                _check_header(blob)
+                compact_payloads.append(memoryview(blob)[HEADER_SIZE:])
+                compact_rows.append(index)
+            else:
+                legacy[index] = decode_embedding(blob)
+            ok.append(True)
+        except (ValueError, struct.error, pickle.PickleError, AttributeError, TypeError, EOFError) as e:
+            logger.warning("Error decoding facial embedding #%d: %s", index, e)
+            ok.append(False)
+
+    matrix = np.empty((len(blobs), EMBEDDING_DIM), dtype=np.float32)
+    if compact_payloads:
+        matrix[compact_rows] = np.frombuffer(b''.join(compact_payloads), dtype='<f4').reshape(-1, EMBEDDING_DIM)
+    for index, vector in legacy.items():
+        matrix[index] = vector
+    return matrix[np.array(ok, dtype=bool)], ok
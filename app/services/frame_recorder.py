@@ -0,0 +1,198 @@
+import atexit
+import base64
+import json
+import logging
+import os
+import struct
+import time
+from app.services.metrics import registry
+
+try:
+    # The writer must be a real OS thread even under monkey patching, so that disk
+    # writes never run on the eventlet hub
+    from eventlet.patcher import original
+    threading = original('threading')
+    queue = original('queue')
+except ImportError:
+    import threading
+    import queue
+
+logger = logging.getLogger(__name__)
+
+# Recording layout: <name>.frames holds b'AEFR' | version (u8), then one record per
+# frame: payload length (u32 LE) | encoded image bytes. <name>.idx has one JSON line
+# per record (payload offset/length, arrival time, session, section, ...), so a
+# replay can seek straight to frames; the length prefixes keep .frames readable
+# on its own if the index is lost.
+MAGIC = b'AEFR'
+FORMAT_VERSION = 1
+LENGTH = struct.Struct('<I')
+
+
+class FrameRecorder:
+    """
+    Opt-in recorder of incoming 'process_frame' payloads for offline replay.
+
+    Disabled unless FRAME_RECORD_DIR is set. record() only queues the frame; a
+    background writer thread appends it to this worker's recording, and frames are
+    dropped when `max_queue` of them are already waiting. Recording stops once
+    FRAME_RECORD_MAX_MB has been written. Recordings contain student faces: keep
+    them on trusted storage and delete them after use.
+    """
+
+    def __init__(self, max_queue=256):
+        self.directory = None
+        self.max_bytes = 0
+        self.max_queue = max_queue
+        self.path = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._data = None
+        self._index = None
+        self._sessions = {}  # sid -> small integer, so recordings carry no socket ids
+        self._next_session = 1
+        self._queued_bytes = 0
+        self._started_at = None
+        self._stats = {'recorded': 0, 'bytes': 0, 'skipped': 0, 'dropped': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self.directory = app.config.get('FRAME_RECORD_DIR') or None
+        self.max_bytes = int(app.config.get('FRAME_RECORD_MAX_MB', 500) * 1024 * 1024)
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def record(self, sid, data):
+        """Queues one frame payload (binary or base64 data URL) for the recording."""
+        if not self.enabled:
+            return
+        image = data.get('image')
+        if isinstance(image, str):
+            image = base64.b64decode(image.split(",")[1])
+        if not image:
+            return
+        image = bytes(image)
+
+        with self._lock:
+            if self._stats['bytes'] + self._queued_bytes + len(image) > self.max_bytes:
+                self._stats['skipped'] += 1
+                return
+            session = self._sessions.get(sid)
+            if session is None:
+                session = self._sessions[sid] = self._next_session
+                self._next_session += 1
+            if self._writer is None:
+                self._queue = queue.Queue(self.max_queue)
+                self._writer = threading.Thread(target=self._write_loop, name='frame-recorder', daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+
+            entry = {
+                'arrived_at': time.time(),
+                'session': session,
+                'section_name': data.get('section_name'),
+                'faculty_id': data.get('faculty_id'),
+                'subject_id': data.get('subject_id'),
+                'width': data.get('width'),
+                'height': data.get('height'),
+            }
+            try:
+                self._queue.put_nowait((entry, image))
+            except queue.Full:
+                self._stats['dropped'] += 1
+                return
+            self._queued_bytes += len(image)
+
+    def discard(self, sid):
+        """Forgets a closed connection; a later connection gets a new session number."""
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def _open(self, started_at):
+        os.makedirs(self.directory, exist_ok=True)
+        name = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        self._data = open(name + '.frames', 'wb')
+        self._data.write(MAGIC + bytes([FORMAT_VERSION]))
+        self._index = open(name + '.idx', 'w')
+        self._started_at = started_at
+        self.path = name
+
+    def _write(self, entry, image):
+        arrived_at = entry.pop('arrived_at')
+        if self._data is None:
+            self._open(arrived_at)
+        self._data.write(LENGTH.pack(len(image)))
+        offset = self._data.tell()
+        self._data.write(image)
+        entry = {'offset': offset, 'length': len(image), 't': round(arrived_at - self._started_at, 4), **entry}
+        self._index.write(json.dumps(entry) + '\n')
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            entry, image = item
+            try:
+                self._write(entry, image)
+                if self._queue.empty():
+                    # Flush once the backlog is written rather than after every frame
+                    self._data.flush()
+                    self._index.flush()
+                with self._lock:
+                    self._stats['recorded'] += 1
+                    self._stats['bytes'] += len(image)
+            except OSError as e:
+                logger.warning("Could not record frame: %s", e)
+                with self._lock:
+                    self._stats['errors'] += 1
+            finally:
+                with self._lock:
+                    self._queued_bytes -= len(image)
+
+    def close(self):
+        """Writes out every queued frame and closes the recording."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        self._queue.put(None)
+        writer.join()
+        for f in (self._data, self._index):
+            if f is not None:
+                f.close()
+        self._data = self._index = None
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'enabled': self.enabled, 'sessions': len(self._sessions),
+                    'queued': self._queue.qsize() if self._queue is not None else 0}
+
+
+def read_recording(path):
+    """
+    Yields (entry, image_bytes) for every frame of a recording, in arrival order.
+    `path` is the recording name with or without the .frames/.idx extension.
+    """
+    name = os.path.splitext(path)[0] if path.endswith(('.frames', '.idx')) else path
+    with open(name + '.frames', 'rb') as data:
+        header = data.read(len(MAGIC) + 1)
+        if header != MAGIC + bytes([FORMAT_VERSION]):
+            raise ValueError(f"{name}.frames is not a version {FORMAT_VERSION} frame recording")
+        with open(name + '.idx') as index:
+            for line in index:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                data.seek(entry['offset'])
+                image = data.read(entry['length'])
+                if len(image) != entry['length']:
+                    # Truncated by a crash mid-write
+                    break
+                yield entry, image
+
+
+frame_recorder = FrameRecorder()
+registry.register_collector('frame_recorder', frame_recorder.stats)
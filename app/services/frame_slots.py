@@ -0,0 +1,91 @@
+import threading
+from app.services.metrics import registry
+
+
+class FrameSlots:
+    """
+    One-deep frame slot per Socket.IO connection (latest frame wins).
+
+    While a connection's frame is being recognized, anything that arrives for the
+    same sid replaces the queued frame instead of piling up behind it, so a slow
+    server recognizes the freshest frame rather than one from seconds ago.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}  # sid -> {'pending': frame, 'running': bool, 'next_seq': int, 'last_seq': int}
+        self._stats = {'received': 0, 'dropped': 0, 'stale': 0, 'processed': 0}
+
+    def offer(self, sid, frame):
+        """
+        Queues a frame for sid and stamps it with frame['seq'].
+        Returns True if the caller should drain the slot (nobody else is running it).
+        """
+        with self._lock:
+            slot = self._slots.setdefault(sid, {'pending': None, 'running': False, 'next_seq': 1, 'last_seq': 0})
+            self._stats['received'] += 1
+
+            # seq comes from the client: anything but a positive int is replaced by ours
+            seq = frame.get('seq')
+            if type(seq) is not int or seq < 1:
+                frame['seq'] = slot['next_seq']
+            slot['next_seq'] = max(slot['next_seq'], frame['seq']) + 1
+
+            # Out-of-order delivery: never recognize a frame older than one already answered
+            if frame['seq'] <= slot['last_seq']:
+                self._stats['stale'] += 1
+                return False
+
+            if slot['pending'] is not None:
+                self._stats['dropped'] += 1
+            slot['pending'] = frame
+
+            if slot['running']:
+                return False
+            slot['running'] = True
+            return True
+
+    def take(self, sid):
+        """Pops the newest queued frame for sid, or releases the slot when there is none."""
+        with self._lock:
+            slot = self._slots.get(sid)
+            if slot is None:
+                return None
+            frame = slot['pending']
+            slot['pending'] = None
+            if frame is None:
+                slot['running'] = False
+            else:
+                slot['last_seq'] = frame['seq']
+            return frame
+
+    def release(self, sid):
+        """
+        Gives the slot up after a drain that failed part-way: any queued frame is
+        dropped and the next offer() for sid starts a fresh drain.
+        """
+        while self.take(sid) is not None:
+            with self._lock:
+                self._stats['dropped'] += 1
+
+    def mark_processed(self, sid):
+        with self._lock:
+            self._stats['processed'] += 1
+
+    def discard(self, sid):
+        with self._lock:
+            slot = self._slots.pop(sid, None)
+            if slot and slot['pending'] is not None:
+                self._stats['dropped'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'connections': len(self._slots),
+                'queued': sum(1 for slot in self._slots.values() if slot['pending'] is not None),
+            }
+
+
+frame_slots = FrameSlots()
+registry.register_collector('recognition_frames', frame_slots.stats)
@@ -0,0 +1,157 @@
+import bisect
+import re
+import threading
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (cumulative upper bounds, Prometheus style).
+    Cheap enough to observe on every frame; snapshots are taken under a lock.
+    """
+
+    def __init__(self, name, buckets, help_text='', labels=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = dict(labels or {})
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def percentile(self, q, counts=None, total=None):
+        """Estimates the q-th quantile (0..1) by interpolating inside the matching bucket."""
+        if counts is None:
+            with self._lock:
+                counts, total = list(self._counts), self._count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            counts, total, value_sum = list(self._counts), self._count, self._sum
+        return {
+            'count': total,
+            'sum': round(value_sum, 6),
+            'p50': self.percentile(0.50, counts, total),
+            'p95': self.percentile(0.95, counts, total),
+            'p99': self.percentile(0.99, counts, total),
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], counts)),
+        }
+
+    def render(self):
+        """Sample lines in Prometheus text exposition format (no HELP/TYPE header)."""
+        with self._lock:
+            counts, total, value_sum = list(self._counts), self._count, self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip([*map(str, self.buckets), '+Inf'], counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_labels({**self.labels, 'le': bound})} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labels)} {value_sum}")
+        lines.append(f"{self.name}_count{_labels(self.labels)} {total}")
+        return lines
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{str(value)}"' for key, value in labels.items())
+    return '{' + pairs + '}'
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of histograms plus "collectors": callables returning a stats
+    dict whose numeric leaves are exported as gauges.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}   # (name, labels) -> Histogram
+        self._collectors = {}   # prefix -> callable
+
+    def histogram(self, name, buckets, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(name, buckets, help_text, labels)
+            return histogram
+
+    def register_collector(self, prefix, collect):
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def render(self):
+        """Everything in Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            histograms = list(self._histograms.values())
+            collectors = list(self._collectors.items())
+
+        lines = []
+        described = set()
+        for histogram in sorted(histograms, key=lambda h: (h.name, sorted(h.labels.items()))):
+            if histogram.name not in described:
+                described.add(histogram.name)
+                lines.append(f"# HELP {histogram.name} {histogram.help_text}")
+                lines.append(f"# TYPE {histogram.name} histogram")
+            lines.extend(histogram.render())
+
+        for prefix, collect in collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                lines.append(f"# collector {prefix} failed: {e}")
+                continue
+            for name, value in _flatten(prefix, stats):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _flatten(prefix, stats):
+    for key, value in stats.items():
+        name = re.sub(r'[^a-zA-Z0-9_]', '_', f"{prefix}_{key}")
+        if isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+        elif isinstance(value, dict) and 'buckets' not in value:
+            # Histogram snapshots are exported by the registry itself
+            yield from _flatten(name, value)
+
+
+# Buckets for counts of items (faces per batch, etc.)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# Buckets for durations in seconds, from 1 ms to 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = MetricsRegistry()
+
+
+def stage_histogram(stage):
+    return registry.histogram('recognition_stage_seconds', LATENCY_BUCKETS,
+                              'Time spent in each stage of processing one frame', stage=stage)
+
+
+def observe_stages(timings):
+    """Records a {stage: seconds} dict into the per-stage histograms."""
+    for stage, seconds in timings.items():
+        stage_histogram(stage).observe(seconds)
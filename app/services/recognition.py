@@ -1,54 +1,1186 @@
-import pickle
+import logging
+import threading
+import time
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 import numpy as np
 import cv2
 import face_recognition
-from app.db import get_db_connection
+from app.db import db_connection, listen, GALLERY_CHANNEL, WORKER_ID
+from app.services.embedding_format import EMBEDDING_DIM, decode_embeddings
+from app.services.tracker import encode_mask
+from app.services.metrics import registry, SIZE_BUCKETS, LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# face_recognition.compare_faces uses 0.6 by default
+MATCH_TOLERANCE = 0.6
+
+class SectionGallery:
+    """
+    Known faces of one section packed into a single contiguous float32 matrix,
+    with squared norms precomputed so a whole frame can be matched in one GEMM.
+    """
+
+    def __init__(self, encodings, ids):
+        self.ids = list(ids)
+        self.matrix = np.empty((len(self.ids), EMBEDDING_DIM), dtype=np.float32)
+        if len(self.ids):
+            self.matrix[:] = encodings
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        # Matrix + norms, plus a rough allowance for the roll-number strings
+        return self.matrix.nbytes + self.sq_norms.nbytes + 64 * len(self.ids)
+
+    def match(self, face_encodings, tolerance=MATCH_TOLERANCE):
+        """
+        Matches every face of a frame against the gallery at once.
+        Returns a list of (student_id, distance, margin) per face, where margin is
+        the gap between the best and the runner-up distance (None with one student).
+        """
+        if len(face_encodings) == 0 or len(self.ids) == 0:
+            return [("Unknown", None, None) for _ in face_encodings]
+
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+
+        # ||q - g||^2 = ||q||^2 + ||g||^2 - 2 q.g, with the cross term as one matrix multiply
+        sq_dist = q_norms[:, None] + self.sq_norms[None, :] - 2.0 * (queries @ self.matrix.T)
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+
+        rows = np.arange(len(queries))
+        if len(self.ids) > 1:
+            top2 = np.argpartition(sq_dist, 1, axis=1)[:, :2]
+            top2_dist = sq_dist[rows[:, None], top2]
+            order = np.argsort(top2_dist, axis=1)
+            best = top2[rows, order[:, 0]]
+            best_dist = np.sqrt(top2_dist[rows, order[:, 0]])
+            margins = np.sqrt(top2_dist[rows, order[:, 1]]) - best_dist
+        else:
+            best = np.zeros(len(queries), dtype=np.intp)
+            best_dist = np.sqrt(sq_dist[:, 0])
+            margins = [None] * len(queries)
+
+        results = []
+        for index, distance, margin in zip(best, best_dist, margins):
+            student_id = self.ids[index] if distance <= tolerance else "Unknown"
+            results.append((student_id, float(distance), None if margin is None else float(margin)))
+        return results
+
+
+class GalleryCache:
+    """
+    LRU cache of SectionGallery objects bounded by a memory budget.
+
+    Every section carries a version stamp that is bumped on invalidation; a gallery
+    loaded while its section was being invalidated is returned to the caller but not
+    cached, so a slow load can never resurrect stale embeddings.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._galleries = OrderedDict()  # section_name -> SectionGallery, least recent first
+        self._versions = {}
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'stale_loads': 0}
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('GALLERY_CACHE_MB', self.max_bytes / (1024 * 1024)) * 1024 * 1024
+
+    def version(self, section_name):
+        with self._lock:
+            return self._versions.get(section_name, 0)
+
+    def __contains__(self, section_name):
+        with self._lock:
+            return section_name in self._galleries
+
+    def get(self, section_name):
+        with self._lock:
+            gallery = self._galleries.get(section_name)
+            if gallery is None:
+                self._stats['misses'] += 1
+                return None
+            self._galleries.move_to_end(section_name)
+            self._stats['hits'] += 1
+            return gallery
+
+    def put(self, section_name, gallery, version):
+        with self._lock:
+            if self._versions.get(section_name, 0) != version:
+                self._stats['stale_loads'] += 1
+                return False
+            old = self._galleries.pop(section_name, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._galleries[section_name] = gallery
+            self._bytes += gallery.nbytes
+            # Evict least recently used sections, but always keep the one just loaded
+            while self._bytes > self.max_bytes and len(self._galleries) > 1:
+                _, evicted = self._galleries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._stats['evictions'] += 1
+            return True
+
+    def invalidate(self, section_name):
+        with self._lock:
+            self._versions[section_name] = self._versions.get(section_name, 0) + 1
+            self._stats['invalidations'] += 1
+            gallery = self._galleries.pop(section_name, None)
+            if gallery is not None:
+                self._bytes -= gallery.nbytes
+
+    def clear(self):
+        with self._lock:
+            for section_name in set(self._versions) | set(self._galleries):
+                self._versions[section_name] = self._versions.get(section_name, 0) + 1
+            self._galleries.clear()
+            self._bytes = 0
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'sections': len(self._galleries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+gallery_cache = GalleryCache()
+registry.register_collector('recognition_gallery_cache', gallery_cache.stats)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the work and
+    every caller arriving while it is in flight waits for (and shares) its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'loads': 0, 'coalesced_waits': 0, 'failed_loads': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self._stats['loads'] += 1
+            else:
+                self._stats['coalesced_waits'] += 1
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            with self._lock:
+                self._stats['failed_loads'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+        return call['result']
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._calls)}
+
+
+gallery_loads = SingleFlight()
+registry.register_collector('recognition_gallery_loads', gallery_loads.stats)
 
-# Global cache for known faces: { section_name: (encodings, ids) }
-known_faces_cache = {}
 
 def load_known_students(section_name):
-    global known_faces_cache
-    if section_name in known_faces_cache:
-        return known_faces_cache[section_name]
+    gallery = gallery_cache.get(section_name)
+    if gallery is not None:
+        return gallery
+    # Concurrent misses for the same section share one query and decode
+    return gallery_loads.do(section_name, lambda: _load_gallery(section_name))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
 
-    try:
-        # Fetch students in the specified section
-        cursor.execute("""
-                       SELECT roll_number, facial_embedding
-                       FROM students
-                       WHERE section_name = %s
-                       """, (section_name,))
-        students = cursor.fetchall()
-    finally:
-        cursor.close()
-        conn.close()
-
-    known_face_encodings = []
-    known_face_ids = []
-
-    for student in students:
-        if student['facial_embedding']:
-            try:
-                # Decode the facial embedding bytes
-                known_face_encodings.append(pickle.loads(student['facial_embedding']))
-                known_face_ids.append(student['roll_number'])
-            except (ValueError, pickle.PickleError) as e:
-                print(f"Error decoding facial embedding for student {student['roll_number']}: {e}")
-            except AttributeError as e:
-                print(f"Error processing facial embedding for student {student['roll_number']}: {e}")
+def _load_gallery(section_name):
+    version = gallery_cache.version(section_name)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Fetch students in the specified section
+            cursor.execute("""
+                           SELECT roll_number, facial_embedding
+                           FROM students
+                           WHERE section_name = %s
+                           """, (section_name,))
+            students = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    # Decode the whole section at once (compact rows share one np.frombuffer)
+    students = [student for student in students if student['facial_embedding']]
+    known_face_encodings, ok = decode_embeddings([student['facial_embedding'] for student in students])
+    known_face_ids = [student['roll_number'] for student, decoded in zip(students, ok) if decoded]
 
     # Cache the results
-    known_faces_cache[section_name] = (known_face_encodings, known_face_ids)
-    return known_face_encodings, known_face_ids
+    gallery = SectionGallery(known_face_encodings, known_face_ids)
+    gallery_cache.put(section_name, gallery, version)
+    return gallery
 
 def clear_cache(section_name=None):
-    global known_faces_cache
+    """Drops the cached gallery of one section, or of every section when none is given."""
     if section_name:
-        if section_name in known_faces_cache:
-            del known_faces_cache[section_name]
+        gallery_cache.invalidate(section_name)
+    else:
+        gallery_cache.clear()
+
+
+def _kmeans(data, k, iterations=10, seed=0):
+    """Plain Lloyd's k-means; returns float32 centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_centroid(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def _nearest_centroid(data, centroids):
+    # Argmin of ||x - c||^2 only needs ||c||^2 - 2 x.c
+    scores = np.einsum('ij,ij->i', centroids, centroids)[None, :] - 2.0 * (data @ centroids.T)
+    return scores.argmin(axis=1)
+
+
+def _train_ivf(vectors, nlist, sample_size=20000, seed=0):
+    """Pool task: k-means centroids over (a sample of) vectors, and the partition of every vector."""
+    sample = vectors
+    if len(vectors) > sample_size:
+        sample = vectors[np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)]
+    centroids = _kmeans(sample, nlist, seed=seed)
+    return centroids, _nearest_centroid(vectors, centroids)
+
+
+class CampusIndex:
+    """
+    Approximate nearest-neighbour index over every student and faculty embedding,
+    for finding a face anywhere on campus rather than in one section.
+
+    IVF layout: vectors are partitioned around k-means centroids and a query scans
+    only the `nprobe` closest partitions. Until `train_threshold` faces are enrolled
+    the index is an exact linear scan. Keys are (role, id) tuples, e.g.
+    ('student', '21CS001') or ('faculty', 'f001').
+
+    start() loads it in a background task at worker start; k-means training runs in
+    the recognition pool and is repeated in the background once the index has doubled
+    since the last training. Changes made while it is loading or training are replayed
+    on top of the result.
+    """
+
+    def __init__(self, nprobe=8, train_threshold=2048):
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._vectors = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._keys = []            # row -> key (None for deleted rows)
+        self._rows = {}            # key -> row
+        self._sections = {}        # key -> section_name (students only)
+        self._free = []            # reusable rows
+        self._centroids = None
+        self._centroid_sq_norms = None
+        self._lists = []           # centroid -> set of rows
+        self._assign = {}          # row -> centroid
+        self._list_arrays = {}     # centroid -> cached np arrays of the partition
+        self._trained_size = 0
+        self._building = False
+        self._pending = {}         # key -> (encoding, section) or None, changes made while building
+        self._training = None      # background training thread
+        self._dirty = None         # rows changed while training, or None when not training
+        self._stats = {'searches': 0, 'upserts': 0, 'removals': 0, 'trainings': 0, 'build_seconds': None}
+        self.built = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    def init_app(self, app):
+        self.nprobe = app.config.get('CAMPUS_INDEX_NPROBE', self.nprobe)
+        self.train_threshold = app.config.get('CAMPUS_INDEX_TRAIN_THRESHOLD', self.train_threshold)
+
+    def start(self, app):
+        if not app.config.get('CAMPUS_INDEX') or not app.config.get('DATABASE_URL'):
+            return
+        if multiprocessing.parent_process() is not None:
+            return
+        self.enabled = True
+        from app.extensions import socketio
+        socketio.start_background_task(self._build_logged)
+
+    def _build_logged(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Campus index build failed")
+
+    def _fetch(self):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT 'student' AS role, roll_number AS id, section_name, facial_embedding
+                    FROM students WHERE facial_embedding IS NOT NULL
+                    UNION ALL
+                    SELECT 'faculty', faculty_id, NULL, facial_embedding
+                    FROM faculty WHERE facial_embedding IS NOT NULL
+                """)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        vectors, ok = decode_embeddings([row['facial_embedding'] for row in rows])
+        rows = [row for row, decoded in zip(rows, ok) if decoded]
+        return [(row['role'], row['id']) for row in rows], vectors, [row['section_name'] for row in rows]
+
+    def build(self):
+        """(Re)loads all student and faculty embeddings from the database, then trains."""
+        started_at = time.time()
+        with self._lock:
+            self._building = True
+            self._pending = {}
+        try:
+            keys, vectors, sections = self._fetch()
+        except Exception:
+            with self._lock:
+                self._building = False
+            raise
+        self.load(keys, vectors, sections)
+        with self._lock:
+            self._stats['build_seconds'] = round(time.time() - started_at, 3)
+
+    def load(self, keys, vectors, sections=None):
+        """Replaces the index contents, then trains the partitions (in the recognition pool)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        with self._lock:
+            self._vectors = vectors.copy()
+            self._sq_norms = np.einsum('ij,ij->i', self._vectors, self._vectors)
+            self._keys = list(keys)
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+            self._sections = {key: section for key, section in zip(self._keys, sections or []) if section}
+            self._free = []
+            self._centroids = None
+            self._lists, self._assign, self._list_arrays = [], {}, {}
+            self._trained_size = 0
+            for key, change in self._pending.items():
+                if change is None:
+                    self._remove(key)
+                else:
+                    self._upsert(key, *change)
+            self._pending, self._building = {}, False
+            self.built = True
+        self.train()
+
+    def train(self):
+        """Partitions the current contents around fresh k-means centroids."""
+        with self._lock:
+            if self._dirty is not None:
+                return
+            self._dirty = set()
+            rows = np.fromiter(sorted(self._rows.values()), dtype=np.intp)
+            vectors = self._vectors[rows]
+        try:
+            trained = None
+            if len(rows) >= self.train_threshold:
+                trained = recognition_executor.run(_train_ivf, vectors, int(np.sqrt(len(rows))))
+            with self._lock:
+                self._install(rows, trained)
+        finally:
+            with self._lock:
+                self._dirty = None
+
+    def _install(self, rows, trained):
+        self._trained_size = len(rows)
+        self._list_arrays = {}
+        if trained is None:
+            self._centroids = None
+            self._lists, self._assign = [], {}
+            return
+
+        self._centroids, assign = trained
+        self._centroid_sq_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        self._lists = [set() for _ in range(len(self._centroids))]
+        self._assign = {}
+        for row, centroid in zip(rows.tolist(), assign.tolist()):
+            if row not in self._dirty and self._keys[row] is not None:
+                self._lists[centroid].add(row)
+                self._assign[row] = centroid
+        # Rows added, replaced or reused while training was running
+        for row in self._dirty:
+            if self._keys[row] is not None:
+                self._link(row)
+        self._stats['trainings'] += 1
+
+    def _schedule_training(self):
+        # Caller holds the lock
+        if self._dirty is None and (self._training is None or not self._training.is_alive()):
+            self._training = threading.Thread(target=self._train_logged, daemon=True)
+            self._training.start()
+
+    def _train_logged(self):
+        try:
+            self.train()
+        except Exception:
+            logger.exception("Campus index training failed")
+
+    def _link(self, row):
+        centroid = int(_nearest_centroid(self._vectors[row][None, :], self._centroids)[0])
+        self._lists[centroid].add(row)
+        self._assign[row] = centroid
+        self._list_arrays.pop(centroid, None)
+
+    def _list_block(self, centroid):
+        # Contiguous copy of a partition's rows, vectors and norms; rebuilt lazily after edits
+        block = self._list_arrays.get(centroid)
+        if block is None:
+            rows = np.fromiter(self._lists[centroid], dtype=np.intp)
+            block = self._list_arrays[centroid] = (rows, self._vectors[rows], self._sq_norms[rows])
+        return block
+
+    def _unlink(self, row):
+        centroid = self._assign.pop(row, None)
+        if centroid is not None:
+            self._lists[centroid].discard(row)
+            self._list_arrays.pop(centroid, None)
+
+    def upsert(self, key, encoding, section_name=None):
+        """Adds or replaces the embedding for key."""
+        vector = np.asarray(encoding, dtype=np.float32).reshape(EMBEDDING_DIM)
+        with self._lock:
+            if self._building:
+                self._pending[key] = (vector, section_name)
+            elif self.built:
+                self._upsert(key, vector, section_name)
+                if len(self._rows) >= max(self.train_threshold, 2 * self._trained_size):
+                    self._schedule_training()
+
+    def _upsert(self, key, vector, section_name):
+        # Caller holds the lock
+        row = self._rows.get(key)
+        if row is not None:
+            self._unlink(row)
+        elif self._free:
+            row = self._free.pop()
+        else:
+            row = len(self._keys)
+            if row >= len(self._vectors):
+                # Grow geometrically so inserts stay amortised O(1)
+                capacity = max(64, 2 * len(self._vectors))
+                vectors = np.empty((capacity, EMBEDDING_DIM), dtype=np.float32)
+                vectors[:len(self._vectors)] = self._vectors
+                sq_norms = np.zeros(capacity, dtype=np.float32)
+                sq_norms[:len(self._sq_norms)] = self._sq_norms
+                self._vectors, self._sq_norms = vectors, sq_norms
+            self._keys.append(None)
+
+        self._vectors[row] = vector
+        self._sq_norms[row] = vector @ vector
+        self._keys[row] = key
+        self._rows[key] = row
+        self._set_section(key, section_name)
+        self._stats['upserts'] += 1
+        if self._dirty is not None:
+            self._dirty.add(row)
+
+        if self._centroids is not None:
+            self._link(row)
+
+    def _set_section(self, key, section_name):
+        if section_name:
+            self._sections[key] = section_name
+        else:
+            self._sections.pop(key, None)
+
+    def move(self, key, section_name):
+        """Records a student's new section without touching the embedding."""
+        with self._lock:
+            if self._building and key in self._pending:
+                if self._pending[key] is not None:
+                    self._pending[key] = (self._pending[key][0], section_name)
+            elif key in self._rows:
+                self._set_section(key, section_name)
+
+    def remove(self, key):
+        with self._lock:
+            if self._building:
+                self._pending[key] = None
+            elif self.built:
+                self._remove(key)
+
+    def _remove(self, key):
+        # Caller holds the lock
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self._unlink(row)
+        self._keys[row] = None
+        self._sections.pop(key, None)
+        self._free.append(row)
+        self._stats['removals'] += 1
+        if self._dirty is not None:
+            self._dirty.add(row)
+
+    def search(self, encoding, k=5, nprobe=None):
+        """
+        Returns up to k nearest enrolled faces as [{'role', 'id', 'section', 'distance'}],
+        closest first. Empty until the index is built.
+        """
+        query = np.asarray(encoding, dtype=np.float32).reshape(EMBEDDING_DIM)
+
+        with self._lock:
+            self._stats['searches'] += 1
+            if self._centroids is None:
+                candidates = np.fromiter(self._rows.values(), dtype=np.intp)
+                sq_dist = self._sq_norms[candidates] - 2.0 * (self._vectors[candidates] @ query)
+            else:
+                probes = min(nprobe or self.nprobe, len(self._centroids))
+                centroid_scores = self._centroid_sq_norms - 2.0 * (self._centroids @ query)
+                nearest = np.argpartition(centroid_scores, probes - 1)[:probes]
+                blocks = [self._list_block(int(c)) for c in nearest]
+                candidates = np.concatenate([rows for rows, _, _ in blocks])
+                sq_dist = np.concatenate([norms - 2.0 * (vectors @ query) for _, vectors, norms in blocks])
+            if len(candidates) == 0:
+                return []
+
+            sq_dist += query @ query
+            k = min(k, len(candidates))
+            top = np.argpartition(sq_dist, k - 1)[:k]
+            top = top[np.argsort(sq_dist[top])]
+            results = []
+            for i in top:
+                key = self._keys[candidates[i]]
+                results.append({'role': key[0], 'id': key[1], 'section': self._sections.get(key),
+                                'distance': float(np.sqrt(max(sq_dist[i], 0.0)))})
+            return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'built': self.built,
+                'size': len(self._rows),
+                'partitions': 0 if self._centroids is None else len(self._centroids),
+                'trained_size': self._trained_size,
+                'training': self._dirty is not None,
+            }
+
+
+campus_index = CampusIndex()
+registry.register_collector('recognition_campus_index', campus_index.stats)
+
+
+def apply_gallery_change(change):
+    """
+    Applies a gallery change published by another worker: drops the affected
+    section's gallery and refreshes the member's campus index entry.
+    """
+    if change.get('origin') == WORKER_ID:
+        return
+    if change.get('section'):
+        clear_cache(change['section'])
+    if change.get('id') and campus_index.enabled:
+        key = (change.get('role', 'student'), change['id'])
+        if change.get('action') == 'delete':
+            campus_index.remove(key)
+        else:
+            _refresh_campus_entry(key)
+
+
+def _refresh_campus_entry(key):
+    role, member_id = key
+    if role == 'faculty':
+        sql = "SELECT facial_embedding, NULL AS section_name FROM faculty WHERE faculty_id = %s"
     else:
-        known_faces_cache.clear()
+        sql = "SELECT facial_embedding, section_name FROM students WHERE roll_number = %s"
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, (member_id,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+
+    if row and row['facial_embedding']:
+        vectors, ok = decode_embeddings([row['facial_embedding']])
+        if ok[0]:
+            campus_index.upsert(key, vectors[0], row['section_name'])
+            return
+    campus_index.remove(key)
+
+
+class GalleryWarmup:
+    """
+    Preloads the galleries of sections expected to be active so the first frame of
+    a class does not pay for a cold load_known_students.
+
+    Sections come from a `class_schedule` table (section_name, day_of_week 0=Monday,
+    start_time) when one exists: today's classes, earliest first, re-checked every
+    `interval` seconds for classes starting within `lookahead` seconds. Without a
+    schedule every section in faculty_subjects is loaded once, busiest first.
+    """
+
+    def __init__(self, max_sections=200, interval=300, lookahead=900):
+        self.max_sections = max_sections
+        self.interval = interval
+        self.lookahead = lookahead
+        self._lock = threading.Lock()
+        self._status = {'ready': False, 'sections_loaded': 0, 'errors': 0,
+                        'started_at': None, 'finished_at': None, 'scheduled': False}
+
+    def init_app(self, app):
+        self.max_sections = app.config.get('GALLERY_WARMUP_MAX_SECTIONS', self.max_sections)
+
+    def start(self, app):
+        if not app.config.get('GALLERY_WARMUP') or not app.config.get('DATABASE_URL'):
+            self._set(ready=True)
+            return
+        if multiprocessing.parent_process() is not None:
+            return
+        from app.extensions import socketio
+        socketio.start_background_task(self._run)
+
+    def _set(self, **values):
+        with self._lock:
+            self._status.update(values)
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def _query(self, sql, params=()):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def _has_schedule(self):
+        rows = self._query("SELECT to_regclass('class_schedule') IS NOT NULL AS present")
+        return bool(rows and rows[0]['present'])
+
+    def _scheduled_sections(self, within=None):
+        sql = """
+            SELECT section_name, MIN(start_time) AS first_start
+            FROM class_schedule
+            WHERE day_of_week = EXTRACT(ISODOW FROM CURRENT_DATE) - 1
+        """
+        params = ()
+        if within is not None:
+            sql += " AND start_time BETWEEN LOCALTIME AND LOCALTIME + %s * INTERVAL '1 second'"
+            params = (within,)
+        sql += " GROUP BY section_name ORDER BY first_start"
+        return [row['section_name'] for row in self._query(sql, params)]
+
+    def _assigned_sections(self):
+        rows = self._query("""
+            SELECT section_name, COUNT(*) AS classes
+            FROM faculty_subjects
+            GROUP BY section_name
+            ORDER BY classes DESC
+        """)
+        return [row['section_name'] for row in rows]
+
+    def _warm(self, sections):
+        for section_name in sections[:self.max_sections]:
+            if section_name in gallery_cache:
+                continue
+            try:
+                load_known_students(section_name)
+                with self._lock:
+                    self._status['sections_loaded'] += 1
+            except Exception as e:
+                logger.warning("Warm-up failed for section %s: %s", section_name, e)
+                with self._lock:
+                    self._status['errors'] += 1
+            # Stop before warm-up starts evicting the galleries it just loaded
+            cache = gallery_cache.stats()
+            if cache['bytes'] >= 0.9 * cache['max_bytes']:
+                break
+
+    def _run(self):
+        self._set(started_at=time.time())
+        scheduled = False
+        try:
+            scheduled = self._has_schedule()
+            self._warm(self._scheduled_sections() if scheduled else self._assigned_sections())
+        except Exception:
+            logger.exception("Gallery warm-up failed")
+            with self._lock:
+                self._status['errors'] += 1
+        finally:
+            self._set(ready=True, finished_at=time.time(), scheduled=scheduled)
+
+        while scheduled:
+            time.sleep(self.interval)
+            try:
+                self._warm(self._scheduled_sections(within=self.lookahead))
+            except Exception:
+                logger.exception("Scheduled gallery warm-up failed")
+
+
+gallery_warmup = GalleryWarmup()
+registry.register_collector('recognition_warmup', gallery_warmup.status)
+
+
+def resync_galleries():
+    """
+    Called whenever the gallery listener (re)connects: changes published while it
+    was not listening are unknown, so every cached gallery is dropped and a loaded
+    campus index is rebuilt.
+    """
+    clear_cache()
+    if campus_index.built:
+        campus_index.build()
+
+
+def start_gallery_listener(app):
+    """Starts the background listener that keeps this worker's galleries in sync."""
+    if not app.config.get('GALLERY_NOTIFY') or not app.config.get('DATABASE_URL'):
+        return
+    if multiprocessing.parent_process() is not None:
+        # Spawned recognition pool processes re-import the app; they hold no galleries
+        return
+    from app.extensions import socketio
+    socketio.start_background_task(listen, GALLERY_CHANNEL, apply_gallery_change, on_connect=resync_galleries)
+
+
+class RecognitionBusy(Exception):
+    """Raised when the recognition queue is full and a frame has to be rejected."""
+
+
+DEFAULT_DETECTION_PROFILE = {'scale': 1.0, 'upsample': 1, 'model': 'hog', 'num_jitters': 1}
+
+
+class DetectionProfiles:
+    """
+    Detection/encoding settings per section, falling back to a global default:
+    scale (detection runs on a resized copy), upsample (number_of_times_to_upsample),
+    model ('hog' or 'cnn') and num_jitters (passed to face_encodings).
+    Profiles are validated when the config is loaded, so a bad value fails at startup
+    rather than inside a pool process.
+    """
+
+    def __init__(self):
+        self.default = dict(DEFAULT_DETECTION_PROFILE)
+        self.sections = {}
+
+    def init_app(self, app):
+        default = {**DEFAULT_DETECTION_PROFILE, **app.config.get('DETECTION_PROFILE', {})}
+        validate_detection_profile(default, 'DETECTION_PROFILE')
+        sections = dict(app.config.get('SECTION_DETECTION_PROFILES', {}))
+        for section_name, overrides in sections.items():
+            if not isinstance(overrides, dict):
+                raise ValueError(f"SECTION_DETECTION_PROFILES[{section_name!r}] must be an object")
+            validate_detection_profile({**default, **overrides}, f"SECTION_DETECTION_PROFILES[{section_name!r}]")
+        self.default, self.sections = default, sections
+
+    def get(self, section_name):
+        profile = dict(self.default)
+        profile.update(self.sections.get(section_name, {}))
+        return profile
+
+
+def validate_detection_profile(profile, where):
+    """Raises ValueError naming `where` unless every value of a detection profile is usable."""
+    unknown = set(profile) - set(DEFAULT_DETECTION_PROFILE)
+    if unknown:
+        raise ValueError(f"{where}: unknown detection settings {sorted(unknown)}")
+    scale, upsample, num_jitters = profile['scale'], profile['upsample'], profile['num_jitters']
+    if isinstance(scale, bool) or not isinstance(scale, (int, float)) or not 0 < scale <= 1:
+        raise ValueError(f"{where}: scale must be a number in (0, 1], got {scale!r}")
+    if isinstance(upsample, bool) or not isinstance(upsample, int) or upsample < 0:
+        raise ValueError(f"{where}: upsample must be a non-negative integer, got {upsample!r}")
+    if profile['model'] not in ('hog', 'cnn'):
+        raise ValueError(f"{where}: model must be 'hog' or 'cnn', got {profile['model']!r}")
+    if isinstance(num_jitters, bool) or not isinstance(num_jitters, int) or num_jitters < 1:
+        raise ValueError(f"{where}: num_jitters must be a positive integer, got {num_jitters!r}")
+
+
+detection_profiles = DetectionProfiles()
+
+
+def detect_faces(img, profile):
+    """
+    Runs face detection on a downscaled copy of img (per profile['scale']) and maps
+    the boxes back to full-resolution (top, right, bottom, left) coordinates.
+    """
+    scale = profile['scale']
+    small = img
+    if scale < 1:
+        small = cv2.resize(img, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    locations = face_recognition.face_locations(small, number_of_times_to_upsample=profile['upsample'],
+                                                model=profile['model'])
+    if scale == 1:
+        return locations
+
+    height, width = img.shape[:2]
+    return [(max(0, int(round(top / scale))), min(width, int(round(right / scale))),
+             min(height, int(round(bottom / scale))), max(0, int(round(left / scale))))
+            for top, right, bottom, left in locations]
+
+
+def _detect_and_encode(img, submitted_at, profile=None, skip_boxes=None, iou_threshold=0.5):
+    """
+    Runs inside a pool process: detection followed by the 128-d encodings.
+    Detections overlapping one of `skip_boxes` (faces the caller is already tracking)
+    are not encoded. Returns locations, the indices that were encoded, their float32
+    encoding matrix and the time spent in each stage.
+    """
+    profile = profile or DEFAULT_DETECTION_PROFILE
+    started_at = time.time()
+    face_locations = detect_faces(img, profile)
+    detected_at = time.time()
+    mask = encode_mask(face_locations, skip_boxes, iou_threshold)
+    encoded_idx = [index for index, needed in enumerate(mask) if needed]
+    face_encodings = face_recognition.face_encodings(img, [face_locations[index] for index in encoded_idx],
+                                                     num_jitters=profile['num_jitters'])
+    encoded_at = time.time()
+
+    encodings = np.asarray(face_encodings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    timings = {
+        'queue_wait': started_at - submitted_at,
+        'detect': detected_at - started_at,
+        'encode': encoded_at - detected_at,
+    }
+    return face_locations, encoded_idx, encodings, timings
+
+
+def _detect(img, submitted_at, profile):
+    """Pool task for the batched path: detection only, encodings follow in a batch."""
+    started_at = time.time()
+    face_locations = detect_faces(img, profile)
+    return face_locations, {'queue_wait': started_at - submitted_at, 'detect': time.time() - started_at}
+
+
+def crop_faces(img, face_locations, padding=0.5):
+    """
+    Cuts a crop around each box, padded by `padding` x the box size so the landmark
+    model still sees the whole face. Returns the crops and each box relative to its crop.
+    """
+    height, width = img.shape[:2]
+    crops, locations = [], []
+    for top, right, bottom, left in face_locations:
+        pad_y = int((bottom - top) * padding)
+        pad_x = int((right - left) * padding)
+        y0, y1 = max(0, top - pad_y), min(height, bottom + pad_y)
+        x0, x1 = max(0, left - pad_x), min(width, right + pad_x)
+        crops.append(np.ascontiguousarray(img[y0:y1, x0:x1]))
+        locations.append((top - y0, right - x0, bottom - y0, left - x0))
+    return crops, locations
+
+
+def _batched_descriptors_supported():
+    """dlib >= 19.14 has a compute_face_descriptor overload taking lists of images and landmarks."""
+    try:
+        import dlib
+    except ImportError:
+        return False
+    return 'batch_faces' in (dlib.face_recognition_model_v1.compute_face_descriptor.__doc__ or '')
+
+
+# Checked once per process; pool processes import this module at spawn
+BATCHED_DESCRIPTORS = _batched_descriptors_supported()
+
+
+def _encode_group(crops, locations, num_jitters):
+    if not BATCHED_DESCRIPTORS:
+        # Older dlib builds without the batched overload: encode crop by crop
+        return np.asarray([face_recognition.face_encodings(crop, [location], num_jitters=num_jitters)[0]
+                           for crop, location in zip(crops, locations)])
+
+    import dlib
+    batch_faces = []
+    for crop, (top, right, bottom, left) in zip(crops, locations):
+        # Same 5-point landmarks face_recognition.face_encodings uses (model="small")
+        shapes = dlib.full_object_detections()
+        shapes.append(face_recognition.api.pose_predictor_5_point(crop, dlib.rectangle(left, top, right, bottom)))
+        batch_faces.append(shapes)
+    # One call for every crop in the group
+    descriptors = face_recognition.api.face_encoder.compute_face_descriptor(crops, batch_faces, num_jitters)
+    return np.asarray([np.array(vectors[0]) for vectors in descriptors])
+
+
+def _encode_batch(crops, locations, jitters):
+    """Pool task: encodes face crops collected from several sessions in one go."""
+    started_at = time.time()
+    encodings = np.empty((len(crops), EMBEDDING_DIM), dtype=np.float32)
+    for num_jitters in set(jitters):
+        indices = [index for index, value in enumerate(jitters) if value == num_jitters]
+        encodings[indices] = _encode_group([crops[index] for index in indices],
+                                           [locations[index] for index in indices], num_jitters)
+    return encodings, time.time() - started_at
+
+
+class EncodingBatcher:
+    """
+    Micro-batches encoding work across Socket.IO sessions.
+
+    Crops queued by concurrent frames are held for at most `max_wait` seconds (or until
+    `max_batch` faces are waiting) and then encoded by a single pool task; results are
+    scattered back to each waiting caller.
+    """
+
+    def __init__(self, call, max_batch=32, max_wait=0.005):
+        self._call = call
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._queue = []
+        self._flusher = None
+        self.batch_sizes = registry.histogram('recognition_batch_size', SIZE_BUCKETS,
+                                              'Faces encoded per batched pool task')
+        self.queue_waits = registry.histogram('recognition_batch_queue_wait_seconds', LATENCY_BUCKETS,
+                                              'Time crops wait for their encoding batch to be dispatched')
+
+    def encode(self, crops, locations, num_jitters, timeout):
+        """Returns ((encodings, encode_seconds), batch_wait_seconds) for the given crops."""
+        request = {'crops': crops, 'locations': locations, 'num_jitters': num_jitters,
+                   'enqueued_at': time.time(), 'done': threading.Event(), 'result': None, 'error': None}
+        with self._cond:
+            self._queue.append(request)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+            self._cond.notify()
+
+        if not request['done'].wait(timeout):
+            raise FutureTimeoutError()
+        if request['error'] is not None:
+            raise request['error']
+        return request['result'], request['batch_wait']
+
+    def _queued_faces(self):
+        return sum(len(request['crops']) for request in self._queue)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                deadline = self._queue[0]['enqueued_at'] + self.max_wait
+                while self._queued_faces() < self.max_batch:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                # Whole requests only; an oversized request still goes out on its own
+                batch, size = [], 0
+                while self._queue and (not batch or size + len(self._queue[0]['crops']) <= self.max_batch):
+                    request = self._queue.pop(0)
+                    batch.append(request)
+                    size += len(request['crops'])
+
+            threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+
+    def _run_batch(self, batch):
+        dispatched_at = time.time()
+        crops, locations, jitters = [], [], []
+        for request in batch:
+            request['batch_wait'] = dispatched_at - request['enqueued_at']
+            self.queue_waits.observe(request['batch_wait'])
+            crops.extend(request['crops'])
+            locations.extend(request['locations'])
+            jitters.extend([request['num_jitters']] * len(request['crops']))
+        self.batch_sizes.observe(len(crops))
+
+        try:
+            encodings, encode_seconds = self._call(_encode_batch, crops, locations, jitters)
+        except Exception as e:
+            for request in batch:
+                request['error'] = e
+                request['done'].set()
+            return
+
+        offset = 0
+        for request in batch:
+            count = len(request['crops'])
+            request['result'] = (encodings[offset:offset + count], encode_seconds)
+            offset += count
+            request['done'].set()
+
+    def stats(self):
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': round(self.max_wait * 1000, 2),
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_wait_seconds': self.queue_waits.snapshot(),
+        }
+
+
+class RecognitionExecutor:
+    """
+    Process pool that runs dlib detection/encoding off the eventlet hub.
+
+    At most `max_pending` frames may be queued or running at once; anything beyond
+    that is rejected with RecognitionBusy instead of growing the backlog. With
+    `max_workers=0` frames are processed inline (useful for local debugging).
+    When `batch_size` > 1, detection runs per frame and encodings go through an
+    EncodingBatcher shared by all sessions.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, timeout=10.0, batch_size=32, batch_wait=0.005):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'failed': 0,
+            'timed_out': 0,
+            'max_pending_seen': 0,
+            'faces_detected': 0,
+            'faces_encoded': 0,
+        }
+        self._stage_totals = {'queue_wait': 0.0, 'detect': 0.0, 'encode': 0.0, 'round_trip': 0.0}
+        self._last_timings = {}
+        self.batcher = EncodingBatcher(self._call, batch_size, batch_wait)
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('RECOGNITION_WORKERS', self.max_workers)
+        self.max_pending = app.config.get('RECOGNITION_MAX_PENDING', self.max_pending)
+        self.timeout = app.config.get('RECOGNITION_TIMEOUT', self.timeout)
+        self.batcher.max_batch = app.config.get('RECOGNITION_BATCH_SIZE', self.batcher.max_batch)
+        self.batcher.max_wait = app.config.get('RECOGNITION_BATCH_WAIT_MS', self.batcher.max_wait * 1000) / 1000
+
+    def _get_pool(self):
+        if self._pool is None and self.max_workers > 0:
+            # spawn gives clean interpreters, free of the parent's monkey-patched hub
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def process(self, img, profile=None, skip_boxes=None, iou_threshold=0.5):
+        """
+        Detects and encodes the faces in an RGB frame without blocking the hub.
+        Returns (face_locations, encoded_idx, face_encodings, timings).
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise RecognitionBusy(f"{self._pending} frames already queued")
+            self._pending += 1
+            self._stats['submitted'] += 1
+            self._stats['max_pending_seen'] = max(self._stats['max_pending_seen'], self._pending)
+
+        submitted_at = time.time()
+        try:
+            if self._get_pool() is None:
+                result = _detect_and_encode(img, submitted_at, profile, skip_boxes, iou_threshold)
+            elif self.batcher.max_batch > 1:
+                result = self._detect_then_batch(img, submitted_at, profile, skip_boxes, iou_threshold)
+            else:
+                result = self._call(_detect_and_encode, img, submitted_at, profile, skip_boxes, iou_threshold)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats['timed_out'] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats['failed'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        face_locations, encoded_idx, face_encodings, timings = result
+        timings['round_trip'] = time.time() - submitted_at
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['faces_detected'] += len(face_locations)
+            self._stats['faces_encoded'] += len(encoded_idx)
+            for stage, seconds in timings.items():
+                self._stage_totals[stage] = self._stage_totals.get(stage, 0.0) + seconds
+            self._last_timings = timings
+        return face_locations, encoded_idx, face_encodings, timings
+
+    def _call(self, fn, *args):
+        """
+        Runs fn in the pool and waits for its result. Under the eventlet worker the
+        pool's manager thread, its pipes and the future's condition are all green, so
+        the wait parks only the calling green thread. It must not be moved to a native
+        thread (tpool): the green manager thread cannot wake a waiter there.
+        """
+        future = self._get_pool().submit(fn, *args)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def run(self, fn, *args):
+        """Runs a CPU-heavy task other than a frame (e.g. index training) in the pool, or inline without one."""
+        if self._get_pool() is None:
+            return fn(*args)
+        return self._call(fn, *args)
+
+    def _detect_then_batch(self, img, submitted_at, profile, skip_boxes, iou_threshold):
+        profile = profile or DEFAULT_DETECTION_PROFILE
+        face_locations, timings = self._call(_detect, img, submitted_at, profile)
+        mask = encode_mask(face_locations, skip_boxes, iou_threshold)
+        encoded_idx = [index for index, needed in enumerate(mask) if needed]
+
+        encodings = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        timings['encode'] = timings['batch_wait'] = 0.0
+        if encoded_idx:
+            crops, locations = crop_faces(img, [face_locations[index] for index in encoded_idx])
+            (encodings, timings['encode']), timings['batch_wait'] = self.batcher.encode(
+                crops, locations, profile['num_jitters'], self.timeout)
+        return face_locations, encoded_idx, encodings, timings
+
+    def stats(self):
+        with self._lock:
+            completed = self._stats['completed']
+            return {
+                **self._stats,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'workers': self.max_workers,
+                'avg_ms': {stage: round(total * 1000 / completed, 2) if completed else 0
+                           for stage, total in self._stage_totals.items()},
+                'last_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self._last_timings.items()},
+                'batching': self.batcher.stats(),
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+recognition_executor = RecognitionExecutor()
+registry.register_collector('recognition_executor', recognition_executor.stats)
@@ -0,0 +1,150 @@
+import threading
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Intersection-over-union between two lists of face_recognition boxes
+    (top, right, bottom, left). Returns a len(a) x len(b) array.
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+def encode_mask(face_locations, skip_boxes, iou_threshold):
+    """True for every detected box that has no confidently tracked box on top of it."""
+    if not skip_boxes:
+        return [True] * len(face_locations)
+    overlap = iou_matrix(face_locations, skip_boxes)
+    return [bool(best < iou_threshold) for best in overlap.max(axis=1)]
+
+
+class FaceTracker:
+    """
+    IoU tracker over face_recognition boxes for one Socket.IO connection.
+
+    A track whose box keeps overlapping between frames and whose identity has been
+    confirmed by `confirm_hits` agreeing encodings is "locked": its box is reused
+    without re-encoding until it moves, goes missing or `reencode_every` frames pass.
+    """
+
+    def __init__(self, iou_threshold=0.5, confirm_hits=2, max_missed=2, reencode_every=20, min_margin=0.05):
+        self.iou_threshold = iou_threshold
+        self.confirm_hits = confirm_hits
+        self.max_missed = max_missed
+        self.reencode_every = reencode_every
+        self.min_margin = min_margin
+        self.section_name = None
+        self.tracks = []
+
+    def reset(self, section_name=None):
+        self.section_name = section_name
+        self.tracks = []
+
+    def _is_locked(self, track):
+        return (track['student_id'] != "Unknown"
+                and track['hits'] >= self.confirm_hits
+                and track['missed'] == 0
+                and track['since_encode'] < self.reencode_every)
+
+    def skip_boxes(self, only=None):
+        """
+        Boxes of locked tracks; detections on top of these need no encoding. With
+        `only`, just the tracks locked to one of those student ids.
+        """
+        return [track['box'] for track in self.tracks
+                if self._is_locked(track) and (only is None or track['student_id'] in only)]
+
+    def update(self, face_locations, encoded_matches):
+        """
+        Associates this frame's detections with existing tracks.
+        `encoded_matches` maps detection index -> (student_id, distance, margin) for
+        the boxes that were encoded. Returns (student_id, distance, margin, reused) per box.
+        """
+        overlap = iou_matrix(face_locations, [track['box'] for track in self.tracks])
+
+        # Greedy association, best overlap first
+        assigned = {}
+        used_tracks = set()
+        if overlap.size:
+            for flat in np.argsort(overlap, axis=None)[::-1]:
+                det, trk = np.unravel_index(flat, overlap.shape)
+                if overlap[det, trk] < self.iou_threshold:
+                    break
+                if det in assigned or trk in used_tracks:
+                    continue
+                assigned[det] = trk
+                used_tracks.add(trk)
+
+        results = []
+        next_tracks = []
+        for det, box in enumerate(face_locations):
+            track = self.tracks[assigned[det]] if det in assigned else None
+
+            if det in encoded_matches:
+                student_id, distance, margin = encoded_matches[det]
+                confident = student_id != "Unknown" and (margin is None or margin >= self.min_margin)
+                if track is None or not confident or track['student_id'] != student_id:
+                    track = {'student_id': student_id if confident else "Unknown", 'distance': distance,
+                             'margin': margin, 'hits': 1 if confident else 0, 'missed': 0, 'since_encode': 0}
+                else:
+                    track.update(distance=distance, margin=margin, hits=track['hits'] + 1, since_encode=0)
+                results.append((student_id, distance, margin, False))
+            elif track is not None and self._is_locked(track):
+                track['since_encode'] += 1
+                results.append((track['student_id'], track['distance'], track['margin'], True))
+            else:
+                # Skipped by the worker but no longer matches a locked track: re-encode next frame
+                track = {'student_id': "Unknown", 'distance': None, 'margin': None,
+                         'hits': 0, 'missed': 0, 'since_encode': 0}
+                results.append(("Unknown", None, None, False))
+
+            track['box'] = tuple(box)
+            track['missed'] = 0
+            next_tracks.append(track)
+
+        # Keep briefly occluded tracks around, but never reuse them without a fresh overlap
+        for index, track in enumerate(self.tracks):
+            if index not in used_tracks and track['missed'] < self.max_missed:
+                track['missed'] += 1
+                next_tracks.append(track)
+
+        self.tracks = next_tracks
+        return results
+
+
+class TrackerRegistry:
+    """FaceTracker per Socket.IO sid; a tracker is reset when its section changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trackers = {}
+
+    def get(self, sid, section_name):
+        with self._lock:
+            tracker = self._trackers.get(sid)
+            if tracker is None:
+                tracker = self._trackers[sid] = FaceTracker()
+        if tracker.section_name != section_name:
+            tracker.reset(section_name)
+        return tracker
+
+    def discard(self, sid):
+        with self._lock:
+            self._trackers.pop(sid, None)
+
+
+face_trackers = TrackerRegistry()
@@ -0,0 +1,112 @@
+"""
+Shows what a slow query does to everything else on an eventlet worker, with and
+without the cooperative psycopg2 mode (app.db.enable_cooperative_mode).
+
+While --slow-clients green threads run SELECT pg_sleep(--slow-seconds) (standing in
+for a heavy analytics query), --fast-clients green threads each run a trivial query
+in a loop and a heartbeat green thread sleeps 10 ms at a time. Without the wait
+callback, libpq blocks the whole hub during the slow query, so fast-query latency
+and heartbeat lag jump to roughly the slow query's duration. With it, they should
+stay near the network round trip.
+
+Needs DATABASE_URL (the same database the app uses; only read-only queries are run).
+
+    python -m benchmarks.bench_db_cooperative --duration 10 --slow-seconds 2
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.db import get_db_connection, enable_cooperative_mode, disable_cooperative_mode
+
+HEARTBEAT_INTERVAL = 0.01
+
+
+def fast_client(until, latencies):
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        while time.perf_counter() < until:
+            started_at = time.perf_counter()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            latencies.append(time.perf_counter() - started_at)
+            eventlet.sleep(0.005)
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def slow_client(until, slow_seconds):
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        while time.perf_counter() < until:
+            cursor.execute("SELECT pg_sleep(%s)", (slow_seconds,))
+            cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def heartbeat(until, lags):
+    """How late the hub wakes us up: what a live recognition socket would feel."""
+    while time.perf_counter() < until:
+        started_at = time.perf_counter()
+        eventlet.sleep(HEARTBEAT_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - started_at - HEARTBEAT_INTERVAL))
+
+
+def summary(samples):
+    if not samples:
+        return "no samples"
+    return '  '.join(f"p{q} {np.percentile(samples, q) * 1000:8.1f} ms" for q in (50, 95, 99)) + \
+        f"  max {max(samples) * 1000:8.1f} ms  (n={len(samples)})"
+
+
+def run(args, cooperative):
+    if cooperative:
+        if not enable_cooperative_mode():
+            raise SystemExit("eventlet monkey patching is not active; cannot enable cooperative mode")
+    else:
+        disable_cooperative_mode()
+
+    latencies, lags = [], []
+    until = time.perf_counter() + args.duration
+    pool = eventlet.GreenPool()
+    for _ in range(args.slow_clients):
+        pool.spawn(slow_client, until, args.slow_seconds)
+    for _ in range(args.fast_clients):
+        pool.spawn(fast_client, until, latencies)
+    pool.spawn(heartbeat, until, lags)
+    pool.waitall()
+
+    label = 'cooperative' if cooperative else 'blocking'
+    print(f"{label}:")
+    print(f"    fast query   {summary(latencies)}")
+    print(f"    hub lag      {summary(lags)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per mode')
+    parser.add_argument('--fast-clients', type=int, default=8)
+    parser.add_argument('--slow-clients', type=int, default=1)
+    parser.add_argument('--slow-seconds', type=float, default=1.0, help='Duration of each slow query')
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        parser.error("DATABASE_URL is not set")
+
+    run(args, cooperative=False)
+    run(args, cooperative=True)
+
+
+if __name__ == "__main__":
+    main()
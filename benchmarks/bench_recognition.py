@@ -0,0 +1,230 @@
+"""
+Offline benchmark of the frame recognition hot path.
+
+Frames go through the real 'process_frame' handler (frame slots, tracker, worker
+pool, batched encoding, gallery matching, emit) via the Socket.IO test client;
+only load_known_students is replaced by synthetic galleries, so no database is
+needed. Every combination of gallery size, faces per frame and resolution is run
+and reported as frames/sec, per-stage latency percentiles and peak RSS.
+
+`--faces-dir` is a directory of single-person portrait photos (student
+registration photos, LFW, ...) used to composite the classroom frames. With the
+same photos and --seed, results can be compared between commits.
+
+The same frame is sent over and over, so with face tracking on every face locks
+after a couple of frames and is never encoded again: such numbers measure
+detection, not recognition. Tracking is therefore off by default; --tracking on
+(or both) reports the tracked mode as separate scenarios.
+
+    python -m benchmarks.bench_recognition --faces-dir ~/faces --json before.json
+    git checkout my-branch
+    python -m benchmarks.bench_recognition --faces-dir ~/faces --baseline before.json
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app, events
+from app.config import Config
+from app.extensions import socketio
+from app.services.recognition import recognition_executor
+from app.services.tracker import face_trackers
+from benchmarks.synthetic import load_faces, make_gallery, make_classroom
+
+PERCENTILES = (50, 95, 99)
+
+
+class BenchConfig(Config):
+    GALLERY_NOTIFY = False
+    GALLERY_WARMUP = False
+    LOG_LEVEL = 'WARNING'
+
+
+class _NoTrackers:
+    """Stands in for face_trackers so every face is re-encoded on every frame."""
+
+    def get(self, sid, section_name):
+        return None
+
+    def discard(self, sid):
+        pass
+
+
+def parse_sizes(value, cast=int):
+    return [cast(item) for item in value.split(',') if item]
+
+
+def parse_resolution(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def peak_rss_mb(pid=None):
+    """High-water RSS of a process (VmHWM), falling back to getrusage for ourselves."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid is None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+    return None
+
+
+def pool_peak_rss_mb():
+    pool = recognition_executor._pool
+    if pool is None:
+        return 0.0
+    # Pool processes are alive, so RUSAGE_CHILDREN does not cover them yet
+    return sum(peak_rss_mb(pid) or 0.0 for pid in list(pool._processes))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_scenario(app, frame, section_name, width, height, frames, warmup):
+    """Sends `warmup` + `frames` copies of a frame on a fresh connection; returns raw measurements."""
+    stage_samples = {}
+
+    def record_stages(timings):
+        for stage, seconds in timings.items():
+            stage_samples.setdefault(stage, []).append(seconds)
+        observe_stages(timings)
+
+    observe_stages = events.observe_stages  # still feeds /metrics
+    client = socketio.test_client(app)
+    payload = {'image': frame, 'section_name': section_name, 'width': width, 'height': height}
+    try:
+        for _ in range(warmup):
+            client.emit('process_frame', payload)
+        client.get_received()
+
+        events.observe_stages = record_stages
+        failures = recognized = detected = 0
+        started_at = time.perf_counter()
+        for _ in range(frames):
+            client.emit('process_frame', payload)
+        elapsed = time.perf_counter() - started_at
+
+        for message in client.get_received():
+            if message['name'] != 'frame_processed':
+                continue
+            response = message['args'][0]
+            if not response.get('success'):
+                failures += 1
+                continue
+            detected += len(response['faces'])
+            recognized += sum(1 for face in response['faces'] if face['student_id'] != "Unknown")
+    finally:
+        events.observe_stages = observe_stages
+        client.disconnect()
+
+    return {
+        'fps': round(frames / elapsed, 2),
+        'failures': failures,
+        'faces_detected_per_frame': round(detected / frames, 2),
+        'faces_recognized_per_frame': round(recognized / frames, 2),
+        'stages_ms': {
+            stage: {f'p{q}': round(float(np.percentile(samples, q)) * 1000, 2) for q in PERCENTILES}
+            for stage, samples in sorted(stage_samples.items())
+        },
+    }
+
+
+def scenario_key(result):
+    key = f"gallery={result['gallery']} faces={result['faces']} {result['resolution']}"
+    return key + " tracked" if result.get('tracking') else key
+
+
+def print_result(result, baseline=None):
+    line = (f"{scenario_key(result):<40} {result['fps']:>7.2f} fps  "
+            f"detected {result['faces_detected_per_frame']:>5.1f}  recognized {result['faces_recognized_per_frame']:>5.1f}  "
+            f"rss {result['peak_rss_mb']:.0f} MB")
+    if baseline and scenario_key(result) in baseline:
+        before = baseline[scenario_key(result)]['fps']
+        line += f"  ({(result['fps'] - before) / before * 100:+.1f}% vs baseline)"
+    print(line)
+    for stage, percentiles in result['stages_ms'].items():
+        print(f"    {stage:<16} " + '  '.join(f"{name} {value:8.2f} ms" for name, value in percentiles.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--faces-dir', required=True, help='Directory of single-person portrait photos')
+    parser.add_argument('--gallery-sizes', default='30,120,500', help='Students per section gallery')
+    parser.add_argument('--face-counts', default='1,10,30', help='Faces composited into each frame')
+    parser.add_argument('--resolutions', default='640x480,1280x720', help='Frame sizes, WIDTHxHEIGHT')
+    parser.add_argument('--frames', type=int, default=20, help='Measured frames per scenario')
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured frames per scenario')
+    parser.add_argument('--workers', type=int, default=Config.RECOGNITION_WORKERS,
+                        help='Recognition pool size (0 = inline)')
+    parser.add_argument('--tracking', choices=('off', 'on', 'both'), default='off',
+                        help='Face tracking between frames (off: every face is encoded on every frame)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare frames/sec against')
+    args = parser.parse_args()
+
+    BenchConfig.RECOGNITION_WORKERS = args.workers
+    app = create_app(BenchConfig)
+
+    faces = load_faces(args.faces_dir)
+    print(f"Loaded {len(faces)} portrait faces from {args.faces_dir}")
+
+    gallery_sizes = parse_sizes(args.gallery_sizes)
+    galleries = {f"BENCH{size}": make_gallery(faces, size, args.seed) for size in gallery_sizes}
+    events.load_known_students = lambda section_name: galleries[section_name]
+    tracking_modes = {'off': [False], 'on': [True], 'both': [False, True]}[args.tracking]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {scenario_key(result): result for result in json.load(f)['scenarios']}
+
+    results = []
+    try:
+        for size, face_count, resolution, tracking in itertools.product(
+                gallery_sizes, parse_sizes(args.face_counts), parse_sizes(args.resolutions, parse_resolution),
+                tracking_modes):
+            width, height = resolution
+            frame = make_classroom(faces, face_count, width, height, args.seed)
+            events.face_trackers = face_trackers if tracking else _NoTrackers()
+            result = {'gallery': size, 'faces': face_count, 'resolution': f"{width}x{height}",
+                      'tracking': tracking, 'frame_bytes': len(frame)}
+            result.update(run_scenario(app, frame, f"BENCH{size}", width, height, args.frames, args.warmup))
+            result['peak_rss_mb'] = round(peak_rss_mb() + pool_peak_rss_mb(), 1)
+            results.append(result)
+            print_result(result, baseline)
+    finally:
+        recognition_executor.shutdown()
+
+    if args.json:
+        report = {
+            'revision': git_revision(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': {key: value for key, value in vars(args).items() if key not in ('json', 'baseline')},
+            'scenarios': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
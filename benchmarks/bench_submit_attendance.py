@@ -0,0 +1,97 @@
+"""
+Measures faculty.submit_attendance's database work for classes of 30, 120 and 500
+students: the old one-INSERT-per-student loop against the single multi-row upsert
+(app/services/attendance_store.write_attendance), each in one transaction.
+
+Runs against DATABASE_URL (ideally the remote database, where round trips
+dominate) inside a transaction that is rolled back at the end; the throwaway
+section, subject, faculty and students it creates are never committed. Needs the
+unique index from migrations/0001 and the attendance_summary table and trigger from 0003
+(python scripts/migrate_pg.py).
+
+    python -m benchmarks.bench_submit_attendance --sizes 30,120,500 --repeats 5
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.db import get_db_connection
+from app.services.attendance_store import write_attendance
+
+BENCH_SECTION = 'BENCH'
+BENCH_FACULTY = 'BENCHFAC'
+
+
+def insert_per_row(cursor, faculty_id, subject_id, present_students, absent_students):
+    """The previous implementation: one round trip per student."""
+    for status, students in (('Present', present_students), ('Absent', absent_students)):
+        for student_id in students:
+            cursor.execute("""
+                INSERT INTO attendance (roll_number, subject_id, date, status, faculty_id)
+                VALUES (%s, %s, CURRENT_DATE, %s, %s)
+            """, (student_id, subject_id, status, faculty_id))
+
+
+def setup(cursor, size):
+    cursor.execute("INSERT INTO sections (section_name) VALUES (%s) ON CONFLICT DO NOTHING", (BENCH_SECTION,))
+    cursor.execute("INSERT INTO subjects (subject_name) VALUES ('Benchmark') RETURNING subject_id")
+    subject_id = cursor.fetchone()['subject_id']
+    cursor.execute("""
+        INSERT INTO faculty (faculty_id, name, email, password_hash) VALUES (%s, 'Bench', 'bench@example.com', '-')
+        ON CONFLICT DO NOTHING
+    """, (BENCH_FACULTY,))
+    roll_numbers = [f"BENCH{index:05d}" for index in range(size)]
+    for roll_number in roll_numbers:
+        cursor.execute("""
+            INSERT INTO students (roll_number, name, email, password_hash, section_name)
+            VALUES (%s, 'Bench', 'bench@example.com', '-', %s) ON CONFLICT DO NOTHING
+        """, (roll_number, BENCH_SECTION))
+    return subject_id, roll_numbers
+
+
+def timed(cursor, write, subject_id, roll_numbers):
+    present = roll_numbers[:int(len(roll_numbers) * 0.85)]
+    absent = roll_numbers[len(present):]
+    cursor.execute("SAVEPOINT bench_write")
+    started_at = time.perf_counter()
+    write(cursor, BENCH_FACULTY, subject_id, present, absent)
+    elapsed = time.perf_counter() - started_at
+    cursor.execute("ROLLBACK TO SAVEPOINT bench_write")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='30,120,500', help='Students per class')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        started_at = time.perf_counter()
+        cursor.execute("SELECT 1")
+        print(f"Round trip to the database: {(time.perf_counter() - started_at) * 1000:.1f} ms")
+
+        for size in [int(value) for value in args.sizes.split(',') if value]:
+            subject_id, roll_numbers = setup(cursor, size)
+            results = {}
+            for name, write in (('per-row INSERT', insert_per_row), ('bulk upsert', write_attendance)):
+                samples = [timed(cursor, write, subject_id, roll_numbers) for _ in range(args.repeats)]
+                results[name] = float(np.median(samples))
+            speedup = results['per-row INSERT'] / results['bulk upsert']
+            print(f"{size:>4} students: " + '  '.join(f"{name} {seconds * 1000:8.1f} ms"
+                                                    for name, seconds in results.items())
+                  + f"  ({speedup:.1f}x)")
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
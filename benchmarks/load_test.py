@@ -0,0 +1,225 @@
+"""
+Socket.IO load generator for a running AttendEase instance.
+
+Starts N simulated mark_attendance clients, each emitting 'process_frame' at
+--rate frames/sec with JPEGs cycled from --images-dir, and measures the round trip
+to 'frame_processed', the share of frames that never got an answer (superseded by
+a newer frame, rejected as busy or failed) and the server's CPU use. Concurrency
+ramps from --start by --step clients until the latency SLO or the drop budget is
+broken, and the report gives the highest concurrency that still met both.
+
+Needs the Socket.IO client extras: pip install "python-socketio[client]"
+
+    gunicorn --worker-class eventlet -w 1 run:app &
+    python -m benchmarks.load_test --images-dir ~/classroom-jpegs --section A \\
+        --server-pid $(pgrep -of 'gunicorn.*run:app') --slo-p95-ms 800 --json capacity.json
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import numpy as np
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def process_tree(pid):
+    """pid plus all of its descendants (the recognition pool processes), from /proc."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; fields after ')' are fixed
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def cpu_seconds(pid):
+    """User + system CPU seconds used so far by pid and its descendants."""
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])  # utime, stime
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / CLOCK_TICKS
+
+
+class LoadClient:
+    """One simulated mark_attendance page streaming frames at a fixed rate."""
+
+    def __init__(self, url, images, section_name, rate, offset=0):
+        self.url = url
+        self.images = images
+        self.section_name = section_name
+        self.interval = 1.0 / rate
+        self.offset = offset
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('frame_processed', self._on_processed)
+        self._lock = threading.Lock()
+        self._sent_at = {}   # seq -> send time
+        self.latencies = []
+        self.sent = 0
+        self.busy = 0
+        self.failed = 0
+
+    def _on_processed(self, response):
+        received_at = time.perf_counter()
+        with self._lock:
+            sent_at = self._sent_at.pop(response.get('seq'), None)
+            if sent_at is None:
+                return
+            if response.get('busy'):
+                self.busy += 1
+            elif not response.get('success'):
+                self.failed += 1
+            else:
+                self.latencies.append(received_at - sent_at)
+
+    def run(self, until):
+        self.sio.connect(self.url, transports=['websocket'])
+        try:
+            seq = 0
+            next_at = time.perf_counter()
+            while next_at < until:
+                seq += 1
+                with self._lock:
+                    self._sent_at[seq] = time.perf_counter()
+                    self.sent += 1
+                self.sio.emit('process_frame', {
+                    'image': self.images[(self.offset + seq) % len(self.images)],
+                    'section_name': self.section_name,
+                    'seq': seq,
+                })
+                next_at += self.interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            # Let in-flight frames come back before counting them as dropped
+            deadline = time.perf_counter() + 5
+            while self._sent_at and time.perf_counter() < deadline:
+                time.sleep(0.05)
+        finally:
+            self.sio.disconnect()
+
+
+def run_step(args, images, clients, server_pid):
+    """Runs `clients` concurrent clients for args.duration seconds and summarises the step."""
+    load_clients = [LoadClient(args.url, images, args.section, args.rate, offset=index * 7)
+                    for index in range(clients)]
+    cpu_before = cpu_seconds(server_pid) if server_pid else None
+    started_at = time.perf_counter()
+    until = started_at + args.duration
+    threads = [threading.Thread(target=client.run, args=(until,), daemon=True) for client in load_clients]
+    for thread in threads:
+        thread.start()
+        # Spread connection setup so clients don't send in lockstep
+        time.sleep(min(0.05, 1.0 / args.rate / max(clients, 1)))
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    latencies = [value for client in load_clients for value in client.latencies]
+    sent = sum(client.sent for client in load_clients)
+    step = {
+        'clients': clients,
+        'sent': sent,
+        'answered': len(latencies),
+        'busy': sum(client.busy for client in load_clients),
+        'failed': sum(client.failed for client in load_clients),
+        'drop_rate': round(1 - len(latencies) / sent, 4) if sent else 0.0,
+        'throughput_fps': round(len(latencies) / elapsed, 2),
+        'latency_ms': {f'p{q}': round(float(np.percentile(latencies, q)) * 1000, 1) if latencies else None
+                       for q in (50, 95, 99)},
+        'server_cpu_percent': None,
+    }
+    if server_pid:
+        step['server_cpu_percent'] = round((cpu_seconds(server_pid) - cpu_before) / elapsed * 100, 1)
+    return step
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--images-dir', required=True, help='Directory of classroom JPEGs to send')
+    parser.add_argument('--section', required=True, help='Section name sent with every frame')
+    parser.add_argument('--rate', type=float, default=2.0, help='Frames/sec per client (the page sends 2)')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per concurrency step')
+    parser.add_argument('--start', type=int, default=1, help='Clients in the first step')
+    parser.add_argument('--step', type=int, default=2, help='Clients added per step')
+    parser.add_argument('--max-clients', type=int, default=64)
+    parser.add_argument('--slo-p95-ms', type=float, default=1000.0, help='p95 round-trip latency SLO')
+    parser.add_argument('--max-drop-rate', type=float, default=0.1, help='Highest acceptable share of unanswered frames')
+    parser.add_argument('--server-pid', type=int, help='PID of the app server, to report its CPU (Linux only)')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    if socketio is None:
+        parser.error('python-socketio client support is missing: pip install "python-socketio[client]"')
+
+    images = []
+    for file_name in sorted(os.listdir(args.images_dir)):
+        if file_name.lower().endswith(('.jpg', '.jpeg')):
+            with open(os.path.join(args.images_dir, file_name), 'rb') as f:
+                images.append(f.read())
+    if not images:
+        parser.error(f"No JPEGs found in {args.images_dir}")
+
+    steps = []
+    capacity = None
+    clients = args.start
+    while clients <= args.max_clients:
+        step = run_step(args, images, clients, args.server_pid)
+        p95 = step['latency_ms']['p95']
+        step['meets_slo'] = p95 is not None and p95 <= args.slo_p95_ms and step['drop_rate'] <= args.max_drop_rate
+        steps.append(step)
+
+        cpu = f"{step['server_cpu_percent']:.0f}%" if step['server_cpu_percent'] is not None else 'n/a'
+        print(f"{clients:>4} clients: {step['throughput_fps']:>6.1f} fps answered, "
+              f"p50 {step['latency_ms']['p50']} ms, p95 {p95} ms, p99 {step['latency_ms']['p99']} ms, "
+              f"drop {step['drop_rate'] * 100:.1f}%, cpu {cpu}" + ('' if step['meets_slo'] else '  <- SLO broken'))
+
+        if not step['meets_slo']:
+            break
+        capacity = clients
+        clients += args.step
+
+    if capacity is None:
+        print(f"SLO (p95 <= {args.slo_p95_ms:.0f} ms, drop <= {args.max_drop_rate * 100:.0f}%) "
+              f"not met even with {args.start} client(s)")
+    else:
+        print(f"Capacity: {capacity} concurrent sessions at {args.rate} fps within the SLO "
+              f"(p95 <= {args.slo_p95_ms:.0f} ms, drop <= {args.max_drop_rate * 100:.0f}%)")
+
+    if args.json:
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key != 'json'},
+            'capacity': capacity,
+            'steps': steps,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
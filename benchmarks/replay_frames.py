@@ -0,0 +1,161 @@
+"""
+Replays a frame recording (FRAME_RECORD_DIR, see app/services/frame_recorder.py)
+through the 'process_frame' handler offline.
+
+Every recorded session is replayed on its own Socket.IO test client, all of them
+concurrently, at the recorded pace (--speed 1), faster (--speed 4) or as fast as
+each session can go (--speed 0). --copies N multiplies the recorded sessions to
+simulate N times the traffic. Reports frames/sec, per-frame latency and per-stage
+percentiles, busy rejections and peak RSS.
+
+Galleries come from the database (DATABASE_URL) as in production, or, with
+--synthetic-gallery N, from N random embeddings so no database is needed (faces
+are then all "Unknown", but detection and encoding cost is unchanged).
+
+Live attendance sessions are off by default: replayed sockets are not logged in,
+so every frame is fully recognized. With --sessions every replayed copy logs in as
+its own synthetic faculty and gets its own session, as separate classes would;
+recognition then stops for a copy once its roster is complete, as in production.
+
+    python -m benchmarks.replay_frames recordings/20261018-091500-4242 --speed 0 --copies 4
+"""
+try:
+    # Same cooperative threading as the eventlet gunicorn worker
+    import eventlet
+    eventlet.monkey_patch()
+except ImportError:
+    eventlet = None
+
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app, events
+from app.extensions import socketio
+from app.services.frame_recorder import read_recording
+from app.services.recognition import recognition_executor, SectionGallery
+from app.services.embedding_format import EMBEDDING_DIM
+from benchmarks.bench_recognition import BenchConfig, PERCENTILES, peak_rss_mb, pool_peak_rss_mb
+
+
+def load_sessions(path, limit=None):
+    """Groups a recording's frames by recorded session: {session: [(entry, image), ...]}."""
+    sessions = {}
+    for count, (entry, image) in enumerate(read_recording(path)):
+        if limit and count >= limit:
+            break
+        sessions.setdefault(entry['session'], []).append((entry, image))
+    return sessions
+
+
+def percentiles_ms(samples):
+    return {f'p{q}': round(float(np.percentile(samples, q)) * 1000, 2) for q in PERCENTILES} if samples else {}
+
+
+def replay_session(app, frames, speed, results, faculty_id=None):
+    flask_client = None
+    if faculty_id:
+        flask_client = app.test_client()
+        with flask_client.session_transaction() as login:
+            login['id'], login['role'] = faculty_id, 'faculty'
+    client = socketio.test_client(app, flask_test_client=flask_client)
+    first_at = frames[0][0]['t']
+    started_at = time.perf_counter()
+    try:
+        for entry, image in frames:
+            if speed > 0:
+                delay = (entry['t'] - first_at) / speed - (time.perf_counter() - started_at)
+                if delay > 0:
+                    socketio.sleep(delay)
+            payload = {key: entry.get(key) for key in ('section_name', 'faculty_id', 'subject_id', 'width', 'height')}
+            payload['image'] = image
+
+            sent_at = time.perf_counter()
+            client.emit('process_frame', payload)
+            results['latencies'].append(time.perf_counter() - sent_at)
+
+            for message in client.get_received():
+                if message['name'] != 'frame_processed':
+                    continue
+                response = message['args'][0]
+                if response.get('busy'):
+                    results['busy'] += 1
+                elif not response.get('success'):
+                    results['failed'] += 1
+                else:
+                    results['faces'] += len(response['faces'])
+    finally:
+        client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', help='Recording name, with or without .frames/.idx')
+    parser.add_argument('--speed', type=float, default=1.0, help='Pace multiplier; 0 = as fast as possible')
+    parser.add_argument('--copies', type=int, default=1, help='Replay every recorded session this many times at once')
+    parser.add_argument('--limit', type=int, help='Only replay the first N frames of the recording')
+    parser.add_argument('--workers', type=int, default=BenchConfig.RECOGNITION_WORKERS,
+                        help='Recognition pool size (0 = inline)')
+    parser.add_argument('--sessions', action='store_true',
+                        help='Track attendance per replayed copy (stops recognizing complete rosters)')
+    parser.add_argument('--synthetic-gallery', type=int, metavar='N',
+                        help='Use N random embeddings per section instead of the database')
+    args = parser.parse_args()
+
+    BenchConfig.RECOGNITION_WORKERS = args.workers
+    app = create_app(BenchConfig)
+
+    sessions = load_sessions(args.recording, args.limit)
+    total_frames = sum(len(frames) for frames in sessions.values()) * args.copies
+    print(f"Replaying {len(sessions)} sessions x {args.copies} copies ({total_frames} frames) "
+          f"at {'max' if args.speed == 0 else f'{args.speed}x'} speed")
+
+    if args.synthetic_gallery:
+        rng = np.random.default_rng(0)
+        encodings = rng.standard_normal((args.synthetic_gallery, EMBEDDING_DIM)).astype(np.float32)
+        encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+        gallery = SectionGallery(encodings, [f"SYN{index:05d}" for index in range(args.synthetic_gallery)])
+        events.load_known_students = lambda section_name: gallery
+
+    stage_samples = {}
+    observe_stages = events.observe_stages
+
+    def record_stages(timings):
+        for stage, seconds in timings.items():
+            stage_samples.setdefault(stage, []).append(seconds)
+        observe_stages(timings)
+
+    events.observe_stages = record_stages
+    results = {'latencies': [], 'busy': 0, 'failed': 0, 'faces': 0}
+    started_at = time.perf_counter()
+    try:
+        threads = [threading.Thread(target=replay_session, args=(
+                       app, frames, args.speed, results, f"replay-{session}-{copy}" if args.sessions else None))
+                   for session, frames in sessions.items() for copy in range(args.copies)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+        rss = peak_rss_mb() + pool_peak_rss_mb()
+    finally:
+        events.observe_stages = observe_stages
+        recognition_executor.shutdown()
+
+    processed = len(results['latencies'])
+    print(f"{processed} frames in {elapsed:.1f} s: {processed / elapsed:.2f} fps, "
+          f"{results['busy']} busy, {results['failed']} failed, "
+          f"{results['faces'] / max(processed, 1):.1f} faces/frame, peak rss {rss:.0f} MB")
+    print(f"    {'frame':<16} " + '  '.join(f"{name} {value:8.2f} ms"
+                                           for name, value in percentiles_ms(results['latencies']).items()))
+    for stage, samples in sorted(stage_samples.items()):
+        print(f"    {stage:<16} " + '  '.join(f"{name} {value:8.2f} ms"
+                                               for name, value in percentiles_ms(samples).items()))
+
+
+if __name__ == "__main__":
+    main()
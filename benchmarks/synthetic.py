@@ -0,0 +1,97 @@
+"""
+Synthetic classrooms for the recognition benchmarks: section galleries of a given
+size and composite classroom frames with a given number of faces and resolution.
+
+Everything is derived from a seed and a directory of portrait photos, so the same
+arguments produce byte-identical frames and galleries on every run and commit.
+"""
+import os
+import cv2
+import numpy as np
+import face_recognition
+from app.services.embedding_format import EMBEDDING_DIM
+from app.services.recognition import SectionGallery
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def load_faces(faces_dir, limit=None):
+    """
+    Loads portrait photos and crops the single face in each.
+    Returns a list of (name, rgb_crop, encoding), sorted by file name.
+    """
+    faces = []
+    for file_name in sorted(os.listdir(faces_dir)):
+        if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        img = face_recognition.load_image_file(os.path.join(faces_dir, file_name))
+        locations = face_recognition.face_locations(img)
+        if len(locations) != 1:
+            print(f"Skipping {file_name}: {len(locations)} faces found")
+            continue
+        encoding = face_recognition.face_encodings(img, locations)[0]
+
+        # Keep some context around the box, as a webcam would see it
+        top, right, bottom, left = locations[0]
+        pad_y, pad_x = (bottom - top) // 2, (right - left) // 2
+        crop = img[max(0, top - pad_y):bottom + pad_y, max(0, left - pad_x):right + pad_x]
+        faces.append((os.path.splitext(file_name)[0], crop, np.asarray(encoding, dtype=np.float32)))
+        if limit and len(faces) >= limit:
+            break
+
+    if not faces:
+        raise ValueError(f"No usable single-face photos found in {faces_dir}")
+    return faces
+
+
+def make_gallery(faces, size, seed=0):
+    """
+    A SectionGallery of `size` students: the real encodings of `faces` first (so the
+    faces in generated frames are recognized), padded with random unit vectors,
+    which are far (~1.4) from any real face and never match.
+    """
+    rng = np.random.default_rng(seed)
+    known = [(name, encoding) for name, _, encoding in faces[:size]]
+    filler = rng.standard_normal((size - len(known), EMBEDDING_DIM)).astype(np.float32)
+    filler /= np.linalg.norm(filler, axis=1, keepdims=True)
+
+    ids = [name for name, _ in known] + [f"SYN{index:05d}" for index in range(len(filler))]
+    encodings = np.vstack([np.array([encoding for _, encoding in known], dtype=np.float32).reshape(-1, EMBEDDING_DIM),
+                           filler])
+    return SectionGallery(encodings, ids)
+
+
+def make_classroom(faces, face_count, width, height, seed=0, quality=80):
+    """
+    Composites `face_count` faces onto a width x height frame laid out in rows like
+    a lecture hall (smaller faces towards the back) and returns it as JPEG bytes.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Soft vertical gradient plus sensor noise, so JPEG size is realistic
+    gradient = np.linspace(170, 90, height, dtype=np.float32)[:, None, None]
+    frame = np.repeat(np.repeat(gradient, width, axis=1), 3, axis=2)
+    frame += rng.normal(0, 6, frame.shape).astype(np.float32)
+
+    columns = max(1, int(np.ceil(np.sqrt(face_count * width / height))))
+    rows = max(1, int(np.ceil(face_count / columns)))
+    cell_w, cell_h = width // columns, height // rows
+
+    for index in range(face_count):
+        row, column = divmod(index, columns)
+        _, crop, _ = faces[int(rng.integers(len(faces)))]
+        # Back rows are further from the camera
+        size = int(min(cell_w, cell_h) * (0.65 + 0.3 * (row + 1) / rows))
+        size = max(size, 40)
+        face = cv2.resize(crop, (size, int(size * crop.shape[0] / crop.shape[1])), interpolation=cv2.INTER_AREA)
+        face = face[:min(face.shape[0], cell_h)]
+        x = column * cell_w + int(rng.integers(0, max(1, cell_w - face.shape[1] + 1)))
+        y = row * cell_h + int(rng.integers(0, max(1, cell_h - face.shape[0] + 1)))
+        h, w = min(face.shape[0], height - y), min(face.shape[1], width - x)
+        frame[y:y + h, x:x + w] = face[:h, :w]
+
+    frame = cv2.cvtColor(np.clip(frame, 0, 255).astype(np.uint8), cv2.COLOR_RGB2BGR)
+    ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return jpeg.tobytes()
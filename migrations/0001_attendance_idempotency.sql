@@ -0,0 +1,23 @@
+-- migrate:no-transaction
+-- One attendance row per student, subject and day (submit_attendance upserts against it),
+-- plus the idempotency keys of attendance submissions.
+
+CREATE TABLE IF NOT EXISTS attendance_submissions (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    faculty_id VARCHAR(20) NOT NULL,
+    subject_id INT NOT NULL,
+    section_name VARCHAR(10),
+    submitted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    response JSONB
+);
+
+-- Keep the latest row of any duplicates written before the index existed
+DELETE FROM attendance a
+USING attendance newer
+WHERE a.roll_number = newer.roll_number
+  AND a.subject_id = newer.subject_id
+  AND a.date = newer.date
+  AND a.attendance_id < newer.attendance_id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS attendance_roll_subject_date_key
+    ON attendance (roll_number, subject_id, date);
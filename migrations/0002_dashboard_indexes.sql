@@ -0,0 +1,34 @@
+-- migrate:no-transaction
+-- Indexes for the dashboard and roster queries. Built CONCURRENTLY so attendance
+-- stays writable during the build.
+
+-- Per-student history (student dashboard, faculty_attendance) is served by
+-- attendance_roll_subject_date_key from 0001: roll_number = ? AND subject_id = ? ORDER BY date.
+
+-- Faculty view of one subject: every student's rows for subject_id = ?, index-only
+CREATE INDEX CONCURRENTLY IF NOT EXISTS attendance_subject_roll_idx
+    ON attendance (subject_id, roll_number) INCLUDE (date, status);
+
+-- Admin dashboard: today's counts and the monthly trend, index-only
+CREATE INDEX CONCURRENTLY IF NOT EXISTS attendance_date_status_idx
+    ON attendance (date) INCLUDE (status);
+
+-- ON DELETE CASCADE from faculty would otherwise seq-scan attendance
+CREATE INDEX CONCURRENTLY IF NOT EXISTS attendance_faculty_id_idx
+    ON attendance (faculty_id);
+
+-- Section rosters (mark_attendance, faculty_attendance, gallery loads, analytics joins)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS students_section_name_idx
+    ON students (section_name) INCLUDE (roll_number, name);
+
+-- Faculty dashboard classes and admin section view
+CREATE INDEX CONCURRENTLY IF NOT EXISTS faculty_subjects_faculty_id_idx
+    ON faculty_subjects (faculty_id) INCLUDE (subject_id, section_name);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS faculty_subjects_section_name_idx
+    ON faculty_subjects (section_name);
+
+-- Substitute lookups and the cleanup in submit_attendance
+CREATE INDEX CONCURRENTLY IF NOT EXISTS substitute_assignments_substitute_idx
+    ON substitute_assignments (substitute_faculty_id, subject_id, section_name);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS substitute_assignments_original_idx
+    ON substitute_assignments (original_faculty_id);
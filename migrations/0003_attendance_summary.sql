@@ -0,0 +1,64 @@
+-- Running attendance totals per student and subject, so dashboards read one row per
+-- student and subject instead of aggregating the whole history. A trigger on
+-- attendance keeps it current for every write: submissions, resubmissions, hand
+-- edits and rows removed by ON DELETE CASCADE (deleting a student, subject or
+-- faculty member). scripts/rebuild_attendance_summary_pg.py recomputes it from attendance.
+
+-- No attendance writes between installing the trigger and the backfill
+LOCK TABLE attendance IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS attendance_summary (
+    roll_number VARCHAR(20) NOT NULL REFERENCES students(roll_number) ON DELETE CASCADE,
+    subject_id INT NOT NULL REFERENCES subjects(subject_id) ON DELETE CASCADE,
+    total_classes INT NOT NULL DEFAULT 0,
+    present_classes INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (roll_number, subject_id)
+);
+
+-- Section reports look students up by subject
+CREATE INDEX IF NOT EXISTS attendance_summary_subject_idx
+    ON attendance_summary (subject_id) INCLUDE (total_classes, present_classes);
+
+-- Moves the summary by each attendance row removed (OLD) and added (NEW)
+CREATE OR REPLACE FUNCTION attendance_summary_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.roll_number = OLD.roll_number AND NEW.subject_id = OLD.subject_id
+            AND NEW.status = OLD.status THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE attendance_summary
+        SET total_classes = total_classes - 1,
+            present_classes = present_classes - (OLD.status = 'Present')::int,
+            updated_at = now()
+        WHERE roll_number = OLD.roll_number AND subject_id = OLD.subject_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO attendance_summary (roll_number, subject_id, total_classes, present_classes)
+        VALUES (NEW.roll_number, NEW.subject_id, 1, (NEW.status = 'Present')::int)
+        ON CONFLICT (roll_number, subject_id) DO UPDATE
+        SET total_classes = attendance_summary.total_classes + 1,
+            present_classes = attendance_summary.present_classes + EXCLUDED.present_classes,
+            updated_at = now();
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS attendance_summary_apply ON attendance;
+CREATE TRIGGER attendance_summary_apply
+    AFTER INSERT OR UPDATE OR DELETE ON attendance
+    FOR EACH ROW EXECUTE FUNCTION attendance_summary_apply();
+
+INSERT INTO attendance_summary (roll_number, subject_id, total_classes, present_classes)
+SELECT roll_number, subject_id, COUNT(*), COUNT(*) FILTER (WHERE status = 'Present')
+FROM attendance
+GROUP BY roll_number, subject_id
+ON CONFLICT (roll_number, subject_id) DO UPDATE
+SET total_classes = EXCLUDED.total_classes,
+    present_classes = EXCLUDED.present_classes,
+    updated_at = now();
@@ -84,9 +84,21 @@ def create_database():
             "  faculty_id VARCHAR(20) NOT NULL,"
             "  FOREIGN KEY (roll_number) REFERENCES students(roll_number) ON DELETE CASCADE,"
             "  FOREIGN KEY (subject_id) REFERENCES subjects(subject_id) ON DELETE CASCADE,"
-            "  FOREIGN KEY (faculty_id) REFERENCES faculty(faculty_id) ON DELETE CASCADE"
+            "  FOREIGN KEY (faculty_id) REFERENCES faculty(faculty_id) ON DELETE CASCADE,"
+            "  CONSTRAINT attendance_roll_subject_date_key UNIQUE (roll_number, subject_id, date)"
             ")")
-            
+
+        # Attendance submissions, keyed by the client's idempotency key
+        tables['attendance_submissions'] = (
+            "CREATE TABLE IF NOT EXISTS attendance_submissions ("
+            "  idempotency_key VARCHAR(64) PRIMARY KEY,"
+            "  faculty_id VARCHAR(20) NOT NULL,"
+            "  subject_id INT NOT NULL,"
+            "  section_name VARCHAR(10),"
+            "  submitted_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+            "  response JSONB"
+            ")")
+
         # Substitute Assignments table
         tables['substitute_assignments'] = (
             "CREATE TABLE IF NOT EXISTS substitute_assignments ("
@@ -125,6 +137,7 @@ def create_database():
         conn.commit()
         cursor.close()
         conn.close()
+        print("Tables created. Run scripts/migrate_pg.py to apply the schema migrations (indexes, attendance_summary).")
 
     except psycopg2.Error as err:
         print(f"Error connecting to PostgreSQL: {err}")
@@ -0,0 +1,97 @@
+"""
+Converts facial_embedding blobs in PostgreSQL from pickled lists/arrays to the
+compact float32 format (app/services/embedding_format.py).
+
+Rows are streamed through a server-side cursor and rewritten in batches, each
+batch in its own transaction, so it can run against a live database and be
+re-run safely (rows already in the compact format are skipped).
+
+Usage: python scripts/migrate_embeddings_pg.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.embedding_format import encode_embedding, decode_embedding, is_compact
+
+load_dotenv()
+
+
+def migrate_table(conn, table_name, id_column, batch_size, dry_run):
+    print(f"Migrating {table_name}...")
+
+    # WITH HOLD keeps the server-side cursor open across the per-batch commits
+    read_cursor = conn.cursor(name=f"migrate_{table_name}_embeddings", withhold=True)
+    read_cursor.itersize = batch_size
+    read_cursor.execute(f"SELECT {id_column}, facial_embedding FROM {table_name} WHERE facial_embedding IS NOT NULL")
+
+    write_cursor = conn.cursor()
+    converted = skipped = failed = 0
+    saved_bytes = 0
+
+    try:
+        while True:
+            rows = read_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+
+            updates = []
+            for record_id, blob in rows:
+                if is_compact(blob):
+                    skipped += 1
+                    continue
+                try:
+                    compact = encode_embedding(decode_embedding(blob))
+                except Exception as e:
+                    print(f"  Failed to convert {record_id}: {e}")
+                    failed += 1
+                    continue
+                saved_bytes += len(blob) - len(compact)
+                updates.append((record_id, psycopg2.Binary(compact)))
+
+            if updates and not dry_run:
+                execute_values(write_cursor, f"""
+                    UPDATE {table_name} AS t
+                    SET facial_embedding = v.blob
+                    FROM (VALUES %s) AS v(id, blob)
+                    WHERE t.{id_column} = v.id
+                """, updates)
+                conn.commit()
+            converted += len(updates)
+            print(f"  {converted} converted, {skipped} already compact, {failed} failed")
+    finally:
+        write_cursor.close()
+        read_cursor.close()
+
+    print(f"  Done: {converted} rows converted, ~{saved_bytes / 1024:.1f} KiB saved")
+
+
+def migrate():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='Decode and report without writing')
+    args = parser.parse_args()
+
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in .env")
+        return
+
+    try:
+        conn = psycopg2.connect(database_url)
+        try:
+            migrate_table(conn, 'students', 'roll_number', args.batch_size, args.dry_run)
+            migrate_table(conn, 'faculty', 'faculty_id', args.batch_size, args.dry_run)
+        finally:
+            conn.close()
+        print("Migration completed successfully.")
+    except psycopg2.Error as err:
+        print(f"Database Error: {err}")
+
+
+if __name__ == "__main__":
+    migrate()
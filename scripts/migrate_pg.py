@@ -0,0 +1,276 @@
+"""
+Versioned schema migrations for the PostgreSQL database.
+
+Migrations are the numbered SQL files in migrations/ (0001_name.sql, ...), applied
+in order and recorded in a schema_version table together with a checksum. Each
+file runs in one transaction, unless its first line is `-- migrate:no-transaction`
+(needed for CREATE INDEX CONCURRENTLY). Those files run statement by statement in
+autocommit mode and must be written so a re-run after a failure is safe
+(IF NOT EXISTS, ...). Statements are split on ';' at the end of a line.
+
+Usage:
+    python scripts/migrate_pg.py              apply pending migrations
+    python scripts/migrate_pg.py --status     list applied and pending migrations
+    python scripts/migrate_pg.py --explain    print EXPLAIN plans of the dashboard
+                                              queries before and after applying
+    python scripts/migrate_pg.py --explain --analyze   same, with EXPLAIN ANALYZE
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d{4})_([\w-]+)\.sql$')
+NO_TRANSACTION = '-- migrate:no-transaction'
+CREATE_INDEX = re.compile(r'^CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?"?(\w+)"?',
+                          re.IGNORECASE)
+# Arbitrary constant: keeps two deploys from migrating at the same time
+LOCK_ID = 728341
+
+# Hot queries from the blueprints, with the sample values needed to plan them
+EXPLAIN_QUERIES = [
+    ('student dashboard: per-subject totals', """
+        SELECT s.subject_id, s.subject_name, sm.total_classes, sm.present_classes
+        FROM attendance_summary sm JOIN subjects s ON sm.subject_id = s.subject_id
+        WHERE sm.roll_number = %(roll_number)s
+    """),
+    ('student/faculty: one student\'s history in a subject', """
+        SELECT date, status FROM attendance
+        WHERE roll_number = %(roll_number)s AND subject_id = %(subject_id)s
+        ORDER BY date DESC
+    """),
+    ('faculty attendance: section roster', """
+        SELECT roll_number, name FROM students WHERE section_name = %(section_name)s
+    """),
+    ('faculty attendance: section totals', """
+        SELECT s.roll_number, s.name, sm.total_classes, sm.present_classes
+        FROM students s
+        LEFT JOIN attendance_summary sm ON sm.roll_number = s.roll_number AND sm.subject_id = %(subject_id)s
+        WHERE s.section_name = %(section_name)s
+    """),
+    ('faculty dashboard: classes', """
+        SELECT fs.subject_id, s.subject_name, fs.section_name
+        FROM faculty_subjects fs JOIN subjects s ON fs.subject_id = s.subject_id
+        WHERE fs.faculty_id = %(faculty_id)s
+    """),
+    ('admin dashboard: today\'s percentage', """
+        SELECT AVG(CASE WHEN status = 'Present' THEN 100 ELSE 0 END) FROM attendance WHERE date = CURRENT_DATE
+    """),
+    ('admin analytics: section subject averages', """
+        SELECT s.subject_name, SUM(sm.present_classes) * 100.0 / SUM(sm.total_classes)
+        FROM attendance_summary sm
+        JOIN subjects s ON sm.subject_id = s.subject_id
+        JOIN students st ON sm.roll_number = st.roll_number
+        WHERE st.section_name = %(section_name)s
+        GROUP BY s.subject_name
+    """),
+    ('submit attendance: substitute cleanup', """
+        SELECT id FROM substitute_assignments
+        WHERE substitute_faculty_id = %(faculty_id)s AND subject_id = %(subject_id)s AND section_name = %(section_name)s
+    """),
+]
+
+
+def load_migrations():
+    migrations = []
+    for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(file_name)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, file_name)) as f:
+            sql = f.read()
+        migrations.append({
+            'version': int(match.group(1)),
+            'name': match.group(2),
+            'sql': sql,
+            'checksum': hashlib.sha256(sql.encode()).hexdigest(),
+            'transactional': not sql.lstrip().startswith(NO_TRANSACTION),
+        })
+    versions = [migration['version'] for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise SystemExit("Two migrations share a version number")
+    return migrations
+
+
+def split_statements(sql):
+    """Splits a migration into statements at ';' line endings, dropping comment-only lines."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    statements = re.split(r';\s*$', '\n'.join(lines), flags=re.MULTILINE)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def created_indexes(statements):
+    """Names of the indexes the given statements create."""
+    return [match.group(1) for match in map(CREATE_INDEX.match, statements) if match]
+
+
+def ensure_version_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                checksum CHAR(64) NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+    conn.commit()
+
+
+def applied_versions(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT version, name, checksum, applied_at FROM schema_version ORDER BY version")
+        return {row['version']: row for row in cursor.fetchall()}
+
+
+def apply(conn, migration):
+    label = f"{migration['version']:04d}_{migration['name']}"
+    print(f"Applying {label}{'' if migration['transactional'] else ' (no transaction)'}...")
+    record = ("INSERT INTO schema_version (version, name, checksum) VALUES (%s, %s, %s)",
+              (migration['version'], migration['name'], migration['checksum']))
+
+    if migration['transactional']:
+        with conn.cursor() as cursor:
+            cursor.execute(migration['sql'])
+            cursor.execute(*record)
+        conn.commit()
+        return
+
+    conn.autocommit = True
+    try:
+        statements = split_statements(migration['sql'])
+        with conn.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+            # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep.
+            # Only this migration's indexes count: others may be mid-build by someone else.
+            cursor.execute("""
+                SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE NOT i.indisvalid AND n.nspname = current_schema() AND c.relname = ANY(%s)
+            """, (created_indexes(statements),))
+            invalid = [row['relname'] for row in cursor.fetchall()]
+            if invalid:
+                raise SystemExit(f"Invalid indexes after {label}: {', '.join(invalid)}. "
+                                 f"Drop them and run the migration again.")
+            cursor.execute(*record)
+    finally:
+        conn.autocommit = False
+
+
+def sample_parameters(conn):
+    """Real ids from the database, so the plans reflect actual selectivity."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT roll_number, subject_id FROM attendance LIMIT 1")
+        attendance = cursor.fetchone() or {}
+        cursor.execute("SELECT faculty_id, section_name FROM faculty_subjects LIMIT 1")
+        assignment = cursor.fetchone() or {}
+    conn.rollback()
+    return {
+        'roll_number': attendance.get('roll_number', ''),
+        'subject_id': attendance.get('subject_id', 0),
+        'faculty_id': assignment.get('faculty_id', ''),
+        'section_name': assignment.get('section_name', ''),
+    }
+
+
+def explain_all(conn, params, analyze):
+    plans = {}
+    with conn.cursor() as cursor:
+        for name, sql in EXPLAIN_QUERIES:
+            try:
+                cursor.execute(f"EXPLAIN ({'ANALYZE, BUFFERS' if analyze else 'COSTS'}) {sql}", params)
+                plans[name] = [row['QUERY PLAN'] for row in cursor.fetchall()]
+            except psycopg2.ProgrammingError as err:
+                # Queries on tables a pending migration creates only have an "after" plan
+                plans[name] = [f"(not planned: {str(err).splitlines()[0]})"]
+            conn.rollback()
+    return plans
+
+
+def print_plans(title, plans):
+    print(f"\n===== {title} =====")
+    for name, lines in plans.items():
+        print(f"\n-- {name}")
+        for line in lines:
+            print(f"   {line}")
+
+
+def migrate():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--status', action='store_true', help='List migrations without applying anything')
+    parser.add_argument('--explain', action='store_true', help='Print query plans before and after migrating')
+    parser.add_argument('--analyze', action='store_true', help='Use EXPLAIN ANALYZE (runs the read-only queries)')
+    args = parser.parse_args()
+
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in .env")
+        return 1
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        ensure_version_table(conn)
+        migrations = load_migrations()
+        applied = applied_versions(conn)
+
+        for migration in migrations:
+            previous = applied.get(migration['version'])
+            if previous and previous['checksum'].strip() != migration['checksum']:
+                print(f"Warning: {migration['version']:04d}_{migration['name']} changed after it was applied")
+
+        pending = [migration for migration in migrations if migration['version'] not in applied]
+        if args.status:
+            for migration in migrations:
+                state = applied[migration['version']]['applied_at'] if migration['version'] in applied else 'pending'
+                print(f"{migration['version']:04d}_{migration['name']:<40} {state}")
+            return 0
+
+        params = sample_parameters(conn) if args.explain else None
+        if args.explain:
+            print_plans("Before", explain_all(conn, params, args.analyze))
+
+        if not pending:
+            print("Schema is up to date.")
+        else:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+            conn.commit()
+            try:
+                # Another runner may have finished while we waited for the lock
+                applied = applied_versions(conn)
+                conn.commit()
+                for migration in pending:
+                    if migration['version'] not in applied:
+                        apply(conn, migration)
+            finally:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+                conn.commit()
+            print(f"Applied {len(pending)} migration(s).")
+
+        if args.explain:
+            with conn.cursor() as cursor:
+                # Fresh statistics so the planner considers the new indexes
+                cursor.execute("ANALYZE attendance")
+                cursor.execute("ANALYZE students")
+                cursor.execute("ANALYZE attendance_summary")
+            conn.commit()
+            print_plans("After", explain_all(conn, params, args.analyze))
+        return 0
+    except psycopg2.Error as err:
+        print(f"Database Error: {err}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(migrate())
@@ -0,0 +1,47 @@
+"""
+Recomputes the attendance_summary table from the attendance rows.
+
+A trigger on attendance keeps the summary current, so this is only needed to repair
+it (e.g. after the trigger was disabled for a bulk load). Attendance writes wait
+while it runs (one grouped scan of the table).
+
+Usage: python scripts/rebuild_attendance_summary_pg.py
+"""
+import argparse
+import os
+import sys
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.attendance_store import rebuild_attendance_summary
+
+load_dotenv()
+
+
+def rebuild():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        print("DATABASE_URL not found in .env")
+        return 1
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cursor:
+            rows = rebuild_attendance_summary(cursor)
+        conn.commit()
+        print(f"Rebuilt attendance_summary: {rows} student/subject rows.")
+        return 0
+    except psycopg2.Error as err:
+        conn.rollback()
+        print(f"Database Error: {err}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(rebuild())
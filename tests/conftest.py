@@ -0,0 +1,22 @@
+import pytest
+from app import create_app
+from app.config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test'
+    # No database connections at startup, background listeners, warm-up or pool
+    # processes: recognition runs inline
+    DATABASE_URL = None
+    GALLERY_NOTIFY = False
+    GALLERY_WARMUP = False
+    CAMPUS_INDEX = False
+    DB_COOPERATIVE = False
+    RECOGNITION_WORKERS = 0
+    FRAME_RECORD_DIR = ''
+
+
+@pytest.fixture(scope='session')
+def app():
+    return create_app(TestConfig)
@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-secret')
+    return app.test_client()
+
+
+def login(client, role):
+    with client.session_transaction() as login_session:
+        login_session['_user_id'] = login_session['id'] = 'u1'
+        login_session['role'] = role
+
+
+def test_metrics_requires_token_or_admin(client):
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b'# TYPE' in response.data
+
+    login(client, 'faculty')
+    assert client.get('/metrics').status_code == 403
+    login(client, 'admin')
+    assert client.get('/metrics').status_code == 200
+
+
+def test_metrics_without_configured_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', '')
+    assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 403
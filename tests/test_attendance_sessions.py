@@ -0,0 +1,83 @@
+from app import events
+from app.extensions import socketio
+from app.services.attendance_sessions import AttendanceSession, AttendanceSessionRegistry, attendance_sessions
+
+
+def face(student_id, distance=0.3, tracked=False):
+    return {'student_id': student_id, 'distance': distance, 'tracked': tracked}
+
+
+def test_present_after_required_sightings_in_separate_frames():
+    session = AttendanceSession('key', required_sightings=3)
+    session.set_roster(['a', 'b'])
+    assert session.record([face('a'), face('a')]) == []   # one frame counts once
+    assert session.record([face('a')]) == []
+    assert session.record([face('a'), face('b')]) == ['a']
+    assert session.present == {'a'} and not session.complete
+    assert session.confidence('a') == 0.7
+
+
+def test_weak_unknown_and_off_roster_faces_do_not_count():
+    session = AttendanceSession('key', required_sightings=1, max_distance=0.5)
+    session.set_roster(['a'])
+    assert session.record([face('a', 0.55), face("Unknown", None), face('x')]) == []
+    assert session.sightings == {}
+
+
+def test_tracked_faces_are_not_sightings():
+    session = AttendanceSession('key', required_sightings=3)
+    session.set_roster(['a'])
+    session.record([face('a')])
+    session.record([face('a')])
+    for _ in range(5):
+        assert session.record([face('a', tracked=True)]) == []
+    assert session.sightings['a'] == 2
+    assert session.record([face('a')]) == ['a']
+    assert session.complete and session.summary()['frame_interval_ms'] == 0
+
+
+def test_complete_once_the_whole_roster_is_present():
+    session = AttendanceSession('key', required_sightings=1)
+    session.set_roster(['a', 'b'])
+    assert session.record([face('a')]) == ['a'] and not session.complete
+    assert session.record([face('b'), face('a')]) == ['b'] and session.complete
+    assert session.summary()['present'] == ['a', 'b'] and session.summary()['frame_interval_ms'] == 0
+
+
+def test_registry_keys_and_expiry():
+    registry = AttendanceSessionRegistry(max_idle=60)
+    session = registry.get_or_create('f1', 7, 'A')
+    assert registry.get('f1', '7', 'A') is session
+    assert registry.get('f2', 7, 'A') is None
+
+    session.last_seen_at -= 120
+    assert registry.get_or_create('f1', 7, 'A') is not session
+    assert registry.close('f1', 7, 'A') is not None and registry.stats()['sessions'] == 0
+
+
+def test_frame_sessions_are_keyed_on_the_logged_in_faculty(app, monkeypatch):
+    seen = []
+
+    def recognize_frame(data, tracker=None, session=None, timings=None):
+        seen.append(session.key if session is not None else None)
+        return {'success': True, 'faces': []}
+
+    monkeypatch.setattr(events, 'recognize_frame', recognize_frame)
+    frame = {'image': b'', 'faculty_id': 'someone-else', 'subject_id': 7, 'section_name': 'A'}
+
+    # Not logged in: no session, whatever the payload claims
+    client = socketio.test_client(app)
+    client.emit('process_frame', dict(frame))
+    client.disconnect()
+
+    flask_client = app.test_client()
+    with flask_client.session_transaction() as login:
+        login['id'], login['role'] = 'f1', 'faculty'
+    client = socketio.test_client(app, flask_test_client=flask_client)
+    client.emit('process_frame', dict(frame))
+    client.disconnect()
+
+    assert seen[0] is None
+    assert seen[1][:3] == ('f1', '7', 'A')
+    assert attendance_sessions.close('someone-else', 7, 'A') is None
+    assert attendance_sessions.close('f1', 7, 'A') is not None
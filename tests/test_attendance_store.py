@@ -0,0 +1,278 @@
+"""
+Database tests for app/services/attendance_store.py. They need a PostgreSQL database
+with the schema and migrations applied (scripts/create_db_pg.py, scripts/migrate_pg.py)
+in TEST_DATABASE_URL, and are skipped without one. Everything runs in a transaction
+that is rolled back.
+"""
+import os
+from contextlib import contextmanager
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+from app.services.attendance_store import (write_attendance, claim_submission, save_submission_response,
+                                          section_report, attendance_history, student_summary,
+                                          rebuild_attendance_summary)
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason='TEST_DATABASE_URL not set')
+
+SECTION = 'TEST'
+ROLL_NUMBERS = [f"TEST{index:03d}" for index in range(6)]
+
+
+@pytest.fixture
+def cursor():
+    conn = psycopg2.connect(TEST_DATABASE_URL, cursor_factory=RealDictCursor)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("INSERT INTO sections (section_name) VALUES (%s) ON CONFLICT DO NOTHING", (SECTION,))
+        for faculty_id in ('TESTFAC1', 'TESTFAC2'):
+            cursor.execute("""
+                INSERT INTO faculty (faculty_id, name, email, password_hash) VALUES (%s, 'Test', 'test@example.com', '-')
+            """, (faculty_id,))
+        for roll_number in ROLL_NUMBERS:
+            cursor.execute("""
+                INSERT INTO students (roll_number, name, email, password_hash, section_name)
+                VALUES (%s, 'Test', 'test@example.com', '-', %s)
+            """, (roll_number, SECTION))
+        yield cursor
+    finally:
+        cursor.close()
+        conn.rollback()
+        conn.close()
+
+
+def new_subject(cursor, subject_name='Test'):
+    cursor.execute("INSERT INTO subjects (subject_name) VALUES (%s) RETURNING subject_id", (subject_name,))
+    return cursor.fetchone()['subject_id']
+
+
+def add_attendance(cursor, subject_id, roll_number, statuses):
+    """Inserts one class per status, the first today and each next one a day earlier."""
+    for days_ago, status in enumerate(statuses):
+        cursor.execute("""
+            INSERT INTO attendance (roll_number, subject_id, date, status, faculty_id)
+            VALUES (%s, %s, CURRENT_DATE - %s, %s, 'TESTFAC1')
+        """, (roll_number, subject_id, days_ago, status))
+
+
+def assert_summary_matches_recount(cursor):
+    cursor.execute("""
+        SELECT roll_number, subject_id, total_classes, present_classes FROM attendance_summary
+        WHERE roll_number = ANY(%s) AND total_classes > 0
+        ORDER BY roll_number, subject_id
+    """, (ROLL_NUMBERS,))
+    summary = cursor.fetchall()
+    cursor.execute("""
+        SELECT roll_number, subject_id, COUNT(*) AS total_classes,
+               COUNT(*) FILTER (WHERE status = 'Present') AS present_classes
+        FROM attendance WHERE roll_number = ANY(%s)
+        GROUP BY roll_number, subject_id
+        ORDER BY roll_number, subject_id
+    """, (ROLL_NUMBERS,))
+    assert summary == cursor.fetchall()
+    return summary
+
+
+def test_summary_follows_submit_resubmit_and_faculty_delete(cursor):
+    first, second = new_subject(cursor), new_subject(cursor)
+
+    write_attendance(cursor, 'TESTFAC1', first, ROLL_NUMBERS[:4], ROLL_NUMBERS[4:])
+    write_attendance(cursor, 'TESTFAC2', second, ROLL_NUMBERS[:2], ROLL_NUMBERS[2:])
+    assert len(assert_summary_matches_recount(cursor)) == 2 * len(ROLL_NUMBERS)
+
+    # Resubmitting flips statuses without adding classes
+    write_attendance(cursor, 'TESTFAC1', first, ROLL_NUMBERS[2:], ROLL_NUMBERS[:2])
+    summary = assert_summary_matches_recount(cursor)
+    assert all(row['total_classes'] == 1 for row in summary)
+
+    # The faculty's attendance rows go with them (ON DELETE CASCADE), and so do their totals
+    cursor.execute("DELETE FROM faculty WHERE faculty_id = 'TESTFAC2'")
+    summary = assert_summary_matches_recount(cursor)
+    assert {row['subject_id'] for row in summary} == {first}
+
+
+def test_resubmitting_overwrites_instead_of_duplicating(cursor):
+    subject_id = new_subject(cursor)
+    assert write_attendance(cursor, 'TESTFAC1', subject_id, ROLL_NUMBERS[:3], ROLL_NUMBERS[3:]) == len(ROLL_NUMBERS)
+    write_attendance(cursor, 'TESTFAC1', subject_id, ROLL_NUMBERS, [])
+
+    cursor.execute("""
+        SELECT roll_number, status FROM attendance
+        WHERE subject_id = %s AND date = CURRENT_DATE ORDER BY roll_number
+    """, (subject_id,))
+    assert [(row['roll_number'], row['status']) for row in cursor.fetchall()] == \
+        [(roll_number, 'Present') for roll_number in ROLL_NUMBERS]
+
+
+def test_claimed_submission_returns_stored_response(cursor):
+    subject_id = new_subject(cursor)
+    key = f"test-{subject_id}"
+    assert claim_submission(cursor, key, 'TESTFAC1', subject_id, SECTION) is None
+    save_submission_response(cursor, key, {'success': True, 'manually_marked': ['TEST000']})
+
+    assert claim_submission(cursor, key, 'TESTFAC1', subject_id, SECTION) == \
+        {'success': True, 'manually_marked': ['TEST000']}
+
+
+def test_section_report_totals_and_class_average(cursor):
+    subject_id, other_subject = new_subject(cursor), new_subject(cursor)
+    add_attendance(cursor, subject_id, 'TEST000', ['Present'] * 4)
+    add_attendance(cursor, subject_id, 'TEST001', ['Present', 'Absent', 'Absent', 'Present'])
+    add_attendance(cursor, subject_id, 'TEST002', ['Present', 'Absent', 'Absent'])
+    add_attendance(cursor, subject_id, 'TEST003', ['Absent'])
+    # Other subjects do not count; TEST004 and TEST005 have no classes at all
+    add_attendance(cursor, other_subject, 'TEST004', ['Present'] * 3)
+
+    students, class_average = section_report(cursor, subject_id, SECTION)
+    assert [(student['roll_number'], student['total_classes'], student['present_classes'],
+             student['attendance_percentage']) for student in students] == [
+        ('TEST000', 4, 4, 100.0),
+        ('TEST001', 4, 2, 50.0),
+        ('TEST002', 3, 1, 33.33),
+        ('TEST003', 1, 0, 0.0),
+        ('TEST004', 0, 0, 0),
+        ('TEST005', 0, 0, 0),
+    ]
+    assert class_average == round((100 + 50 + 33.33) / 6, 2)
+
+    assert section_report(cursor, subject_id, 'NO SUCH SECTION') == ([], 0)
+
+
+def page_through(cursor, roll_number, subject_id, limit):
+    pages, before = [], None
+    while True:
+        records, before = attendance_history(cursor, roll_number, subject_id, before, limit)
+        pages.append(records)
+        if before is None:
+            return pages
+        assert len(pages) < 100
+
+
+@pytest.mark.parametrize('classes, limit, page_sizes', [
+    (45, 20, [20, 20, 5]),
+    (40, 20, [20, 20]),
+    (3, 20, [3]),
+    (0, 20, [0]),
+])
+def test_attendance_history_pages_are_stable_and_complete(cursor, classes, limit, page_sizes):
+    subject_id, other_subject = new_subject(cursor), new_subject(cursor)
+    statuses = ['Present' if day % 3 else 'Absent' for day in range(classes)]
+    add_attendance(cursor, subject_id, 'TEST000', statuses)
+    add_attendance(cursor, subject_id, 'TEST001', ['Present'] * 50)
+    add_attendance(cursor, other_subject, 'TEST000', ['Absent'] * 50)
+
+    pages = page_through(cursor, 'TEST000', subject_id, limit)
+    assert [len(page) for page in pages] == page_sizes
+
+    records = [record for page in pages for record in page]
+    cursor.execute("""
+        SELECT to_char(CURRENT_DATE - day, 'YYYY-MM-DD') AS date FROM generate_series(0, %s) AS day
+    """, (classes - 1,))
+    expected_dates = [row['date'] for row in cursor.fetchall()]
+    # Newest first, every class exactly once, no gaps between pages
+    assert [record['date'] for record in records] == expected_dates
+    assert [record['status'] for record in records] == statuses
+
+    # The same cursor values give the same pages
+    assert page_through(cursor, 'TEST000', subject_id, limit) == pages
+
+
+def test_student_summary_per_subject_and_overall(cursor):
+    physics, chemistry, biology = new_subject(cursor, 'Physics'), new_subject(cursor, 'Chemistry'), \
+        new_subject(cursor, 'Biology')
+    add_attendance(cursor, physics, 'TEST000', ['Present', 'Absent', 'Present', 'Present'])
+    add_attendance(cursor, chemistry, 'TEST000', ['Absent', 'Absent', 'Present'])
+    # Another student's classes, and a subject the student has no classes in
+    add_attendance(cursor, biology, 'TEST001', ['Present'] * 5)
+
+    classes, overall = student_summary(cursor, 'TEST000')
+    assert [(class_info['subject_name'], class_info['total_classes'], class_info['present_classes'],
+             class_info['attendance_percentage']) for class_info in classes] == [
+        ('Chemistry', 3, 1, 33.33),
+        ('Physics', 4, 3, 75.0),
+    ]
+    # Weighted by classes, not the mean of the subject percentages
+    assert overall == round(4 / 7 * 100, 2)
+
+    assert student_summary(cursor, 'TEST005') == ([], 0)
+
+
+def test_history_route_pages_through_a_students_attendance(cursor, app, monkeypatch):
+    subject_id = new_subject(cursor)
+    add_attendance(cursor, subject_id, 'TEST000', ['Present', 'Absent'] * 12)
+    add_attendance(cursor, subject_id, 'TEST001', ['Absent'] * 30)
+
+    @contextmanager
+    def test_connection():
+        yield cursor.connection
+
+    monkeypatch.setattr('app.routes.student.db_connection', test_connection)
+    client = app.test_client()
+    with client.session_transaction() as login_session:
+        login_session['_user_id'] = login_session['id'] = 'TEST000'
+        login_session['role'] = 'student'
+
+    pages, before = [], ''
+    while before is not None:
+        response = client.get('/student-dashboard/history',
+                              query_string={'subject_id': subject_id, 'before': before, 'limit': 10})
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append(body['records'])
+        before = body['next_before']
+
+    assert [len(page) for page in pages] == [10, 10, 4]
+    dates = [record['date'] for page in pages for record in page]
+    assert dates == sorted(set(dates), reverse=True)
+    assert [record['status'] for page in pages for record in page] == ['Present', 'Absent'] * 12
+
+    response = client.get('/student-dashboard/history', query_string={'limit': 10})
+    assert response.status_code == 400
+
+
+def summary_rows(cursor):
+    cursor.execute("""
+        SELECT roll_number, subject_id, total_classes, present_classes FROM attendance_summary
+        WHERE roll_number = ANY(%s) AND total_classes > 0
+        ORDER BY roll_number, subject_id
+    """, (ROLL_NUMBERS,))
+    return cursor.fetchall()
+
+
+CORRUPTIONS = {
+    'truncate': ["TRUNCATE attendance_summary"],
+    'corrupt': [
+        "UPDATE attendance_summary SET total_classes = 99, present_classes = 98 WHERE roll_number = 'TEST000'",
+        "DELETE FROM attendance_summary WHERE roll_number = 'TEST001'",
+        "UPDATE attendance_summary SET present_classes = 0 WHERE roll_number = 'TEST002'",
+    ],
+}
+
+
+@pytest.mark.parametrize('corruption', sorted(CORRUPTIONS))
+def test_rebuild_restores_the_trigger_maintained_summary(cursor, corruption):
+    first, second = new_subject(cursor), new_subject(cursor)
+    add_attendance(cursor, first, 'TEST000', ['Present', 'Absent', 'Present'])
+    add_attendance(cursor, second, 'TEST001', ['Absent', 'Present'])
+    write_attendance(cursor, 'TESTFAC1', first, ROLL_NUMBERS[:3], ROLL_NUMBERS[3:])
+    write_attendance(cursor, 'TESTFAC2', second, ROLL_NUMBERS[2:], ROLL_NUMBERS[:2])
+    # Hand edits and deletions go through the trigger too
+    cursor.execute("UPDATE attendance SET status = 'Present' WHERE roll_number = 'TEST003' AND subject_id = %s",
+                   (first,))
+    cursor.execute("DELETE FROM attendance WHERE roll_number = 'TEST005' AND subject_id = %s", (second,))
+    expected = assert_summary_matches_recount(cursor)
+    assert expected == summary_rows(cursor)
+
+    for statement in CORRUPTIONS[corruption]:
+        cursor.execute(statement)
+    assert summary_rows(cursor) != expected
+
+    rows = rebuild_attendance_summary(cursor)
+    assert summary_rows(cursor) == expected
+    cursor.execute("SELECT COUNT(*) AS groups FROM (SELECT DISTINCT roll_number, subject_id FROM attendance) AS pairs")
+    assert rows == cursor.fetchone()['groups']
+
+    # The trigger keeps working on the rebuilt rows
+    write_attendance(cursor, 'TESTFAC1', first, ROLL_NUMBERS, [])
+    assert_summary_matches_recount(cursor)
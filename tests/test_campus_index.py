@@ -0,0 +1,160 @@
+import base64
+import cv2
+import numpy as np
+import pytest
+from app.services import recognition
+from app.services.embedding_format import EMBEDDING_DIM
+from app.services.recognition import CampusIndex
+
+
+def clustered(count, clusters=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, EMBEDDING_DIM)).astype(np.float32)
+    noise = 0.05 * rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+    return centers[np.arange(count) % clusters] + noise
+
+
+def student_keys(count, prefix='S'):
+    return [('student', f"{prefix}{index:04d}") for index in range(count)]
+
+
+@pytest.fixture
+def inline_training(app):
+    # The app fixture runs the recognition executor inline (RECOGNITION_WORKERS=0)
+    assert recognition.recognition_executor.max_workers == 0
+
+
+def built_index(monkeypatch, vectors, train_threshold=64, nprobe=4):
+    index = CampusIndex(nprobe=nprobe, train_threshold=train_threshold)
+    keys = student_keys(len(vectors))
+    monkeypatch.setattr(index, '_fetch', lambda: (keys, vectors, ['A'] * len(keys)))
+    index.build()
+    return index
+
+
+def test_build_trains_partitions_and_finds_every_face(monkeypatch, inline_training):
+    vectors = clustered(300)
+    index = built_index(monkeypatch, vectors)
+
+    stats = index.stats()
+    assert stats['built'] and stats['size'] == 300
+    assert stats['partitions'] == int(np.sqrt(300))
+    for row in range(0, 300, 7):
+        best = index.search(vectors[row], k=1)[0]
+        assert (best['id'], best['section']) == (f"S{row:04d}", 'A')
+        assert best['distance'] < 0.01
+
+
+def test_search_returns_top_k_like_a_linear_scan(monkeypatch, inline_training):
+    vectors = clustered(200)
+    index = built_index(monkeypatch, vectors, train_threshold=10000)
+    assert index.stats()['partitions'] == 0
+
+    query = clustered(1, seed=1)[0]
+    results = index.search(query, k=5)
+    distances = np.linalg.norm(vectors - query, axis=1)
+    expected = np.argsort(distances)[:5]
+    assert [result['id'] for result in results] == [f"S{row:04d}" for row in expected]
+    np.testing.assert_allclose([result['distance'] for result in results], distances[expected], rtol=1e-4)
+    assert len(index.search(query, k=500)) == 200
+
+
+def test_incremental_upsert_and_remove(monkeypatch, inline_training):
+    vectors = clustered(300)
+    index = built_index(monkeypatch, vectors)
+    new_face, moved_face = clustered(2, seed=2)
+
+    index.upsert(('student', 'NEW'), new_face, 'B')
+    assert index.search(new_face, k=1)[0]['id'] == 'NEW'
+
+    # Re-registration replaces the old embedding
+    index.upsert(('student', 'S0003'), moved_face, 'A')
+    assert index.search(moved_face, k=1)[0]['id'] == 'S0003'
+    assert index.search(vectors[3], k=1)[0]['id'] != 'S0003'
+
+    index.move(('student', 'S0003'), 'C')
+    assert index.search(moved_face, k=1)[0]['section'] == 'C'
+
+    index.remove(('student', 'NEW'))
+    assert all(result['id'] != 'NEW' for result in index.search(new_face, k=10))
+    assert len(index) == 300
+
+    # The freed row is reused
+    index.upsert(('faculty', 'F1'), new_face)
+    best = index.search(new_face, k=1)[0]
+    assert (best['role'], best['id'], best['section']) == ('faculty', 'F1', None)
+    assert len(index._keys) == 301
+
+
+def test_changes_made_while_loading_are_replayed(monkeypatch, inline_training):
+    vectors = clustered(100)
+    index = CampusIndex(train_threshold=64)
+    late_face = clustered(1, seed=3)[0]
+
+    def fetch():
+        # An admin edits students while the database rows are being read
+        index.upsert(('student', 'LATE'), late_face, 'B')
+        index.remove(('student', 'S0001'))
+        return student_keys(100), vectors, None
+
+    monkeypatch.setattr(index, '_fetch', fetch)
+    index.build()
+    assert index.search(late_face, k=1)[0]['id'] == 'LATE'
+    assert all(result['id'] != 'S0001' for result in index.search(vectors[1], k=5))
+    assert len(index) == 100
+
+
+def test_changes_made_while_training_are_kept(monkeypatch, inline_training):
+    vectors = clustered(300)
+    index = built_index(monkeypatch, vectors)
+    late_face = clustered(1, seed=4)[0]
+    run = recognition.recognition_executor.run
+
+    def run_with_concurrent_edits(fn, *args):
+        index.upsert(('student', 'LATE'), late_face)
+        index.remove(('student', 'S0002'))
+        return run(fn, *args)
+
+    monkeypatch.setattr(recognition.recognition_executor, 'run', run_with_concurrent_edits)
+    index.train()
+    assert index.search(late_face, k=1)[0]['id'] == 'LATE'
+    assert all(result['id'] != 'S0002' for result in index.search(vectors[2], k=5))
+    assert not index.stats()['training']
+
+
+def test_growth_retrains_in_the_background(monkeypatch, inline_training):
+    vectors = clustered(100)
+    index = built_index(monkeypatch, vectors[:40])
+    assert index.stats()['partitions'] == 0
+
+    for row in range(40, 100):
+        index.upsert(('student', f"S{row:04d}"), vectors[row])
+    index._training.join(10)
+    assert index.stats()['partitions'] > 0
+    assert index.search(vectors[99], k=1)[0]['id'] == 'S0099'
+
+
+def test_identify_face_route(app, monkeypatch):
+    client = app.test_client()
+    with client.session_transaction() as login_session:
+        login_session['_user_id'] = login_session['id'] = 'admin'
+        login_session['role'] = 'admin'
+
+    index = CampusIndex()
+    monkeypatch.setattr(recognition, 'campus_index', index)
+    monkeypatch.setattr('app.routes.admin.campus_index', index)
+    _, jpeg = cv2.imencode('.jpg', np.zeros((32, 32, 3), dtype=np.uint8))
+    image = 'data:image/jpeg;base64,' + base64.b64encode(jpeg.tobytes()).decode()
+
+    assert client.post('/api/identify-face', json={'image': image}).status_code == 503
+
+    face = clustered(1)[0]
+    index.load([('student', 'S0001')], face[None, :], ['A'])
+    monkeypatch.setattr(recognition.recognition_executor, 'process',
+                        lambda img: ([(1, 20, 20, 1)], [0], face[None, :], {}))
+    response = client.post('/api/identify-face', json={'image': image, 'k': 3})
+    assert response.status_code == 200
+    [result] = response.get_json()['faces']
+    assert result['matches'][0]['id'] == 'S0001'
+
+    assert client.post('/api/identify-face', json={'image': 'data:image/jpeg;base64,AAAA'}).status_code == 400
@@ -0,0 +1,56 @@
+"""
+enable_cooperative_mode(): outside eventlet it changes nothing; under the eventlet
+worker a slow query must leave the hub free. The second test needs a PostgreSQL
+server in TEST_DATABASE_URL and is skipped without one.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+from psycopg2 import extensions
+from app.db import enable_cooperative_mode
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+
+def test_not_enabled_without_eventlet():
+    assert enable_cooperative_mode() is False
+    assert extensions.get_wait_callback() is None
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason='TEST_DATABASE_URL not set')
+def test_slow_query_does_not_block_the_hub(tmp_path):
+    script = tmp_path / 'cooperative.py'
+    script.write_text(textwrap.dedent("""
+        import eventlet
+        # Without eventlet's own psycopg patch, so only enable_cooperative_mode's callback is measured
+        eventlet.monkey_patch(psycopg=False)
+        import os
+        import time
+        import psycopg2
+        from app.db import enable_cooperative_mode
+
+        assert psycopg2.extensions.get_wait_callback() is None
+        assert enable_cooperative_mode()
+        ticks = []
+
+        def heartbeat():
+            while True:
+                ticks.append(time.time())
+                eventlet.sleep(0.01)
+
+        eventlet.spawn(heartbeat)
+        conn = psycopg2.connect(os.environ['TEST_DATABASE_URL'])
+        started_at = time.time()
+        conn.cursor().execute("SELECT pg_sleep(0.5)")
+        finished_at = time.time()
+        print(sum(started_at <= tick <= finished_at for tick in ticks))
+    """))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')]))}
+    result = subprocess.run([sys.executable, '-W', 'ignore', str(script)], capture_output=True, text=True,
+                            timeout=60, env=env)
+    assert result.returncode == 0, result.stderr
+    # Blocking inside libpq would leave the heartbeat at most one tick
+    assert int(result.stdout) >= 20
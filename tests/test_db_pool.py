@@ -0,0 +1,124 @@
+import threading
+import psycopg2
+import pytest
+from flask import Flask
+from psycopg2 import extensions
+from app import db
+from app.db import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        if self.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        return extensions.TRANSACTION_STATUS_INTRANS if self.in_transaction else extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+
+    def connect():
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(db, 'get_db_connection', connect)
+    return connections
+
+
+def test_exhausted_pool_times_out(opened):
+    pool = ConnectionPool(maxconn=2, timeout=0.05)
+    first, second = pool.getconn(), pool.getconn()
+    with pytest.raises(PoolTimeout) as raised:
+        pool.getconn()
+    assert isinstance(raised.value, psycopg2.OperationalError)
+    assert len(opened) == 2
+    assert pool.stats()['timeouts'] == 1
+
+    pool.putconn(first)
+    assert pool.getconn() is first
+    pool.putconn(second)
+
+
+def test_waiter_gets_returned_connection(opened):
+    pool = ConnectionPool(maxconn=1, timeout=5.0)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join(5)
+    assert got == [conn]
+    assert len(opened) == 1
+
+
+def test_broken_connection_is_discarded(opened):
+    pool = ConnectionPool(maxconn=1, timeout=0.05)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+    assert opened[0].closed
+    assert pool.stats()['size'] == 0
+
+    # The slot is free again and a new connection is opened in it
+    with pool.connection() as conn:
+        assert conn is opened[1]
+    assert pool.stats()['size'] == 1
+
+
+def test_closed_idle_connection_is_replaced(opened):
+    pool = ConnectionPool(maxconn=1)
+    with pool.connection() as conn:
+        pass
+    conn.close()
+    with pool.connection() as replacement:
+        assert replacement is not conn
+    assert pool.stats()['size'] == 1
+
+
+def test_open_transaction_is_rolled_back_on_return(opened):
+    pool = ConnectionPool(maxconn=1)
+    with pool.connection() as conn:
+        conn.in_transaction = True
+    assert conn.rollbacks == 1
+    with pool.connection() as again:
+        assert again is conn
+
+
+def test_start_opens_minconn_connections(opened):
+    pool = ConnectionPool()
+    app = Flask(__name__)
+    app.config.update(DATABASE_URL='postgresql://test', DB_POOL_MIN=3, DB_POOL_MAX=5)
+    pool.init_app(app)
+    pool.start(app)
+    stats = pool.stats()
+    assert (stats['idle'], stats['size'], len(opened)) == (3, 3, 3)
+
+    # Checkouts reuse them instead of connecting
+    with pool.connection() as conn:
+        assert conn in opened
+    assert len(opened) == 3
+
+
+def test_start_survives_database_down(monkeypatch):
+    def refuse():
+        raise psycopg2.OperationalError('could not connect to server')
+
+    monkeypatch.setattr(db, 'get_db_connection', refuse)
+    pool = ConnectionPool(minconn=2)
+    app = Flask(__name__)
+    app.config.update(DATABASE_URL='postgresql://test')
+    pool.start(app)
+    assert pool.stats()['size'] == 0
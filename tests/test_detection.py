@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from flask import Flask
+from app.services import recognition
+from app.services.recognition import DetectionProfiles, detect_faces
+
+
+def profiles_for(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    profiles = DetectionProfiles()
+    profiles.init_app(app)
+    return profiles
+
+
+def test_boxes_are_rescaled_and_clamped_to_the_frame(monkeypatch):
+    seen = []
+
+    def face_locations(small, number_of_times_to_upsample, model):
+        seen.append((small.shape, number_of_times_to_upsample, model))
+        # One face inside the half-size frame, one running past its right/bottom edge
+        return [(10, 40, 30, 20), (90, 161, 121, 140)]
+
+    monkeypatch.setattr(recognition.face_recognition, 'face_locations', face_locations, raising=False)
+    img = np.zeros((240, 320, 3), dtype=np.uint8)
+    locations = detect_faces(img, {'scale': 0.5, 'upsample': 2, 'model': 'hog', 'num_jitters': 1})
+
+    assert seen == [((120, 160, 3), 2, 'hog')]
+    assert locations == [(20, 80, 60, 40), (180, 320, 240, 280)]
+
+
+def test_full_scale_boxes_are_returned_unchanged(monkeypatch):
+    monkeypatch.setattr(recognition.face_recognition, 'face_locations',
+                        lambda small, **kwargs: [(1, 50, 40, 10)], raising=False)
+    img = np.zeros((60, 80, 3), dtype=np.uint8)
+    assert detect_faces(img, recognition.DEFAULT_DETECTION_PROFILE) == [(1, 50, 40, 10)]
+
+
+def test_section_profiles_override_the_default():
+    profiles = profiles_for(DETECTION_PROFILE={'scale': 0.5},
+                            SECTION_DETECTION_PROFILES={'A': {'model': 'cnn', 'upsample': 0}})
+    assert profiles.get('A') == {'scale': 0.5, 'upsample': 0, 'model': 'cnn', 'num_jitters': 1}
+    assert profiles.get('B') == {'scale': 0.5, 'upsample': 1, 'model': 'hog', 'num_jitters': 1}
+
+
+@pytest.mark.parametrize('overrides', [
+    {'scale': '0.5'},
+    {'scale': 0},
+    {'scale': 1.5},
+    {'upsample': -1},
+    {'upsample': 1.0},
+    {'model': 'mmod'},
+    {'num_jitters': 0},
+    {'num_jitters': True},
+    {'scaling': 0.5},
+])
+def test_bad_section_profiles_are_rejected_at_load(overrides):
+    with pytest.raises(ValueError, match=r"SECTION_DETECTION_PROFILES\['A'\]"):
+        profiles_for(SECTION_DETECTION_PROFILES={'A': overrides})
+
+
+def test_bad_default_profile_is_rejected_at_load():
+    with pytest.raises(ValueError, match='DETECTION_PROFILE: scale'):
+        profiles_for(DETECTION_PROFILE={'scale': 'half'})
+    with pytest.raises(ValueError, match='must be an object'):
+        profiles_for(SECTION_DETECTION_PROFILES={'A': 0.5})
@@ -0,0 +1,53 @@
+import pickle
+import numpy as np
+import pytest
+from app.services.embedding_format import (EMBEDDING_DIM, HEADER, HEADER_SIZE, MAGIC, encode_embedding,
+                                           decode_embedding, decode_embeddings, is_compact)
+
+
+def vector(seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, EMBEDDING_DIM)
+
+
+def test_compact_round_trip():
+    encoding = vector()
+    blob = encode_embedding(encoding)
+    assert is_compact(blob)
+    assert len(blob) == HEADER_SIZE + 4 * EMBEDDING_DIM
+    decoded = decode_embedding(blob)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, encoding, rtol=1e-6)
+
+
+@pytest.mark.parametrize('legacy', [list, np.asarray])
+def test_legacy_pickles_still_decode(legacy):
+    encoding = vector()
+    blob = pickle.dumps(legacy(encoding))
+    assert not is_compact(blob)
+    np.testing.assert_allclose(decode_embedding(blob), encoding, rtol=1e-6)
+
+
+@pytest.mark.parametrize('blob', [
+    HEADER.pack(MAGIC, 2, 0, EMBEDDING_DIM) + bytes(4 * EMBEDDING_DIM),      # unknown version
+    HEADER.pack(MAGIC, 1, 0, 64) + bytes(4 * 64),                            # wrong dimension
+    encode_embedding(vector())[:-4],                                         # truncated
+    pickle.dumps(list(range(10))),                                           # legacy, wrong size
+])
+def test_bad_headers_are_rejected(blob):
+    with pytest.raises(ValueError):
+        decode_embedding(blob)
+
+
+def test_decode_embeddings_skips_bad_rows():
+    good = [vector(seed) for seed in range(3)]
+    blobs = [encode_embedding(good[0]), b'AE\x09garbage', pickle.dumps(list(good[1])),
+             encode_embedding(good[2])[:-1], encode_embedding(good[2])]
+    matrix, ok = decode_embeddings(blobs)
+    assert ok == [True, False, True, False, True]
+    assert matrix.shape == (3, EMBEDDING_DIM) and matrix.dtype == np.float32
+    np.testing.assert_allclose(matrix, np.array(good), rtol=1e-6)
+
+
+def test_decode_embeddings_empty():
+    matrix, ok = decode_embeddings([])
+    assert matrix.shape == (0, EMBEDDING_DIM) and ok == []
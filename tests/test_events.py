@@ -0,0 +1,88 @@
+import base64
+import numpy as np
+import pytest
+from app import events
+from app.extensions import socketio
+from app.services.frame_slots import frame_slots
+from app.services.recognition import SectionGallery
+
+
+def test_failed_frame_is_answered_and_socket_keeps_working(app, monkeypatch):
+    calls = []
+
+    def recognize_frame(data, tracker=None, session=None, timings=None):
+        calls.append(data['seq'])
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return {'success': True, 'faces': []}
+
+    monkeypatch.setattr(events, 'recognize_frame', recognize_frame)
+    client = socketio.test_client(app)
+    try:
+        client.emit('process_frame', {'image': b'', 'section_name': 'A'})
+        client.emit('process_frame', {'image': b'', 'section_name': 'A'})
+        responses = [event['args'][0] for event in client.get_received() if event['name'] == 'frame_processed']
+    finally:
+        client.disconnect()
+
+    assert calls == [1, 2]
+    assert responses[0]['seq'] == 1 and responses[0]['success'] is False
+    assert 'database unavailable' in responses[0]['message']
+    assert responses[1] == {'success': True, 'faces': [], 'seq': 2}
+    assert frame_slots.stats()['connections'] == 0
+
+
+def test_recorder_failure_does_not_break_the_handler(app, monkeypatch):
+    def broken_record(sid, data):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(events.frame_recorder, 'record', broken_record)
+    monkeypatch.setattr(events, 'recognize_frame', lambda data, *args: {'success': True, 'faces': []})
+    client = socketio.test_client(app)
+    try:
+        client.emit('process_frame', {'image': b'', 'section_name': 'A'})
+        responses = [event['args'][0] for event in client.get_received() if event['name'] == 'frame_processed']
+    finally:
+        client.disconnect()
+    assert responses == [{'success': True, 'faces': [], 'seq': 1}]
+
+
+def test_frame_with_a_bad_seq_is_still_answered(app, monkeypatch):
+    monkeypatch.setattr(events, 'recognize_frame', lambda data, *args: {'success': True, 'faces': []})
+    client = socketio.test_client(app)
+    try:
+        client.emit('process_frame', {'image': b'', 'section_name': 'A', 'seq': 'abc'})
+        client.emit('process_frame', {'image': b'', 'section_name': 'A', 'seq': 1.5})
+        responses = [event['args'][0] for event in client.get_received() if event['name'] == 'frame_processed']
+    finally:
+        client.disconnect()
+    assert [response['seq'] for response in responses] == [1, 2]
+
+
+JPEG_BYTES = b'\xff\xd8\xff\xe0 not really a jpeg'
+
+
+@pytest.mark.parametrize('payload', [JPEG_BYTES, bytearray(JPEG_BYTES), memoryview(JPEG_BYTES),
+                                     'data:image/jpeg;base64,' + base64.b64encode(JPEG_BYTES).decode()])
+def test_frame_buffer_accepts_binary_and_data_urls(payload):
+    buffer = events.frame_buffer(payload)
+    assert buffer.dtype == np.uint8
+    assert buffer.tobytes() == JPEG_BYTES
+
+
+def test_frame_buffer_does_not_copy_binary_attachments():
+    payload = bytearray(JPEG_BYTES)
+    buffer = events.frame_buffer(payload)
+    payload[0] = 0
+    assert buffer[0] == 0
+
+
+@pytest.mark.parametrize('payload', ['not a data url', 'data:image/jpeg;base64,@@@', None])
+def test_malformed_image_gets_a_clean_error_reply(monkeypatch, payload):
+    monkeypatch.setattr(events, 'load_known_students', lambda section_name: SectionGallery([], []))
+    with pytest.raises(ValueError):
+        events.frame_buffer(payload)
+
+    response = events.recognize_frame({'image': payload, 'section_name': 'A'})
+    assert response['success'] is False
+    assert response['message'].startswith('Error decoding image: ')
@@ -0,0 +1,59 @@
+import base64
+import pytest
+from app.services.frame_recorder import FrameRecorder, read_recording
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    recorder = FrameRecorder()
+    recorder.directory = str(tmp_path)
+    recorder.max_bytes = 1024 * 1024
+    yield recorder
+    recorder.close()
+
+
+def test_round_trip(recorder):
+    frames = [('sid-a', b'\xff\xd8first'), ('sid-b', b'\xff\xd8second'), ('sid-a', b'\xff\xd8third')]
+    for sid, image in frames:
+        recorder.record(sid, {'image': image, 'section_name': 'A', 'width': 640, 'height': 480})
+    # Old clients send base64 data URLs
+    recorder.record('sid-b', {'image': 'data:image/jpeg;base64,' + base64.b64encode(b'\xff\xd8fourth').decode()})
+    recorder.close()
+
+    recorded = list(read_recording(recorder.path))
+    assert [image for _, image in recorded] == [image for _, image in frames] + [b'\xff\xd8fourth']
+    assert [entry['session'] for entry, _ in recorded] == [1, 2, 1, 2]
+    assert recorded[0][0]['section_name'] == 'A' and recorded[0][0]['width'] == 640
+    assert all(later[0]['t'] >= earlier[0]['t'] for earlier, later in zip(recorded, recorded[1:]))
+    assert recorder.stats()['recorded'] == 4
+
+
+def test_discard_forgets_the_connection(recorder):
+    recorder.record('sid', {'image': b'one'})
+    recorder.discard('sid')
+    assert recorder.stats()['sessions'] == 0
+    recorder.record('sid', {'image': b'two'})
+    recorder.close()
+    assert [entry['session'] for entry, _ in read_recording(recorder.path)] == [1, 2]
+
+
+def test_stops_at_the_size_limit(recorder):
+    recorder.max_bytes = 10
+    recorder.record('sid', {'image': b'123456'})
+    recorder.record('sid', {'image': b'789012'})
+    recorder.close()
+    assert recorder.stats()['skipped'] == 1
+    assert [image for _, image in read_recording(recorder.path)] == [b'123456']
+
+
+def test_disabled_without_directory():
+    recorder = FrameRecorder()
+    recorder.record('sid', {'image': b'frame'})
+    assert recorder.stats()['recorded'] == 0 and recorder.path is None
+
+
+def test_rejects_other_files(tmp_path):
+    (tmp_path / 'x.frames').write_bytes(b'JUNK\x01')
+    (tmp_path / 'x.idx').write_text('')
+    with pytest.raises(ValueError):
+        list(read_recording(str(tmp_path / 'x')))
@@ -0,0 +1,67 @@
+from app.services.frame_slots import FrameSlots
+
+
+def test_latest_frame_wins_while_running():
+    slots = FrameSlots()
+    assert slots.offer('sid', {'image': 1}) is True
+    assert slots.take('sid')['seq'] == 1
+
+    # Frames arriving mid-recognition replace each other
+    assert slots.offer('sid', {'image': 2}) is False
+    assert slots.offer('sid', {'image': 3}) is False
+    frame = slots.take('sid')
+    assert (frame['image'], frame['seq']) == (3, 3)
+    assert slots.take('sid') is None
+    assert slots.stats()['dropped'] == 1
+
+    # Released: the next frame starts a new drain
+    assert slots.offer('sid', {'image': 4}) is True
+
+
+def test_stale_frames_are_ignored():
+    slots = FrameSlots()
+    slots.offer('sid', {'seq': 5})
+    slots.take('sid')
+    slots.take('sid')
+    assert slots.offer('sid', {'seq': 4}) is False
+    assert slots.stats()['stale'] == 1
+    assert slots.offer('sid', {'seq': 6}) is True
+
+
+def test_release_after_failed_drain():
+    slots = FrameSlots()
+    slots.offer('sid', {'image': 1})
+    slots.take('sid')
+    slots.offer('sid', {'image': 2})
+
+    # The drain died before taking frame 2: without release the slot stays running forever
+    assert slots.offer('sid', {'image': 3}) is False
+    slots.release('sid')
+    assert slots.stats()['queued'] == 0
+    assert slots.offer('sid', {'image': 4}) is True
+    assert slots.take('sid')['image'] == 4
+
+
+def test_discard_forgets_connection():
+    slots = FrameSlots()
+    slots.offer('sid', {'image': 1})
+    slots.discard('sid')
+    assert slots.take('sid') is None
+    slots.release('sid')
+    assert slots.stats()['connections'] == 0
+
+
+def test_invalid_client_seq_is_replaced():
+    slots = FrameSlots()
+    for seq in ('7', 2.5, None, True, -3, 0, [1]):
+        assert slots.offer('sid', {'seq': seq}) is True
+        frame = slots.take('sid')
+        assert type(frame['seq']) is int and frame['seq'] >= 1
+        assert slots.take('sid') is None
+
+    # Server-assigned numbers keep increasing, and a valid client seq still counts
+    assert slots.offer('sid', {'seq': 100}) is True
+    assert slots.take('sid')['seq'] == 100
+    slots.take('sid')
+    slots.offer('sid', {'seq': 'x'})
+    assert slots.take('sid')['seq'] == 101
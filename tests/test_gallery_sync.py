@@ -0,0 +1,77 @@
+import psycopg2
+import pytest
+from app import db
+from app.db import WORKER_ID
+from app.services import recognition
+from app.services.recognition import GalleryCache, SectionGallery, apply_gallery_change, resync_galleries
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = GalleryCache()
+    monkeypatch.setattr(recognition, 'gallery_cache', cache)
+    for section in 'AB':
+        cache.put(section, SectionGallery([], []), 0)
+    return cache
+
+
+def test_own_changes_are_ignored(cache):
+    apply_gallery_change({'origin': WORKER_ID, 'section': 'A', 'role': 'student', 'id': 'S1', 'action': 'update'})
+    assert 'A' in cache and 'B' in cache
+
+
+def test_only_the_named_section_is_invalidated(cache):
+    apply_gallery_change({'origin': 'other-worker', 'section': 'A', 'role': 'student', 'id': 'S1',
+                          'action': 'update'})
+    assert 'A' not in cache and 'B' in cache
+
+    # Faculty are in no section gallery
+    apply_gallery_change({'origin': 'other-worker', 'section': None, 'role': 'faculty', 'id': 'F1',
+                          'action': 'delete'})
+    assert 'B' in cache
+
+
+def test_resync_drops_every_gallery(cache):
+    resync_galleries()
+    assert 'A' not in cache and 'B' not in cache
+
+
+class StopListening(BaseException):
+    """Escapes listen()'s reconnect loop, which only catches Exception."""
+
+
+class FakeListenConnection:
+    def __init__(self, fail_with):
+        self.fail_with = fail_with
+        self.notifies = []
+        self.executed = []
+
+    def set_session(self, autocommit):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+    def close(self):
+        pass
+
+    def poll(self):
+        raise self.fail_with
+
+
+def test_listen_resyncs_after_every_reconnect(monkeypatch):
+    # The first connection drops; notifications sent until the second LISTEN are lost
+    connections = [FakeListenConnection(psycopg2.OperationalError('server closed the connection')),
+                   FakeListenConnection(StopListening())]
+    monkeypatch.setattr(db, 'get_db_connection', lambda: connections[len(connected)])
+    monkeypatch.setattr(db.select, 'select', lambda readable, *_: (readable, [], []))
+    monkeypatch.setattr(db.time, 'sleep', lambda seconds: None)
+    connected = []
+
+    with pytest.raises(StopListening):
+        db.listen('gallery_changes', lambda payload: None, on_connect=lambda: connected.append(True))
+    assert len(connected) == 2
+    assert all(conn.executed == ['LISTEN gallery_changes'] for conn in connections)
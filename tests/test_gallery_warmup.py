@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from app.services import recognition
+from app.services.embedding_format import EMBEDDING_DIM
+from app.services.recognition import GalleryCache, GalleryWarmup, SectionGallery
+
+
+def gallery(size=4):
+    return SectionGallery(np.zeros((size, EMBEDDING_DIM), dtype=np.float32), [f"S{i}" for i in range(size)])
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    cache = GalleryCache()
+    monkeypatch.setattr(recognition, 'gallery_cache', cache)
+    loads = []
+
+    def load_known_students(section_name):
+        loads.append(section_name)
+        if section_name == 'BAD':
+            raise RuntimeError('corrupt embedding')
+        loaded = gallery()
+        cache.put(section_name, loaded, cache.version(section_name))
+        return loaded
+
+    monkeypatch.setattr(recognition, 'load_known_students', load_known_students)
+    return loads
+
+
+def warmup_for(monkeypatch, sections):
+    warmup = GalleryWarmup()
+    monkeypatch.setattr(warmup, '_has_schedule', lambda: False)
+    monkeypatch.setattr(warmup, '_assigned_sections', lambda: sections)
+    return warmup
+
+
+def test_each_section_is_loaded_once(monkeypatch, loads):
+    warmup = warmup_for(monkeypatch, ['A', 'B', 'A', 'C'])
+    warmup._run()
+
+    assert loads == ['A', 'B', 'C']
+    status = warmup.status()
+    assert status['ready'] and not status['scheduled']
+    assert (status['sections_loaded'], status['errors']) == (3, 0)
+
+
+def test_cached_sections_are_skipped(monkeypatch, loads):
+    recognition.gallery_cache.put('B', gallery(), 0)
+    warmup = warmup_for(monkeypatch, ['A', 'B'])
+    warmup._run()
+
+    assert loads == ['A']
+    assert warmup.status()['sections_loaded'] == 1
+
+
+def test_one_failing_section_does_not_stop_the_rest(monkeypatch, loads):
+    warmup = warmup_for(monkeypatch, ['A', 'BAD', 'C'])
+    warmup._run()
+
+    assert loads == ['A', 'BAD', 'C']
+    assert 'A' in recognition.gallery_cache and 'C' in recognition.gallery_cache
+    status = warmup.status()
+    assert status['ready']
+    assert (status['sections_loaded'], status['errors']) == (2, 1)
+
+
+def test_warmup_stops_before_filling_the_cache(monkeypatch, loads):
+    # Two galleries take more than 90% of the budget
+    recognition.gallery_cache.max_bytes = 2.1 * gallery().nbytes
+    warmup = warmup_for(monkeypatch, ['A', 'B', 'C', 'D'])
+    warmup._run()
+    assert loads == ['A', 'B']
+    assert 'A' in recognition.gallery_cache and 'B' in recognition.gallery_cache
+
+
+def test_unreachable_database_still_marks_warmup_ready(monkeypatch, loads):
+    warmup = GalleryWarmup()
+
+    def no_database():
+        raise RuntimeError('could not connect to server')
+
+    monkeypatch.setattr(warmup, '_has_schedule', no_database)
+    warmup._run()
+    status = warmup.status()
+    assert status['ready'] and status['errors'] == 1
+    assert loads == []
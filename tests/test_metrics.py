@@ -0,0 +1,37 @@
+import pytest
+from app.services.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = Histogram('latency', (0.1, 0.2, 0.4))
+    for value in (0.05, 0.15, 0.15, 0.3, 1.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert (snapshot['count'], snapshot['sum']) == (5, 1.65)
+    assert snapshot['buckets'] == {'0.1': 1, '0.2': 2, '0.4': 1, '+Inf': 1}
+    # Rank 2.5 lands halfway past the first value of the (0.1, 0.2] bucket
+    assert snapshot['p50'] == pytest.approx(0.175)
+    assert Histogram('empty', (1,)).snapshot()['p50'] is None
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.histogram('stage_seconds', (0.1, 1.0), 'Stage time', stage='detect').observe(0.5)
+    registry.register_collector('pool', lambda: {'pending': 2, 'busy': True, 'avg_ms': {'detect': 1.5},
+                                                 'mode': 'spawn', 'batch_size': {'buckets': {}}})
+
+    def broken():
+        raise RuntimeError('boom')
+
+    registry.register_collector('broken', broken)
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ['# HELP stage_seconds Stage time', '# TYPE stage_seconds histogram']
+    assert 'stage_seconds_bucket{stage="detect",le="0.1"} 0' in lines
+    assert 'stage_seconds_bucket{stage="detect",le="+Inf"} 1' in lines
+    assert 'stage_seconds_count{stage="detect"} 1' in lines
+    assert {'pool_pending 2', 'pool_busy 1', 'pool_avg_ms_detect 1.5'} <= set(lines)
+    # Strings and histogram snapshots are not gauges; a failing collector does not break the page
+    assert not any(line.startswith(('pool_mode', 'pool_batch_size')) for line in lines)
+    assert '# collector broken failed: boom' in lines
@@ -0,0 +1,46 @@
+import os
+from scripts.migrate_pg import MIGRATIONS_DIR, created_indexes, load_migrations, split_statements
+
+
+def test_split_statements():
+    assert split_statements("""
+        -- migrate:no-transaction
+        CREATE INDEX a_idx ON t (a);
+        -- a comment; with a semicolon
+        UPDATE t SET note = 'x;y'
+            WHERE id = 1;
+    """) == ["CREATE INDEX a_idx ON t (a)", "UPDATE t SET note = 'x;y'\n            WHERE id = 1"]
+
+
+def test_migrations_are_numbered_in_order():
+    versions = [migration['version'] for migration in load_migrations()]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_no_transaction_migrations_are_safe_to_rerun():
+    # They run statement by statement: a failure part-way is retried from the top
+    for migration in load_migrations():
+        if migration['transactional']:
+            continue
+        for statement in split_statements(migration['sql']):
+            if statement.upper().startswith('CREATE'):
+                assert 'IF NOT EXISTS' in statement.upper(), statement
+
+
+def test_created_indexes():
+    statements = split_statements("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS attendance_subject_roll_idx
+            ON attendance (subject_id, roll_number);
+        create unique index students_email_key ON students (email);
+        -- CREATE INDEX commented_out_idx ON attendance (date);
+        CREATE TABLE IF NOT EXISTS notes (id INT);
+        DROP INDEX CONCURRENTLY IF EXISTS old_idx;
+    """)
+    assert created_indexes(statements) == ['attendance_subject_roll_idx', 'students_email_key']
+
+
+def test_created_indexes_of_dashboard_migration():
+    with open(os.path.join(MIGRATIONS_DIR, '0002_dashboard_indexes.sql')) as f:
+        names = created_indexes(split_statements(f.read()))
+    assert 'attendance_subject_roll_idx' in names
+    assert all(name.endswith('_idx') for name in names)
@@ -0,0 +1,418 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+import pytest
+import numpy as np
+from app.services.embedding_format import EMBEDDING_DIM
+from app.services import recognition
+from app.services.recognition import SectionGallery, GalleryCache, SingleFlight, RecognitionExecutor, RecognitionBusy, \
+    EncodingBatcher, MATCH_TOLERANCE
+
+
+def random_encodings(count, seed=0):
+    # Same scale as dlib encodings: values around +-0.1, pairwise distances ~0.4-1.0
+    return np.random.default_rng(seed).normal(0, 0.06, (count, EMBEDDING_DIM)).astype(np.float32)
+
+
+def per_row_match(known, ids, face, tolerance=MATCH_TOLERANCE):
+    """The matching SectionGallery replaced: face_recognition.face_distance row by row."""
+    distances = np.linalg.norm(known.astype(np.float64) - face.astype(np.float64), axis=1)
+    order = np.argsort(distances)
+    best = order[0]
+    student_id = ids[best] if distances[best] <= tolerance else "Unknown"
+    margin = distances[order[1]] - distances[best] if len(ids) > 1 else None
+    return student_id, distances[best], margin
+
+
+def test_section_gallery_matches_per_row_distance():
+    known = random_encodings(40)
+    ids = [f"21CS{index:03d}" for index in range(40)]
+    gallery = SectionGallery(known, ids)
+
+    # Noisy copies of enrolled faces plus strangers
+    rng = np.random.default_rng(1)
+    faces = np.vstack([known[[3, 17, 39]] + rng.normal(0, 0.01, (3, EMBEDDING_DIM)), random_encodings(2, seed=2)])
+
+    results = gallery.match(faces)
+    assert len(results) == len(faces)
+    for face, (student_id, distance, margin) in zip(faces, results):
+        expected_id, expected_distance, expected_margin = per_row_match(known, ids, face)
+        assert student_id == expected_id
+        assert distance == pytest.approx(expected_distance, abs=1e-4)
+        assert margin == pytest.approx(expected_margin, abs=1e-4)
+    assert [result[0] for result in results[:3]] == ['21CS003', '21CS017', '21CS039']
+
+
+def test_section_gallery_tolerance_marks_unknown():
+    known = random_encodings(5)
+    gallery = SectionGallery(known, list('abcde'))
+    face = known[2] + 0.03
+    distance = per_row_match(known, list('abcde'), face)[1]
+
+    assert gallery.match([face], tolerance=distance + 0.01)[0][0] == 'c'
+    assert gallery.match([face], tolerance=distance - 0.01)[0][0] == "Unknown"
+
+
+def test_section_gallery_single_student_has_no_margin():
+    known = random_encodings(1)
+    gallery = SectionGallery(known, ['only'])
+    assert gallery.match(known) == [('only', pytest.approx(0.0, abs=1e-3), None)]
+
+
+def test_section_gallery_empty_inputs():
+    assert SectionGallery(np.empty((0, EMBEDDING_DIM)), []).match(random_encodings(2)) == [
+        ("Unknown", None, None), ("Unknown", None, None)]
+    assert SectionGallery(random_encodings(3), ['a', 'b', 'c']).match([]) == []
+
+
+def make_gallery(count):
+    return SectionGallery(random_encodings(count), [str(index) for index in range(count)])
+
+
+def test_gallery_cache_evicts_least_recently_used():
+    gallery_bytes = make_gallery(10).nbytes
+    cache = GalleryCache(max_bytes=int(2.5 * gallery_bytes))
+    for section in 'ABC':
+        assert cache.put(section, make_gallery(10), cache.version(section))
+    # A was loaded first and never read since
+    assert 'A' not in cache and 'B' in cache and 'C' in cache
+
+    cache.get('B')
+    cache.put('D', make_gallery(10), cache.version('D'))
+    assert 'C' not in cache and 'B' in cache and 'D' in cache
+    stats = cache.stats()
+    assert stats['evictions'] == 2 and stats['bytes'] == 2 * gallery_bytes
+
+
+def test_gallery_cache_keeps_an_oversized_gallery():
+    cache = GalleryCache(max_bytes=1)
+    cache.put('A', make_gallery(5), 0)
+    cache.put('B', make_gallery(5), 0)
+    assert 'A' not in cache and cache.get('B') is not None
+
+
+def test_gallery_cache_rejects_loads_that_raced_an_invalidation():
+    cache = GalleryCache()
+    version = cache.version('A')          # a load starts...
+    cache.invalidate('A')                 # ...an admin edits the section meanwhile
+    assert cache.put('A', make_gallery(3), version) is False
+    assert cache.get('A') is None and cache.stats()['stale_loads'] == 1
+
+    assert cache.put('A', make_gallery(3), cache.version('A')) is True
+    assert cache.get('A') is not None
+
+
+def test_gallery_cache_clear_bumps_every_version():
+    cache = GalleryCache()
+    cache.put('A', make_gallery(3), 0)
+    version_b = cache.version('B')
+    cache.invalidate('B')
+    versions = {section: cache.version(section) for section in 'AB'}
+    cache.clear()
+    assert 'A' not in cache and cache.stats()['bytes'] == 0
+    assert all(cache.version(section) == versions[section] + 1 for section in 'AB')
+    assert cache.put('B', make_gallery(3), version_b + 1) is False
+
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Starts `callers` threads on flight.do(key, fn); returns their results or exceptions."""
+    results = [None] * callers
+
+    def call(index):
+        try:
+            results[index] = flight.do(key, fn)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_single_flight_coalesces_concurrent_loads():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    threads, results = run_concurrently(flight, 'A', load, 5)
+    while flight.stats()['coalesced_waits'] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {'loads': 1, 'coalesced_waits': 4, 'failed_loads': 0, 'in_flight': 0}
+
+    # Finished calls are not cached: the next caller loads again
+    flight.do('A', load)
+    assert len(calls) == 2
+
+
+def test_single_flight_shares_the_error_and_recovers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("db down")
+
+    threads, results = run_concurrently(flight, 'A', fail, 3)
+    while flight.stats()['coalesced_waits'] < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats()['failed_loads'] == 1 and flight.stats()['in_flight'] == 0
+    assert flight.do('A', lambda: 'ok') == 'ok'
+
+
+def test_single_flight_keys_are_independent():
+    flight = SingleFlight()
+    assert [flight.do(key, lambda key=key: key * 2) for key in 'AB'] == ['AA', 'BB']
+    assert flight.stats()['loads'] == 2
+
+
+def run_under_eventlet(tmp_path, script):
+    """
+    Runs script in a fresh interpreter monkey-patched the way the gunicorn eventlet
+    worker is, and returns its stdout. The script needs a __main__ guard: the spawn
+    pool re-imports it in every child process.
+    """
+    path = tmp_path / 'eventlet_script.py'
+    path.write_text("import eventlet\neventlet.monkey_patch()\n" + textwrap.dedent(script))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')]))}
+    result = subprocess.run([sys.executable, '-W', 'ignore', str(path)], capture_output=True, text=True,
+                            timeout=60, env=env)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_executor_wait_does_not_stall_under_eventlet(tmp_path):
+    # Waiting on a pool future used to go through tpool, where the green manager thread
+    # could not wake the waiter: every call then took the full timeout
+    output = run_under_eventlet(tmp_path, """
+        import os
+        import time
+        import eventlet
+
+        if __name__ == '__main__':
+            from app.services.recognition import RecognitionExecutor
+            executor = RecognitionExecutor(max_workers=2, timeout=10)
+            executor._call(time.sleep, 0)  # start the pool processes
+
+            started_at = time.time()
+            pool = eventlet.GreenPool()
+            results = list(pool.imap(lambda _: executor._call(os.getpid), range(4)))
+            print(len(results), time.time() - started_at)
+            # Wait for the pool processes: they hold the inherited stdout pipe open
+            executor._pool.shutdown(wait=True)
+    """)
+    count, elapsed = output.split()
+    assert int(count) == 4
+    assert float(elapsed) < 5
+
+
+def test_encoding_batcher_under_eventlet(tmp_path):
+    # _run_batch runs on a monkey-patched thread and waits on the pool like any caller;
+    # crops from concurrent sessions must come back to the right caller, without stalling
+    output = run_under_eventlet(tmp_path, """
+        import time
+        import eventlet
+        import numpy as np
+
+        def fake_encode_batch(crops, locations, jitters):
+            # Stands in for _encode_batch in the pool process: one row per crop, tagged by the crop
+            return np.array([np.full(128, crop[0, 0, 0], dtype=np.float32) for crop in crops]), 0.0
+
+        if __name__ == '__main__':
+            from app.services.recognition import RecognitionExecutor, EncodingBatcher
+            executor = RecognitionExecutor(max_workers=2, timeout=10)
+            executor._call(time.sleep, 0)
+            batcher = EncodingBatcher(lambda fn, *args: executor._call(fake_encode_batch, *args),
+                                      max_batch=8, max_wait=0.02)
+
+            def session(tag):
+                crops = [np.full((4, 4, 3), tag * 10 + index, dtype=np.uint8) for index in range(3)]
+                (encodings, _), _ = batcher.encode(crops, [(0, 4, 4, 0)] * 3, 1, 10)
+                return encodings[:, 0].astype(int).tolist() == [tag * 10 + index for index in range(3)]
+
+            started_at = time.time()
+            results = list(eventlet.GreenPool().imap(session, range(6)))
+            print(all(results), batcher.batch_sizes.snapshot()['count'], time.time() - started_at)
+            executor._pool.shutdown(wait=True)
+    """)
+    scattered_correctly, batches, elapsed = output.split()
+    assert scattered_correctly == 'True'
+    # 18 crops at max_batch=8 (whole requests only): several sessions share each batch
+    assert int(batches) < 6
+    assert float(elapsed) < 5
+
+
+def no_faces(*args):
+    return [], [], np.empty((0, EMBEDDING_DIM), dtype=np.float32), {'detect': 0.0, 'encode': 0.0}
+
+
+def test_executor_rejects_frames_beyond_max_pending(monkeypatch):
+    executor = RecognitionExecutor(max_workers=0, max_pending=1)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def detect_and_encode(*args):
+        # A second frame arrives while the first is still being processed
+        with pytest.raises(RecognitionBusy):
+            executor.process(frame)
+        return no_faces()
+
+    monkeypatch.setattr(recognition, '_detect_and_encode', detect_and_encode)
+    executor.process(frame)
+    stats = executor.stats()
+    assert (stats['submitted'], stats['completed'], stats['rejected'], stats['pending']) == (1, 1, 1, 0)
+
+
+def test_executor_failure_frees_its_slot(monkeypatch):
+    executor = RecognitionExecutor(max_workers=0, max_pending=1)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def crash(*args):
+        raise RuntimeError('dlib crashed')
+
+    monkeypatch.setattr(recognition, '_detect_and_encode', crash)
+    with pytest.raises(RuntimeError):
+        executor.process(frame)
+
+    monkeypatch.setattr(recognition, '_detect_and_encode', no_faces)
+    executor.process(frame)
+    stats = executor.stats()
+    assert (stats['failed'], stats['completed'], stats['pending']) == (1, 1, 0)
+
+
+def tagged_encodings(fn, crops, locations, jitters):
+    # Stands in for _encode_batch in the pool: one row per crop, tagged by the crop's first pixel
+    return np.array([np.full(EMBEDDING_DIM, crop[0, 0, 0], dtype=np.float32) for crop in crops]), 0.0
+
+
+def test_encoding_batcher_groups_concurrent_sessions():
+    calls = []
+
+    def call(fn, crops, locations, jitters):
+        calls.append(len(crops))
+        return tagged_encodings(fn, crops, locations, jitters)
+
+    batcher = EncodingBatcher(call, max_batch=8, max_wait=0.2)
+    results = {}
+
+    def session(tag):
+        crops = [np.full((4, 4, 3), tag * 10 + index, dtype=np.uint8) for index in range(3)]
+        (encodings, _), _ = batcher.encode(crops, [(0, 4, 4, 0)] * 3, 1, 10)
+        results[tag] = encodings[:, 0].astype(int).tolist()
+
+    sessions = [threading.Thread(target=session, args=(tag,)) for tag in range(6)]
+    for thread in sessions:
+        thread.start()
+    for thread in sessions:
+        thread.join(10)
+
+    # Each session gets its own rows back; whole requests only, at most max_batch faces per call
+    assert results == {tag: [tag * 10 + index for index in range(3)] for tag in range(6)}
+    assert sum(calls) == 18 and max(calls) <= 8 and len(calls) < 6
+
+
+def test_encoding_batcher_fails_every_request_of_a_failed_batch():
+    def call(fn, *args):
+        raise RuntimeError('pool died')
+
+    batcher = EncodingBatcher(call, max_batch=8, max_wait=0.001)
+    with pytest.raises(RuntimeError, match='pool died'):
+        batcher.encode([np.zeros((4, 4, 3), dtype=np.uint8)], [(0, 4, 4, 0)], 1, 5)
+
+
+class FakeDlib:
+    class rectangle:
+        def __init__(self, left, top, right, bottom):
+            self.css = (top, right, bottom, left)
+
+    class full_object_detections(list):
+        pass
+
+
+class FakeFaceApi:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.face_encoder = self
+
+    def pose_predictor_5_point(self, crop, rect):
+        return ('landmarks', crop.shape, rect.css)
+
+    def compute_face_descriptor(self, crops, batch_faces, num_jitters):
+        self.calls.append((len(crops), [list(shapes) for shapes in batch_faces], num_jitters))
+        if self.fail:
+            raise ValueError('shapes do not match')
+        return [[np.full(EMBEDDING_DIM, index, dtype=np.float64)] for index in range(len(crops))]
+
+
+@pytest.fixture
+def fake_batched_dlib(monkeypatch):
+    import face_recognition
+    api = FakeFaceApi()
+    monkeypatch.setitem(sys.modules, 'dlib', FakeDlib)
+    monkeypatch.setattr(face_recognition, 'api', api, raising=False)
+    monkeypatch.setattr(recognition, 'BATCHED_DESCRIPTORS', True)
+    return api
+
+
+def test_encode_group_uses_one_batched_descriptor_call(fake_batched_dlib):
+    crops = [np.zeros((20, 20, 3), dtype=np.uint8), np.zeros((30, 30, 3), dtype=np.uint8)]
+    encodings = recognition._encode_group(crops, [(5, 15, 15, 5), (6, 24, 24, 6)], 2)
+    assert encodings.shape == (2, EMBEDDING_DIM)
+    assert encodings[:, 0].tolist() == [0, 1]
+
+    [(count, landmarks, num_jitters)] = fake_batched_dlib.calls
+    assert (count, num_jitters) == (2, 2)
+    assert landmarks == [[('landmarks', (20, 20, 3), (5, 15, 15, 5))], [('landmarks', (30, 30, 3), (6, 24, 24, 6))]]
+
+
+def test_encode_group_does_not_hide_batch_errors(fake_batched_dlib, monkeypatch):
+    import face_recognition
+    fake_batched_dlib.fail = True
+    monkeypatch.setattr(face_recognition, 'face_encodings',
+                        lambda *args, **kwargs: pytest.fail('fell back to per-face encoding'))
+    with pytest.raises(ValueError):
+        recognition._encode_group([np.zeros((20, 20, 3), dtype=np.uint8)], [(5, 15, 15, 5)], 1)
+
+
+def test_encode_group_falls_back_without_the_batched_overload(monkeypatch):
+    import face_recognition
+    monkeypatch.setattr(recognition, 'BATCHED_DESCRIPTORS', False)
+    monkeypatch.setattr(face_recognition, 'face_encodings',
+                        lambda crop, locations, num_jitters: [np.full(EMBEDDING_DIM, crop.shape[0])])
+    encodings = recognition._encode_group([np.zeros((20, 20, 3)), np.zeros((30, 30, 3))],
+                                          [(5, 15, 15, 5), (6, 24, 24, 6)], 1)
+    assert encodings[:, 0].tolist() == [20, 30]
+
+
+def test_batched_descriptor_support_is_read_from_dlib(monkeypatch):
+    class Model:
+        def compute_face_descriptor(self):
+            """compute_face_descriptor(self, batch_img: list, batch_faces: list, num_jitters: int = 0)"""
+
+    monkeypatch.setitem(sys.modules, 'dlib', type('dlib', (), {'face_recognition_model_v1': Model}))
+    assert recognition._batched_descriptors_supported() is True
+    Model.compute_face_descriptor.__doc__ = "compute_face_descriptor(self, img, face, num_jitters: int = 0)"
+    assert recognition._batched_descriptors_supported() is False
+    monkeypatch.setitem(sys.modules, 'dlib', None)
+    assert recognition._batched_descriptors_supported() is False
@@ -0,0 +1,83 @@
+import pytest
+from app.services.tracker import FaceTracker, TrackerRegistry, iou_matrix, encode_mask
+
+BOX = (100, 200, 200, 100)          # top, right, bottom, left
+NUDGED = (102, 203, 202, 103)       # same face, moved a few pixels
+ELSEWHERE = (300, 500, 400, 400)
+
+
+def test_iou_matrix():
+    overlap = iou_matrix([BOX, ELSEWHERE], [BOX, (150, 250, 250, 150)])
+    assert overlap[0, 0] == pytest.approx(1.0)
+    assert overlap[0, 1] == pytest.approx(2500 / 17500)
+    assert overlap[1].tolist() == [0.0, 0.0]
+    assert iou_matrix([], [BOX]).shape == (0, 1)
+
+
+def test_encode_mask_skips_only_tracked_boxes():
+    assert encode_mask([BOX, ELSEWHERE], None, 0.5) == [True, True]
+    assert encode_mask([NUDGED, ELSEWHERE], [BOX], 0.5) == [False, True]
+
+
+def test_identity_locks_after_confirming_hits():
+    tracker = FaceTracker(confirm_hits=2)
+    assert tracker.update([BOX], {0: ('21CS001', 0.3, 0.2)}) == [('21CS001', 0.3, 0.2, False)]
+    assert tracker.skip_boxes() == []
+
+    tracker.update([NUDGED], {0: ('21CS001', 0.32, 0.2)})
+    assert tracker.skip_boxes() == [NUDGED]
+
+    # The worker skipped the locked face: its identity is reused without an encoding
+    assert tracker.update([BOX], {}) == [('21CS001', 0.32, 0.2, True)]
+
+
+def test_ambiguous_or_conflicting_matches_do_not_lock():
+    tracker = FaceTracker(confirm_hits=2, min_margin=0.05)
+    tracker.update([BOX], {0: ('21CS001', 0.3, 0.01)})
+    tracker.update([BOX], {0: ('21CS001', 0.3, 0.01)})
+    assert tracker.skip_boxes() == []
+
+    tracker = FaceTracker(confirm_hits=2)
+    tracker.update([BOX], {0: ('21CS001', 0.3, 0.2)})
+    tracker.update([BOX], {0: ('21CS002', 0.3, 0.2)})
+    assert tracker.skip_boxes() == []
+
+
+def test_locked_track_is_reencoded_periodically_and_after_moving():
+    tracker = FaceTracker(confirm_hits=1, reencode_every=2)
+    tracker.update([BOX], {0: ('21CS001', 0.3, 0.2)})
+    tracker.update([BOX], {})
+    tracker.update([BOX], {})
+    assert tracker.skip_boxes() == []
+
+    tracker = FaceTracker(confirm_hits=1)
+    tracker.update([BOX], {0: ('21CS001', 0.3, 0.2)})
+    # Skipped by the worker but the face jumped away from the track: not reused
+    assert tracker.update([ELSEWHERE], {}) == [("Unknown", None, None, False)]
+
+
+def test_missing_track_is_kept_briefly_but_not_locked():
+    tracker = FaceTracker(confirm_hits=1, max_missed=1)
+    tracker.update([BOX], {0: ('21CS001', 0.3, 0.2)})
+    tracker.update([], {})
+    assert len(tracker.tracks) == 1 and tracker.skip_boxes() == []
+    tracker.update([], {})
+    assert tracker.tracks == []
+
+
+def test_registry_resets_tracker_when_section_changes():
+    trackers = TrackerRegistry()
+    tracker = trackers.get('sid', 'A')
+    tracker.update([BOX], {0: ('21CS001', 0.3, 0.2)})
+    assert trackers.get('sid', 'A').tracks
+    assert trackers.get('sid', 'B') is tracker and tracker.tracks == []
+    trackers.discard('sid')
+    assert trackers.get('sid', 'B') is not tracker
+
+
+def test_skip_boxes_can_be_limited_to_given_students():
+    tracker = FaceTracker(confirm_hits=1)
+    tracker.update([BOX, ELSEWHERE], {0: ('21CS001', 0.3, 0.2), 1: ('21CS002', 0.3, 0.2)})
+    assert tracker.skip_boxes() == [BOX, ELSEWHERE]
+    assert tracker.skip_boxes(only={'21CS002'}) == [ELSEWHERE]
+    assert tracker.skip_boxes(only=set()) == []